@@ -0,0 +1,132 @@
+import json
+import math
+import platform
+import subprocess
+import time
+from typing import List, Dict, Any, Optional
+
+
+def percentile(sorted_samples: List[float], pct: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list of samples.
+
+    Args:
+        sorted_samples: Samples sorted in ascending order
+        pct: Percentile to extract, between 0 and 100
+
+    Returns:
+        The sample at the requested percentile (0.0 when there are no samples)
+    """
+    if not sorted_samples:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_samples)), 1)
+    return sorted_samples[min(rank, len(sorted_samples)) - 1]
+
+
+class LatencyRecorder:
+    """
+    Collects per-operation latencies (in nanoseconds) for a single scenario and
+    summarizes them as p50/p99 latencies and throughput.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.samples: List[int] = []
+        self.errors = 0
+        self._started_at: Optional[int] = None
+        self._stopped_at: Optional[int] = None
+
+    def start(self) -> None:
+        self._started_at = time.perf_counter_ns()
+
+    def stop(self) -> None:
+        self._stopped_at = time.perf_counter_ns()
+
+    def record(self, elapsed_ns: int) -> None:
+        self.samples.append(elapsed_ns)
+
+    def record_error(self) -> None:
+        self.errors += 1
+
+    @property
+    def wall_time_s(self) -> float:
+        if self._started_at is None:
+            return 0.0
+        stopped_at = self._stopped_at if self._stopped_at is not None else time.perf_counter_ns()
+        return (stopped_at - self._started_at) / 1e9
+
+    def summary(self) -> Dict[str, Any]:
+        ordered = sorted(self.samples)
+        count = len(ordered)
+        wall_time_s = self.wall_time_s or sum(ordered) / 1e9
+        return {
+            'count': count,
+            'errors': self.errors,
+            'wall_time_s': round(wall_time_s, 6),
+            'ops_per_sec': round(count / wall_time_s, 2) if wall_time_s else 0.0,
+            'p50_ms': round(percentile(ordered, 50) / 1e6, 4),
+            'p99_ms': round(percentile(ordered, 99) / 1e6, 4),
+            'mean_ms': round(sum(ordered) / count / 1e6, 4) if count else 0.0,
+            'max_ms': round(ordered[-1] / 1e6, 4) if count else 0.0,
+        }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_report(recorders: List[LatencyRecorder], **meta) -> Dict[str, Any]:
+    """
+    Builds the JSON-serializable benchmark report.
+
+    Args:
+        recorders: The scenario recorders to summarize
+        **meta: Extra metadata describing the run (fleet size, seed...)
+
+    Returns:
+        A dict with a 'meta' section and one summary per scenario
+    """
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.time(),
+            **meta,
+        },
+        'scenarios': {recorder.name: recorder.summary() for recorder in recorders},
+    }
+
+
+def write_report(report: Dict[str, Any], path: Optional[str] = None) -> None:
+    payload = json.dumps(report, indent=2, sort_keys=True)
+    if path:
+        with open(path, 'w') as file:
+            file.write(payload + '\n')
+    else:
+        print(payload)
+
+
+def compare_reports(baseline: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """
+    Computes the relative change (in %) of p50, p99 and ops/sec for every scenario
+    present in both reports. Positive latency deltas and negative throughput deltas
+    are regressions.
+    """
+    deltas = {}
+    for name, summary in current['scenarios'].items():
+        previous = baseline['scenarios'].get(name)
+        if not previous:
+            continue
+        deltas[name] = {
+            metric: round((summary[metric] - previous[metric]) / previous[metric] * 100, 2)
+            for metric in ('p50_ms', 'p99_ms', 'ops_per_sec')
+            if previous[metric]
+        }
+    return deltas
@@ -0,0 +1,92 @@
+"""
+Memory footprint of the VEN registry, in bytes per VEN.
+
+The fleet is generated first (those dicts are the InMemoryDB documents), then every
+representation built on top of it is measured with tracemalloc while the previous ones
+stay alive, so each figure is the extra memory that representation costs:
+
+    ven_props_dicts       the VenProps documents themselves (the DB copy)
+    venlist_columnar      VenList.from_props: the columns
+    venlist_indexes       the id and name lookup indexes, built on the first search
+    venlist_materialized  every `Ven` instance materialized by `VenList.ven_instances()`
+    ven_props_list        the cached dict view served by the API
+    dict_ven_baseline     plain objects with an instance __dict__, for comparison
+
+Usage:
+    python -m benchmarks.memory
+    python -m benchmarks.memory --fleet 100k --output memory.json
+"""
+import argparse
+import gc
+import sys
+import tracemalloc
+from typing import Callable, Dict, Any, List, Tuple
+
+from benchmarks.harness import git_commit, write_report
+from benchmarks.vtn_load import fleet_size, FLEET_SIZES
+
+
+class _DictVen:
+    """Same attributes as `Ven` but stored in an instance __dict__, the previous layout."""
+
+    def __init__(self, ven_props):
+        self._client_thread = None
+        self._stop_client = None
+        self._is_connected = False
+        self.name = ven_props['name']
+        self.id = ven_props['id']
+        self.registration_id = ven_props['registration_id']
+        self.fingerprint = ven_props['fingerprint']
+
+
+def traced_bytes(build: Callable[[], Any]) -> Tuple[Any, int]:
+    """Returns what `build` returned and the memory it still holds once built."""
+    gc.collect()
+    before, _ = tracemalloc.get_traced_memory()
+    result = build()
+    gc.collect()
+    after, _ = tracemalloc.get_traced_memory()
+    return result, after - before
+
+
+def measure(size: int, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    from local_lib.models.domain import VenList, generate_ven_props_batch
+
+    measured: List[Tuple[str, int]] = []
+    tracemalloc.start()
+    try:
+        fleet, used = traced_bytes(lambda: generate_ven_props_batch(size, seed))
+        measured.append(('ven_props_dicts', used))
+        ven_list, used = traced_bytes(lambda: VenList.from_props(fleet, debug=False))
+        measured.append(('venlist_columnar', used))
+        _, used = traced_bytes(lambda: (ven_list.has_ven_with_id(''), ven_list.has_ven_with_name('')))
+        measured.append(('venlist_indexes', used))
+        _, used = traced_bytes(ven_list.ven_instances)
+        measured.append(('venlist_materialized', used))
+        _, used = traced_bytes(lambda: ven_list.ven_props_list)
+        measured.append(('ven_props_list', used))
+        _, used = traced_bytes(lambda: [_DictVen(ven_props) for ven_props in fleet])
+        measured.append(('dict_ven_baseline', used))
+    finally:
+        tracemalloc.stop()
+
+    return {name: {'bytes': used, 'bytes_per_ven': round(used / size, 1)} for name, used in measured}
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description='Memory footprint of the VEN registry.')
+    parser.add_argument('--fleet', type=fleet_size, default=FLEET_SIZES['10k'],
+                        help='Fleet size: 1k, 10k, 100k or an explicit number of VENs (default: 10k)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed used to build the fleet')
+    parser.add_argument('--output', default=None, help='Write the JSON report to this file instead of stdout')
+    args = parser.parse_args(argv)
+
+    write_report({
+        'meta': {'commit': git_commit(), 'python': sys.version.split()[0], 'fleet_size': args.fleet,
+                 'seed': args.seed},
+        'representations': measure(args.fleet, args.seed),
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
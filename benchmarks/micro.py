@@ -0,0 +1,295 @@
+"""
+Microbenchmarks for InMemoryDB and VenList with regression thresholds.
+
+Every benchmark is measured at growing sizes to record a scaling curve. The curve
+is fitted on a log-log scale to estimate the complexity exponent of a single
+operation (0 ~ O(1), 1 ~ O(N), 2 ~ O(N^2)). A benchmark fails when its exponent
+or its per-operation time at the largest size exceeds the configured budget.
+
+Usage:
+    python -m benchmarks.micro
+    python -m benchmarks.micro --sizes 1000,4000,16000 --output micro.json
+    python -m benchmarks.micro --only venlist_append,db_find_eq_indexed --budgets budgets.json
+"""
+import argparse
+import json
+import math
+import sys
+import time
+from typing import TypedDict, Callable, Dict, List, Optional
+
+from local_lib.models.domain import Ven, VenList, VenProps, generate_ven_props_batch
+from local_lib.models.in_memory_db import InMemoryDB, match_condition
+
+DEFAULT_SIZES = (1_000, 2_000, 4_000, 8_000)
+COLLECTION = 'micro_ven_props'
+
+
+class Budget(TypedDict, total=False):
+    max_exponent: float  # Highest accepted complexity exponent of a single operation
+    max_us: float  # Highest accepted time per operation (µs) at the largest size
+
+
+# Exponent budgets leave room for noise: ~0.5 accepts O(1)/O(log N), ~1.3 accepts O(N).
+# Time budgets are deliberately loose, they only catch order-of-magnitude regressions.
+BUDGETS: Dict[str, Budget] = {
+    'db_find_eq': {'max_exponent': 1.3, 'max_us': 20_000},
+    'db_find_eq_indexed': {'max_exponent': 0.5, 'max_us': 100},
+    'db_find_range': {'max_exponent': 1.3, 'max_us': 20_000},
+    'db_find_range_cached': {'max_exponent': 0.5, 'max_us': 100},
+    'db_insert': {'max_exponent': 0.5, 'max_us': 100},
+    'db_insert_indexed': {'max_exponent': 0.5, 'max_us': 100},
+    'db_update_eq': {'max_exponent': 1.3, 'max_us': 20_000},
+    'db_update_eq_indexed': {'max_exponent': 0.5, 'max_us': 100},
+    'db_delete_eq': {'max_exponent': 1.3, 'max_us': 40_000},
+    'db_delete_eq_indexed': {'max_exponent': 1.3, 'max_us': 80_000},
+    'match_condition_eq': {'max_exponent': 0.5, 'max_us': 10},
+    'match_condition_range': {'max_exponent': 0.5, 'max_us': 10},
+    'venlist_find_by_id': {'max_exponent': 0.5, 'max_us': 100},
+    'venlist_find_by_name': {'max_exponent': 0.5, 'max_us': 100},
+    'venlist_find_by_registration_id': {'max_exponent': 0.5, 'max_us': 100},
+    'venlist_append': {'max_exponent': 0.5, 'max_us': 100},
+    'venlist_ven_props_list': {'max_exponent': 1.3, 'max_us': 100_000},
+    'fleet_generate_1k': {'max_exponent': 0.5, 'max_us': 20_000},  # 1000 VENs, Faker takes ~150ms
+}
+
+
+def synthetic_props(index: int) -> VenProps:
+    """Cheap deterministic VenProps, keeps Faker out of the measured setup."""
+    return {
+        'name': f'ven-{index}',
+        'id': f'ID-{index}',
+        'registration_id': f'REG-{index}',
+        'fingerprint': f'{index:064x}',
+    }
+
+
+def _seeded_db(size: int, indexed: bool) -> InMemoryDB:
+    db = InMemoryDB()
+    db.drop_collection(COLLECTION)
+    db.disable_query_cache(COLLECTION)
+    db.create_collection(COLLECTION)
+    if indexed:
+        db.create_index(COLLECTION, 'id')
+    for i in range(size):
+        db.insert(COLLECTION, synthetic_props(i))
+    return db
+
+
+def _db_find_eq(size: int, indexed: bool = False) -> Callable[[], None]:
+    db = _seeded_db(size, indexed)
+    target = f'ID-{size // 2}'
+    return lambda: db.find(COLLECTION, {'id': target})
+
+
+def _db_find_range(size: int, cached: bool = False) -> Callable[[], None]:
+    db = _seeded_db(size, False)
+    if cached:
+        db.enable_query_cache(COLLECTION)
+    return lambda: db.find(COLLECTION, {'id': {'$gt': 'ID-9'}})
+
+
+def _db_insert(size: int, indexed: bool = False) -> Callable[[], None]:
+    db = _seeded_db(size, indexed)
+    counter = iter(range(size, sys.maxsize))
+    return lambda: db.insert(COLLECTION, synthetic_props(next(counter)))
+
+
+def _db_update_eq(size: int, indexed: bool = False) -> Callable[[], None]:
+    db = _seeded_db(size, indexed)
+    target = f'ID-{size // 2}'
+    return lambda: db.update(COLLECTION, {'id': target}, {'fingerprint': '0' * 64})
+
+
+def _db_delete_eq(size: int, indexed: bool = False) -> Callable[[], None]:
+    db = _seeded_db(size, indexed)
+    document = synthetic_props(size)
+
+    def delete():
+        db.insert(COLLECTION, dict(document))
+        db.delete(COLLECTION, {'id': document['id']})
+
+    return delete
+
+
+def _match_condition(condition) -> Callable[[int], Callable[[], None]]:
+    def setup(size: int) -> Callable[[], None]:
+        doc = synthetic_props(size)
+        return lambda: match_condition(doc, 'id', condition)
+
+    return setup
+
+
+def _ven_list(size: int) -> VenList:
+    return VenList([Ven(synthetic_props(i)) for i in range(size)], debug=False)
+
+
+def _venlist_find(method: str, key: str) -> Callable[[int], Callable[[], None]]:
+    def setup(size: int) -> Callable[[], None]:
+        find = getattr(_ven_list(size), method)
+        target = synthetic_props(size // 2)[key]
+        find(target)  # Builds the lookup index outside of the measure
+        return lambda: find(target)
+
+    return setup
+
+
+def _venlist_append(size: int) -> Callable[[], None]:
+    ven_list = _ven_list(size)
+    ven_list.ven_props_list  # Warm the cache, append must not rebuild it eagerly
+    counter = iter(range(size, sys.maxsize))
+    return lambda: ven_list.append(Ven(synthetic_props(next(counter))))
+
+
+def _venlist_ven_props_list(size: int) -> Callable[[], None]:
+    ven_list = _ven_list(size)
+
+    def rebuild():
+        ven_list.__dict__.pop('ven_props_list', None)
+        return ven_list.ven_props_list
+
+    return rebuild
+
+
+def _fleet_generate(size: int) -> Callable[[], None]:
+    # Generates 1000 VENs from index `size`, the cost per batch must not depend on the index
+    return lambda: generate_ven_props_batch(1_000, seed=0, start=size)
+
+
+BENCHMARKS: Dict[str, Callable[[int], Callable[[], None]]] = {
+    'db_find_eq': _db_find_eq,
+    'db_find_eq_indexed': lambda size: _db_find_eq(size, indexed=True),
+    'db_find_range': _db_find_range,
+    'db_find_range_cached': lambda size: _db_find_range(size, cached=True),
+    'db_insert': _db_insert,
+    'db_insert_indexed': lambda size: _db_insert(size, indexed=True),
+    'db_update_eq': _db_update_eq,
+    'db_update_eq_indexed': lambda size: _db_update_eq(size, indexed=True),
+    'db_delete_eq': _db_delete_eq,
+    'db_delete_eq_indexed': lambda size: _db_delete_eq(size, indexed=True),
+    'match_condition_eq': _match_condition('ID-0'),
+    'match_condition_range': _match_condition({'$gt': 'ID-0'}),
+    'venlist_find_by_id': _venlist_find('find_by_id', 'id'),
+    'venlist_find_by_name': _venlist_find('find_by_mame', 'name'),
+    'venlist_find_by_registration_id': _venlist_find('find_by_registration_id', 'registration_id'),
+    'venlist_append': _venlist_append,
+    'venlist_ven_props_list': _venlist_ven_props_list,
+    'fleet_generate_1k': _fleet_generate,
+}
+
+
+def time_per_op_us(operation: Callable[[], None], min_time_s: float = 0.02, trials: int = 3) -> float:
+    """
+    Times `operation` in batches that last at least `min_time_s` and returns the best
+    per-operation time (µs) over `trials` batches.
+    """
+    iterations = 1
+    while True:
+        started_at = time.perf_counter()
+        for _ in range(iterations):
+            operation()
+        elapsed = time.perf_counter() - started_at
+        if elapsed >= min_time_s:
+            break
+        iterations *= 2
+
+    best = elapsed / iterations
+    for _ in range(trials - 1):
+        started_at = time.perf_counter()
+        for _ in range(iterations):
+            operation()
+        best = min(best, (time.perf_counter() - started_at) / iterations)
+    return best * 1e6
+
+
+def complexity_exponent(sizes: List[int], per_op_us: List[float]) -> float:
+    """Least squares slope of log(time) over log(size)."""
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(value, 1e-9)) for value in per_op_us]
+    x_mean = sum(xs) / len(xs)
+    y_mean = sum(ys) / len(ys)
+    denominator = sum((x - x_mean) ** 2 for x in xs)
+    if not denominator:
+        return 0.0
+    return sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, ys)) / denominator
+
+
+def check_budget(exponent: float, largest_us: float, budget: Budget, check_time: bool = True) -> List[str]:
+    violations = []
+    if 'max_exponent' in budget and exponent > budget['max_exponent']:
+        violations.append(f'complexity exponent {exponent:.2f} > {budget["max_exponent"]}')
+    if check_time and 'max_us' in budget and largest_us > budget['max_us']:
+        violations.append(f'{largest_us:.2f}µs per op > {budget["max_us"]}µs')
+    return violations
+
+
+def run_benchmarks(names: Optional[List[str]] = None,
+                   sizes: List[int] = DEFAULT_SIZES,
+                   budgets: Optional[Dict[str, Budget]] = None,
+                   check_time: bool = True,
+                   min_time_s: float = 0.02) -> Dict[str, dict]:
+    """
+    Runs the selected benchmarks and returns their scaling curves and budget violations.
+
+    Args:
+        names: Benchmarks to run (default: all of them)
+        sizes: Collection / list sizes to measure, in ascending order
+        budgets: Budgets per benchmark, merged over `BUDGETS`
+        check_time: Whether to enforce the per-operation time budgets (machine dependent)
+        min_time_s: Minimum duration of a timed batch
+
+    Returns:
+        A dict with, for every benchmark, its sizes, per_op_us, exponent and violations
+    """
+    budgets = {**BUDGETS, **(budgets or {})}
+    results = {}
+    for name in names or BENCHMARKS:
+        per_op_us = [time_per_op_us(BENCHMARKS[name](size), min_time_s=min_time_s) for size in sizes]
+        exponent = complexity_exponent(list(sizes), per_op_us)
+        results[name] = {
+            'sizes': list(sizes),
+            'per_op_us': [round(value, 4) for value in per_op_us],
+            'exponent': round(exponent, 3),
+            'budget': budgets.get(name, {}),
+            'violations': check_budget(exponent, per_op_us[-1], budgets.get(name, {}), check_time),
+        }
+    InMemoryDB().drop_collection(COLLECTION)
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='InMemoryDB / VenList microbenchmarks with budgets.')
+    parser.add_argument('--sizes', type=lambda value: [int(size) for size in value.split(',')],
+                        default=list(DEFAULT_SIZES), help='Comma separated sizes (default: 1000,2000,4000,8000)')
+    parser.add_argument('--only', type=lambda value: value.split(','), default=None,
+                        help=f'Comma separated benchmarks to run (default: all of {", ".join(BENCHMARKS)})')
+    parser.add_argument('--budgets', default=None, help='JSON file with budgets overriding the defaults')
+    parser.add_argument('--no-time-budget', action='store_true', help='Only enforce complexity budgets')
+    parser.add_argument('--output', default=None, help='Write the JSON results to this file instead of stdout')
+    args = parser.parse_args(argv)
+
+    unknown = set(args.only or []) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f'Unknown benchmarks: {", ".join(sorted(unknown))}')
+
+    budgets = None
+    if args.budgets:
+        with open(args.budgets) as file:
+            budgets = json.load(file)
+
+    results = run_benchmarks(args.only, sorted(args.sizes), budgets, check_time=not args.no_time_budget)
+    payload = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(payload + '\n')
+    else:
+        print(payload)
+
+    failures = {name: result['violations'] for name, result in results.items() if result['violations']}
+    for name, violations in failures.items():
+        print(f'FAIL {name}: {"; ".join(violations)}', file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""
+Recovery time of the VTN after a restart.
+
+Starts a local VTN (with the admission control of the settings) and has the whole fleet
+register at once, as it does after a VTN restart. Every simulated VEN retries like the VEN
+client does, after the retry hint of the VTN plus a jittered exponential backoff, until it is
+registered. Reports the time until the whole fleet is registered, the time to register of
+the VENs (p50/p99), the rejections, the worst scheduling lag of the VTN loops meanwhile and
+the bound the recovery time is expected to stay under:
+
+    (fleet - burst) / rate + queue_timeout + backoff_cap
+
+The exit status is non-zero when the recovery time exceeds `--max-recovery` (default: that
+bound).
+
+Usage:
+    python -m benchmarks.recovery --fleet 1k
+    python -m benchmarks.recovery --fleet 10k --output recovery.json
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import sys
+import time
+from typing import Dict
+
+from benchmarks.harness import LatencyRecorder, build_report, write_report
+from benchmarks.vtn_load import FLEET_SIZES, OADR_PATH, fleet_size, build_fleet, start_local_vtn, registration_messages
+
+REJECTION_OUTCOMES = ('rejected_ven', 'rejected_rate', 'rejected_queue_full', 'rejected_timeout')
+
+
+def recovery_bound(fleet: int, args) -> float:
+    from local_lib.settings import settings
+
+    admission = settings.admission
+    if not admission['enabled']:
+        return float('inf')
+    # Shards admit in parallel, each one its share of the fleet
+    shards = len(settings.vtn['shards'])
+    return (max(0.0, fleet / shards - admission['burst']) / admission['rate'] + admission['queue_timeout']
+            + args.backoff_cap)
+
+
+async def register(session, url: str, message: str, recorder: LatencyRecorder, stats: Dict[str, int],
+                   rng: random.Random, args, started_at: int) -> None:
+    """Registers one VEN, retrying like `Ven._connect` does."""
+    from local_lib.admission import backoff_delay, parse_retry_hint
+
+    for attempt in range(args.max_attempts):
+        stats['attempts'] += 1
+        retry_hint = None
+        try:
+            async with session.post(url, data=message) as response:
+                content = await response.read()
+                if response.status == 200 and b'registrationID' in content:
+                    recorder.record(time.perf_counter_ns() - started_at)
+                    return
+                if response.status == 503:
+                    stats['rejected'] += 1
+                    retry_hint = parse_retry_hint(content.decode('utf-8', 'replace'))
+                else:
+                    stats['failed'] += 1
+        except Exception:
+            stats['failed'] += 1
+        await asyncio.sleep(backoff_delay(attempt, args.backoff_base, args.backoff_cap, retry_hint, rng))
+    recorder.record_error()
+
+
+async def storm(vtn_service, fleet, args) -> Dict:
+    import aiohttp
+
+    recorder = LatencyRecorder('time_to_register')
+    stats = {'attempts': 0, 'rejected': 0, 'failed': 0}
+    rng = random.Random(args.seed)
+    urls = [f"http://127.0.0.1:{vtn_service.shard_for(ven['id']).port}{OADR_PATH}/EiRegisterParty" for ven in fleet]
+    messages = registration_messages(fleet)
+
+    connector = aiohttp.TCPConnector(limit=args.connections)
+    async with aiohttp.ClientSession(connector=connector, headers={'content-type': 'application/xml'}) as session:
+        started_at = time.perf_counter_ns()
+        recorder.start()
+        await asyncio.gather(*(register(session, url, message, recorder, stats, rng, args, started_at)
+                               for url, message in zip(urls, messages)))
+        recorder.stop()
+    return {'recorder': recorder, **stats}
+
+
+def run(args) -> dict:
+    from local_lib.admission import admissions
+    from local_lib.health import HealthMonitor
+    from local_lib.settings import settings
+
+    args.backoff_base = settings.ven['backoff_base'] if args.backoff_base is None else args.backoff_base
+    args.backoff_cap = settings.ven['backoff_cap'] if args.backoff_cap is None else args.backoff_cap
+    fleet = build_fleet(args.fleet, args.seed)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+        vtn_service = start_local_vtn(fleet)
+        result = asyncio.run(storm(vtn_service, fleet, args))
+
+    recorder = result.pop('recorder')
+    loops = HealthMonitor().loops_status()
+    bound = recovery_bound(args.fleet, args)
+    report = build_report([recorder], fleet_size=args.fleet, seed=args.seed, connections=args.connections,
+                          backoff_base=args.backoff_base, backoff_cap=args.backoff_cap)
+    report['recovery'] = {
+        'recovery_s': round(recorder.wall_time_s, 3),
+        'bound_s': round(bound, 3),
+        'registered': len(recorder.samples),
+        **result,
+        'rejections': {outcome: admissions.value('EiRegisterParty', outcome) for outcome in REJECTION_OUTCOMES},
+        'max_vtn_loop_lag_s': max((loop['max_lag_s'] for name, loop in loops.items() if name.startswith('vtn:')),
+                                  default=None),
+    }
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Recovery time of the VTN after a restart.')
+    parser.add_argument('--fleet', type=fleet_size, default=FLEET_SIZES['1k'],
+                        help='Fleet size: 1k, 10k, 100k or an explicit number of VENs (default: 1k)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed used to build the fleet and the backoff jitter')
+    parser.add_argument('--port', type=int, default=None, help='Port of the local VTN (default: settings)')
+    parser.add_argument('--shards', type=int, default=1, help='VTN shards, on consecutive ports from --port')
+    parser.add_argument('--connections', type=int, default=1000, help='Maximum number of open connections')
+    parser.add_argument('--backoff-base', type=float, default=None,
+                        help='Backoff of the first retry, in seconds (default: OPEN_KICK__VEN__BACKOFF_BASE)')
+    parser.add_argument('--backoff-cap', type=float, default=None,
+                        help='Maximum backoff, in seconds (default: OPEN_KICK__VEN__BACKOFF_CAP)')
+    parser.add_argument('--max-attempts', type=int, default=50, help='Attempts before a VEN gives up')
+    parser.add_argument('--max-recovery', type=float, default=None,
+                        help='Fail when the recovery takes longer, in seconds (default: the computed bound)')
+    parser.add_argument('--output', default=None, help='Write the JSON report to this file instead of stdout')
+    parser.add_argument('--verbose', action='store_true', help='Keep the VTN output on stdout')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+
+    # The settings singleton reads the environment on first import, so configure it before
+    # any project module is loaded. The loops are probed often to catch the worst lag.
+    os.environ.setdefault('OPEN_KICK__CORE__DEBUG', 'false')
+    os.environ.setdefault('OPEN_KICK__HEALTH__INTERVAL', '0.05')
+    if args.port is not None:
+        os.environ['OPEN_KICK__VTN__LOCATION__PORT'] = str(args.port)
+    os.environ['OPEN_KICK__VTN__SHARDS'] = str(args.shards)
+
+    report = run(args)
+    write_report(report, args.output)
+
+    recovery = report['recovery']
+    max_recovery = args.max_recovery if args.max_recovery is not None else recovery['bound_s']
+    if recovery['registered'] < args.fleet or recovery['recovery_s'] > max_recovery:
+        print(f"Recovery of {recovery['registered']}/{args.fleet} VENs took {recovery['recovery_s']}s "
+              f"(limit {max_recovery}s)", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
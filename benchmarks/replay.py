@@ -0,0 +1,200 @@
+"""
+Replays a traffic log captured by the VTN against a local VTN, at 1x to 100x speed.
+
+Record the traffic of a VTN by setting OPEN_KICK__CAPTURE__PATH (see local_lib/traffic_log.py).
+The replayer loads the VENs found in the log into a local VTN, then sends every message at its
+captured time divided by `--speed`, to the shard owning its VEN. It reports the latencies per
+service (p50/p99), the answers whose status differs from the capture and the schedule lag of
+the replayer, how late it sent the messages: a replay lagging behind its schedule does not
+reproduce the captured load, lower the speed or spread it over more connections.
+
+Like a VEN client, each VEN only sends its next message once the previous one is answered: at
+high speed a message may wait for the answer to the previous message of its VEN.
+
+The replayed VTN runs without admission control (unless OPEN_KICK__ADMISSION__ENABLED is set):
+its per-VEN rate is sized for real time, at 10x or 100x it would reject the replayed messages
+and the report would measure those rejections rather than the captured load.
+
+Usage:
+    OPEN_KICK__CAPTURE__PATH=vtn.traffic python main.py
+    python -m benchmarks.replay vtn.traffic --speed 10
+    python -m benchmarks.replay vtn.traffic --speed 100 --shards 4 --output replay.json
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import re
+import sys
+import time
+from collections import Counter
+from typing import List, Dict, Optional, Iterable
+
+from benchmarks.harness import LatencyRecorder, percentile, build_report, write_report
+from benchmarks.vtn_load import OADR_PATH, start_local_vtn
+
+MAX_SPEED = 100.0
+VEN_ID_PATTERN = re.compile(rb'<(?:[\w-]+:)?venID>\s*([^<\s]{1,256})\s*</')
+VEN_NAME_PATTERN = re.compile(rb'<(?:[\w-]+:)?oadrVenName>\s*([^<]{1,256}?)\s*</')
+
+
+def load_records(path: str, services: Optional[Iterable[str]] = None) -> list:
+    """The records of the log ordered by reception time, only those of `services` when given."""
+    from local_lib.traffic_log import read_traffic_log
+
+    services = frozenset(services or ())
+    records = [record for record in read_traffic_log(path) if not services or record.service in services]
+    records.sort(key=lambda record: record.received_at_ns)
+    return records
+
+
+def fleet_from_records(records) -> List[dict]:
+    """
+    VenProps of the VENs found in the log, ordered by first appearance. A VEN that only polls
+    in the log (it registered before the capture started) is named after its id.
+    """
+    names: Dict[str, str] = {}
+    for record in records:
+        ven_id = VEN_ID_PATTERN.search(record.body)
+        if ven_id is None:
+            continue
+        ven_name = VEN_NAME_PATTERN.search(record.body)
+        ven_id = ven_id.group(1).decode('utf-8')
+        if ven_name is not None or ven_id not in names:
+            names[ven_id] = ven_name.group(1).decode('utf-8') if ven_name is not None else ven_id
+    return [{'name': name, 'id': ven_id, 'registration_id': f'REG-{ven_id}', 'fingerprint': ''}
+            for ven_id, name in names.items()]
+
+
+def replay_schedule(records, speed: float) -> List[float]:
+    """Seconds from the start of the replay at which each record is sent."""
+    if not records:
+        return []
+    first = records[0].received_at_ns
+    return [(record.received_at_ns - first) / 1e9 / speed for record in records]
+
+
+def record_url(vtn_service, record) -> str:
+    """URL of the shard owning the VEN of the message, the captured shard (or the first one) otherwise."""
+    from local_lib.admission import ven_key
+
+    ven_id = ven_key(record.body)
+    if ven_id is not None:
+        shard = vtn_service.shard_for(ven_id)
+    else:
+        shard = vtn_service.shards.get(record.shard) or next(iter(vtn_service.shards.values()))
+    return f'http://127.0.0.1:{shard.port}{OADR_PATH}/{record.service}'
+
+
+async def replay(vtn_service, records, args) -> dict:
+    import aiohttp
+    from local_lib.admission import ven_key
+
+    recorders: Dict[str, LatencyRecorder] = {}
+    mismatches: Counter = Counter()
+    lags: List[float] = []
+    urls = [record_url(vtn_service, record) for record in records]
+
+    async def send(session, url: str, record, recorder: LatencyRecorder, previous: Optional[asyncio.Task]) -> None:
+        if previous is not None:
+            await previous  # Never raises, errors are recorded
+        started_at = time.perf_counter_ns()
+        try:
+            async with session.post(url, data=record.body) as response:
+                await response.read()
+                status = response.status
+        except Exception:
+            recorder.record_error()
+            return
+        recorder.record(time.perf_counter_ns() - started_at)
+        if status != record.status:
+            mismatches[record.service] += 1
+
+    connector = aiohttp.TCPConnector(limit=args.connections)
+    async with aiohttp.ClientSession(connector=connector, headers={'content-type': 'application/xml'}) as session:
+        tasks = []
+        last_sent: Dict[str, asyncio.Task] = {}  # Last message of every VEN
+        started_at = time.perf_counter()
+        for offset, url, record in zip(replay_schedule(records, args.speed), urls, records):
+            delay = started_at + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            lags.append(max(0.0, -delay))
+            recorder = recorders.get(record.service)
+            if recorder is None:
+                recorder = recorders[record.service] = LatencyRecorder(record.service)
+                recorder.start()
+            key = ven_key(record.body)
+            task = asyncio.create_task(send(session, url, record, recorder, last_sent.get(key)))
+            if key is not None:
+                last_sent[key] = task
+            tasks.append(task)
+        await asyncio.gather(*tasks)
+        replayed_in = time.perf_counter() - started_at
+        for recorder in recorders.values():
+            recorder.stop()
+
+    lags.sort()
+    return {
+        'recorders': list(recorders.values()),
+        'replayed_in_s': round(replayed_in, 3),
+        'schedule_lag_ms': {'p50': round(percentile(lags, 50) * 1e3, 3), 'p99': round(percentile(lags, 99) * 1e3, 3),
+                            'max': round(lags[-1] * 1e3, 3) if lags else 0.0},
+        'status_mismatches': dict(mismatches),
+    }
+
+
+def run(args) -> dict:
+    records = load_records(args.log, args.services)
+    if not records:
+        raise SystemExit(f'No record to replay in {args.log}')
+    fleet = fleet_from_records(records)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+        vtn_service = start_local_vtn(fleet)
+        result = asyncio.run(replay(vtn_service, records, args))
+
+    report = build_report(result.pop('recorders'), log=args.log, speed=args.speed, shards=args.shards,
+                          connections=args.connections, fleet_size=len(fleet))
+    report['replay'] = {
+        'messages': len(records),
+        'captured_s': round((records[-1].received_at_ns - records[0].received_at_ns) / 1e9, 3),
+        **result,
+    }
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Replays a captured OpenADR traffic log against a local VTN.')
+    parser.add_argument('log', help='Traffic log written with OPEN_KICK__CAPTURE__PATH')
+    parser.add_argument('--speed', type=float, default=1.0, help=f'Replay speed, 1 to {MAX_SPEED:g} (default: 1)')
+    parser.add_argument('--services', type=lambda value: value.split(','), default=None,
+                        help='Comma separated services to replay (default: every captured service)')
+    parser.add_argument('--port', type=int, default=None, help='Port of the local VTN (default: settings)')
+    parser.add_argument('--shards', type=int, default=1, help='VTN shards, on consecutive ports from --port')
+    parser.add_argument('--connections', type=int, default=1000, help='Maximum number of open connections')
+    parser.add_argument('--output', default=None, help='Write the JSON report to this file instead of stdout')
+    parser.add_argument('--verbose', action='store_true', help='Keep the VTN output on stdout')
+    args = parser.parse_args(argv)
+
+    if not 1.0 <= args.speed <= MAX_SPEED:
+        parser.error(f'--speed must be between 1 and {MAX_SPEED:g}')
+    return args
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+
+    # The settings singleton reads the environment on first import, so configure it before
+    # any project module is loaded. The replayed VTN must not capture its own traffic.
+    os.environ.setdefault('OPEN_KICK__CORE__DEBUG', 'false')
+    os.environ.setdefault('OPEN_KICK__ADMISSION__ENABLED', 'false')  # See the module docstring
+    os.environ['OPEN_KICK__CAPTURE__PATH'] = ''
+    if args.port is not None:
+        os.environ['OPEN_KICK__VTN__LOCATION__PORT'] = str(args.port)
+    os.environ['OPEN_KICK__VTN__SHARDS'] = str(args.shards)
+
+    write_report(run(args), args.output)
+
+
+if __name__ == '__main__':
+    main()
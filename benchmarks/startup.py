@@ -0,0 +1,175 @@
+"""
+Startup-time benchmark.
+
+Measures, in fresh interpreters, how long the project modules take to import
+(`python -X importtime`) and how long `main.py` takes to be ready to serve, i.e.
+until the VTN port accepts connections and the API answers `/health` with 200.
+It also reports which heavy dependencies (Faker, openleadr, aiohttp, uvicorn) an
+import pulls in, they are expected to be loaded lazily on the paths that use them.
+
+Usage:
+    python -m benchmarks.startup --output startup.json
+    python -m benchmarks.startup --runs 10 --baseline startup.json
+    python -m benchmarks.startup --modules vtn_fast_api.api_service --skip-ready
+"""
+import argparse
+import contextlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Tuple
+
+from benchmarks.harness import LatencyRecorder, build_report, write_report, compare_reports
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = (
+    'local_lib.models.domain',
+    'vtn_fast_api.vtn_service',
+    'vtn_fast_api.api_service',
+)
+HEAVY_MODULES = ('faker', 'openleadr', 'aiohttp', 'uvicorn')
+
+
+def parse_importtime(output: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Parses the `-X importtime` output of an interpreter.
+
+    Returns:
+        The self and cumulative import time (µs) of every imported module
+    """
+    timings = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not self_us.strip().isdigit():  # Header line
+            continue
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def _environment(**overrides: str) -> Dict[str, str]:
+    env = {**os.environ, 'OPEN_KICK__CORE__DEBUG': 'false', **overrides}
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, (ROOT, env.get('PYTHONPATH'))))
+    return env
+
+
+def measure_import(module: str) -> Dict[str, object]:
+    """Imports `module` in a fresh interpreter and returns its import time and the heavy modules it loaded."""
+    script = f'import sys, {module}; print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))'
+    started_at = time.perf_counter_ns()
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', script], cwd=ROOT, env=_environment(),
+                               capture_output=True, text=True, check=True)
+    elapsed_ns = time.perf_counter_ns() - started_at
+    timings = parse_importtime(completed.stderr)
+    return {
+        'import_us': timings.get(module, (0, 0))[1],
+        'process_ns': elapsed_ns,
+        'heavy_modules': [name for name in completed.stdout.strip().split(',') if name],
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _port_open(port: int) -> bool:
+    with contextlib.suppress(OSError), socket.create_connection(('127.0.0.1', port), timeout=0.2):
+        return True
+    return False
+
+
+def _health_ok(port: int) -> bool:
+    with contextlib.suppress(OSError, urllib.error.URLError):
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=0.5) as response:
+            return response.status == 200
+    return False
+
+
+def measure_ready(timeout: float = 60.0) -> int:
+    """
+    Starts `main.py` on free ports and returns the time (ns) until both servers are ready to serve.
+
+    Raises:
+        RuntimeError: If the process exits or is not ready within `timeout` seconds
+    """
+    api_port, vtn_port = free_port(), free_port()
+    env = _environment(OPEN_KICK__FAST_API__LOCATION__PORT=str(api_port),
+                       OPEN_KICK__VTN__LOCATION__PORT=str(vtn_port))
+    started_at = time.perf_counter_ns()
+    process = subprocess.Popen([sys.executable, 'main.py'], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + timeout
+        vtn_ready = False
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f'main.py exited with status {process.returncode} before being ready')
+            vtn_ready = vtn_ready or _port_open(vtn_port)
+            if vtn_ready and _health_ok(api_port):
+                return time.perf_counter_ns() - started_at
+            time.sleep(0.005)
+        raise RuntimeError(f'main.py was not ready to serve within {timeout}s')
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def run(args) -> dict:
+    recorders: List[LatencyRecorder] = []
+    heavy_modules = {}
+    for module in args.modules:
+        import_recorder = LatencyRecorder(f'import:{module}')
+        process_recorder = LatencyRecorder(f'process:{module}')
+        for _ in range(args.runs):
+            result = measure_import(module)
+            import_recorder.record(result['import_us'] * 1_000)
+            process_recorder.record(result['process_ns'])
+            heavy_modules[module] = result['heavy_modules']
+        recorders.extend((import_recorder, process_recorder))
+
+    if not args.skip_ready:
+        ready_recorder = LatencyRecorder('ready_to_serve')
+        for _ in range(args.runs):
+            ready_recorder.record(measure_ready(args.timeout))
+        recorders.append(ready_recorder)
+
+    return build_report(recorders, runs=args.runs, heavy_modules=heavy_modules)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Import and ready-to-serve time of the VTN / API.')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters started per measurement')
+    parser.add_argument('--modules', type=lambda value: value.split(','), default=list(MODULES),
+                        help=f'Comma separated modules to import (default: {",".join(MODULES)})')
+    parser.add_argument('--skip-ready', action='store_true', help='Only measure the import times')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Seconds to wait for main.py to be ready')
+    parser.add_argument('--output', default=None, help='Write the JSON report to this file instead of stdout')
+    parser.add_argument('--baseline', default=None, help='Previous JSON report to compare this run against')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    report = run(args)
+    write_report(report, args.output)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        print(json.dumps({'delta_pct': compare_reports(baseline, report)}, indent=2), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Connection usage of real VEN clients, one thread and connection pool per client or fleet mode.
+
+Starts a local VTN, connects every VEN of the fleet with the openleadr client (as
+`/ven/connect` does), waits until the whole fleet is registered, keeps it polling for
+`--hold` seconds and reports the fleet stats of `local_lib.ven_fleet`: threads, file
+descriptors and sockets of the process (on top of those held before connecting, the VTN
+side of every connection included), connections created and reused, TLS handshakes and the
+connection setup time. `--mode both` runs each mode in its own process and reports both.
+
+Usage:
+    python -m benchmarks.ven_clients --fleet 500
+    python -m benchmarks.ven_clients --fleet 1k --mode fleet --output ven_clients.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.harness import git_commit, write_report
+from benchmarks.vtn_load import FLEET_SIZES, fleet_size, build_fleet, start_local_vtn
+
+MODES = ('threads', 'fleet')
+
+
+def run(args) -> dict:
+    from local_lib.metrics import registrations
+    from local_lib.ven_fleet import fleet_stats, process_stats
+
+    fleet = build_fleet(args.fleet, args.seed)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+        vtn_service = start_local_vtn(fleet)
+        before = process_stats()
+
+        started_at = time.perf_counter()
+        vtn_service.ven_connect()
+        deadline = started_at + args.timeout
+        while registrations.value('accepted') < args.fleet and time.perf_counter() < deadline:
+            time.sleep(0.05)
+        registered_in = time.perf_counter() - started_at
+        time.sleep(args.hold)  # The clients poll meanwhile, over kept-alive connections when pooled
+        stats = fleet_stats()
+
+    return {
+        **stats,
+        'registered': int(registrations.value('accepted')),
+        'registered_in_s': round(registered_in, 3),
+        'added': {key: stats[key] - before[key] if before[key] is not None else None
+                  for key in ('threads', 'fds', 'sockets')},
+    }
+
+
+def run_mode(mode: str, args) -> dict:
+    """Runs one mode in its own process, the settings are read once per process."""
+    command = [sys.executable, '-m', 'benchmarks.ven_clients', '--mode', mode, '--fleet', str(args.fleet),
+               '--seed', str(args.seed), '--hold', str(args.hold), '--timeout', str(args.timeout)]
+    if args.port is not None:
+        command += ['--port', str(args.port)]
+    completed = subprocess.run(command, capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout)['modes'][mode]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Connection usage of the VEN clients.')
+    parser.add_argument('--fleet', type=fleet_size, default=500,
+                        help=f'Fleet size: {", ".join(FLEET_SIZES)} or an explicit number of VENs (default: 500)')
+    parser.add_argument('--mode', choices=MODES + ('both',), default='both', help='VEN client mode (default: both)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed used to build the fleet')
+    parser.add_argument('--port', type=int, default=None, help='Port of the local VTN (default: settings)')
+    parser.add_argument('--hold', type=float, default=15.0,
+                        help='Seconds the registered fleet keeps polling before the stats are taken')
+    parser.add_argument('--timeout', type=float, default=120.0, help='Seconds to wait for the fleet to register')
+    parser.add_argument('--output', default=None, help='Write the JSON report to this file instead of stdout')
+    parser.add_argument('--verbose', action='store_true', help='Keep the VTN and VEN output on stdout')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+
+    if args.mode == 'both':
+        modes = {mode: run_mode(mode, args) for mode in MODES}
+    else:
+        # The settings singleton reads the environment on first import, so configure it before
+        # any project module is loaded.
+        os.environ.setdefault('OPEN_KICK__CORE__DEBUG', 'false')
+        os.environ.setdefault('OPEN_KICK__ADMISSION__ENABLED', 'false')
+        os.environ['OPEN_KICK__VEN__FLEET_MODE'] = str(args.mode == 'fleet').lower()
+        if args.port is not None:
+            os.environ['OPEN_KICK__VTN__LOCATION__PORT'] = str(args.port)
+        modes = {args.mode: run(args)}
+
+    write_report({'meta': {'commit': git_commit(), 'fleet_size': args.fleet, 'hold_s': args.hold},
+                  'modes': modes}, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,392 @@
+"""
+Load-test harness for the VTN.
+
+Builds a reproducible VEN fleet with `generate_ven_props_batch`, starts a local VTN in
+this process, drives it with OpenADR traffic and writes p50/p99 latencies and
+ops/sec per scenario as JSON so that runs can be compared between commits.
+
+Usage:
+    python -m benchmarks.vtn_load --fleet 1k --output bench_1k.json
+    python -m benchmarks.vtn_load --fleet 10k --scenarios registration_storm,db_query_mix
+    python -m benchmarks.vtn_load --fleet 1k --baseline bench_1k.json
+    python -m benchmarks.vtn_load --fleet 10k --shards 4 --scenarios registration_storm,steady_state_polling
+    python -m benchmarks.vtn_load --fleet 10k --scenarios event_delivery,template_delivery --template-intervals 96
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import socket
+import sys
+import time
+from datetime import datetime, timezone, timedelta
+from typing import List, Dict, Callable, Tuple
+
+from benchmarks.harness import LatencyRecorder, build_report, write_report, compare_reports
+
+FLEET_SIZES = {'1k': 1_000, '10k': 10_000, '100k': 100_000}
+SCENARIOS = (
+    'registration_storm',
+    'steady_state_polling',
+    'event_dispatch',
+    'event_delivery',
+    'template_dispatch',
+    'template_delivery',
+    'report_ingestion',
+    'db_query_mix',
+)
+OADR_PATH = '/OpenADR2/Simple/2.0b'
+BENCH_COLLECTION = 'bench_ven_props'
+
+
+def fleet_size(value: str) -> int:
+    return FLEET_SIZES[value] if value in FLEET_SIZES else int(value)
+
+
+def build_fleet(size: int, seed: int):
+    from local_lib.models.domain import generate_ven_props_batch
+
+    return generate_ven_props_batch(size, seed)
+
+
+def start_local_vtn(fleet):
+    """
+    Seeds the InMemoryDB with the fleet and starts the VTN server threads.
+    Returns the running VTNService once the HTTP port of every shard accepts connections.
+    """
+    from local_lib.models.in_memory_db import InMemoryDB
+    from vtn_fast_api.vtn_service import VTNService
+
+    db = InMemoryDB()
+    db.drop_collection('ven_props')
+    db.insert_many('ven_props', fleet)
+
+    vtn_service = VTNService()
+    vtn_service.run()
+    for shard in vtn_service.shards.values():
+        wait_for_port('127.0.0.1', shard.port)
+    return vtn_service
+
+
+def wait_for_port(host: str, port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with contextlib.suppress(OSError), socket.create_connection((host, port), timeout=0.5):
+            return
+        time.sleep(0.05)
+    raise RuntimeError(f'VTN did not start listening on {host}:{port} within {timeout}s')
+
+
+async def post_messages(session, messages: List[Tuple[str, str]], concurrency: int,
+                        recorder: LatencyRecorder) -> None:
+    """
+    Posts every (URL, message) with at most `concurrency` requests in flight, recording the
+    latency of each request.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def post(url: str, message: str) -> None:
+        async with semaphore:
+            started_at = time.perf_counter_ns()
+            try:
+                async with session.post(url, data=message) as response:
+                    await response.read()
+                    if response.status != 200:
+                        recorder.record_error()
+                        return
+            except Exception:
+                recorder.record_error()
+                return
+            recorder.record(time.perf_counter_ns() - started_at)
+
+    recorder.start()
+    await asyncio.gather(*(post(url, message) for url, message in messages))
+    recorder.stop()
+
+
+def registration_messages(fleet) -> List[str]:
+    from openleadr.messaging import create_message
+    from openleadr.utils import generate_id
+
+    return [
+        create_message(
+            'oadrCreatePartyRegistration',
+            request_id=generate_id(),
+            ven_name=ven['name'],
+            ven_id=ven['id'],
+            http_pull_model=True,
+            xml_signature=False,
+            report_only=False,
+            profile_name='2.0b',
+            transport_name='simpleHttp',
+            transport_address=None,
+            registration_id=None,
+        )
+        for ven in fleet
+    ]
+
+
+def poll_messages(fleet) -> List[str]:
+    from openleadr.messaging import create_message
+
+    return [create_message('oadrPoll', ven_id=ven['id']) for ven in fleet]
+
+
+async def on_vtn_loop(vtn_service, coroutine):
+    """Runs a coroutine on the event loop of the first VTN shard and waits for it from the driver loop."""
+    loop = next(iter(vtn_service.shards.values())).loop
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, loop))
+
+
+async def dispatch_events(vtn_service, fleet, recorder: LatencyRecorder) -> None:
+    recorder.start()
+    for ven in fleet:
+        started_at = time.perf_counter_ns()
+        try:
+            await vtn_service.send_event(ven['id'], signal_level=2)
+        except Exception:
+            recorder.record_error()
+            continue
+        recorder.record(time.perf_counter_ns() - started_at)
+    recorder.stop()
+
+
+async def dispatch_template(vtn_service, intervals: int, recorder: LatencyRecorder) -> None:
+    """
+    Sends one event from a template to the whole fleet, recorded as a single operation. The event
+    starts tomorrow: openleadr drops an event that already completed (like the 2021 event of
+    `send_event`) from the queue of a VEN before delivering it when it is the only one queued.
+    """
+    dtstart = datetime.now(timezone.utc).replace(microsecond=0) + timedelta(days=1)
+    signals = [{
+        'signal_name': 'simple',
+        'signal_type': 'level',
+        'intervals': [{'dtstart': dtstart + index * timedelta(minutes=10), 'duration': timedelta(minutes=10),
+                       'signal_payload': 2} for index in range(intervals)],
+    }]
+    template = vtn_service.add_event_template(signals, template_id='bench-template')
+
+    recorder.start()
+    started_at = time.perf_counter_ns()
+    try:
+        vtn_service.send_event_template(template['template_id'])
+    except Exception:
+        recorder.record_error()
+    else:
+        recorder.record(time.perf_counter_ns() - started_at)
+    recorder.stop()
+
+
+async def ingest_reports(vtn_service, fleet, readings: int, recorder: LatencyRecorder) -> None:
+    now = datetime.now(timezone.utc)
+    callbacks = []
+    for ven in fleet:
+        callback, _ = await vtn_service.shard_for(ven['id']).on_register_report(
+            ven['id'], ven['id'], ven['registration_id'], None, None, None, None
+        )
+        callbacks.append(callback)
+
+    recorder.start()
+    for callback in callbacks:
+        data = [(now, 1.23)] * readings
+        started_at = time.perf_counter_ns()
+        try:
+            await callback(data)
+        except Exception:
+            recorder.record_error()
+            continue
+        recorder.record(time.perf_counter_ns() - started_at)
+    recorder.stop()
+
+
+def db_query_mix(fleet, operations: int, seed: int) -> Dict[str, LatencyRecorder]:
+    """
+    Runs a weighted mix of InMemoryDB operations against a copy of the fleet.
+    Returns one recorder per operation type plus an aggregated 'db_query_mix' recorder.
+    """
+    from local_lib.models.in_memory_db import InMemoryDB
+
+    db = InMemoryDB()
+    db.drop_collection(BENCH_COLLECTION)
+    for ven in fleet:
+        db.insert(BENCH_COLLECTION, dict(ven))
+
+    rng = random.Random(seed)
+    ids = [ven['id'] for ven in fleet]
+    names = [ven['name'] for ven in fleet]
+    next_index = len(fleet)
+
+    def find_by_id():
+        db.find(BENCH_COLLECTION, {'id': rng.choice(ids)})
+
+    def find_one_by_name():
+        db.find_one(BENCH_COLLECTION, {'name': rng.choice(names)})
+
+    def find_range():
+        db.find(BENCH_COLLECTION, {'id': {'$gt': rng.choice(ids)}})
+
+    def update_by_id():
+        db.update(BENCH_COLLECTION, {'id': rng.choice(ids)}, {'fingerprint': '0' * 64})
+
+    def insert_delete():
+        nonlocal next_index
+        ven_id = f'BENCH-{next_index}'
+        next_index += 1
+        db.insert(BENCH_COLLECTION, {'id': ven_id, 'name': ven_id})
+        db.delete(BENCH_COLLECTION, {'id': ven_id})
+
+    mix: List[tuple[str, Callable[[], None], int]] = [
+        ('find_by_id', find_by_id, 50),
+        ('find_one_by_name', find_one_by_name, 20),
+        ('find_range', find_range, 10),
+        ('update_by_id', update_by_id, 15),
+        ('insert_delete', insert_delete, 5),
+    ]
+    recorders = {name: LatencyRecorder(f'db_{name}') for name, _, _ in mix}
+    total = LatencyRecorder('db_query_mix')
+    picks = rng.choices(mix, weights=[weight for _, _, weight in mix], k=operations)
+
+    total.start()
+    for name, operation, _ in picks:
+        started_at = time.perf_counter_ns()
+        operation()
+        elapsed = time.perf_counter_ns() - started_at
+        recorders[name].record(elapsed)
+        total.record(elapsed)
+    total.stop()
+    db.drop_collection(BENCH_COLLECTION)
+    return {'db_query_mix': total, **recorders}
+
+
+async def drive(vtn_service, fleet, args) -> List[LatencyRecorder]:
+    import aiohttp
+
+    # Every VEN talks to the shard owning it
+    base_urls = [f"http://127.0.0.1:{vtn_service.shard_for(ven['id']).port}{OADR_PATH}" for ven in fleet]
+    recorders: List[LatencyRecorder] = []
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    headers = {'content-type': 'application/xml'}
+
+    async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
+        if 'registration_storm' in args.scenarios:
+            recorder = LatencyRecorder('registration_storm')
+            messages = [(f'{base_url}/EiRegisterParty', message)
+                        for base_url, message in zip(base_urls, registration_messages(fleet))]
+            await post_messages(session, messages, args.concurrency, recorder)
+            recorders.append(recorder)
+
+        polls = []
+        if {'steady_state_polling', 'event_delivery', 'template_delivery'} & set(args.scenarios):
+            polls = [(f'{base_url}/OadrPoll', message) for base_url, message in zip(base_urls, poll_messages(fleet))]
+
+        if 'steady_state_polling' in args.scenarios:
+            recorder = LatencyRecorder('steady_state_polling')
+            await post_messages(session, polls * args.poll_rounds, args.concurrency, recorder)
+            recorders.append(recorder)
+
+        if 'event_dispatch' in args.scenarios or 'event_delivery' in args.scenarios:
+            recorder = LatencyRecorder('event_dispatch')
+            await on_vtn_loop(vtn_service, dispatch_events(vtn_service, fleet, recorder))
+            if 'event_dispatch' in args.scenarios:
+                recorders.append(recorder)
+
+        if 'event_delivery' in args.scenarios:
+            recorder = LatencyRecorder('event_delivery')
+            await post_messages(session, polls, args.concurrency, recorder)
+            recorders.append(recorder)
+
+        if 'template_dispatch' in args.scenarios or 'template_delivery' in args.scenarios:
+            recorder = LatencyRecorder('template_dispatch')
+            await on_vtn_loop(vtn_service, dispatch_template(vtn_service, args.template_intervals, recorder))
+            if 'template_dispatch' in args.scenarios:
+                recorders.append(recorder)
+
+        if 'template_delivery' in args.scenarios:
+            recorder = LatencyRecorder('template_delivery')
+            await post_messages(session, polls, args.concurrency, recorder)
+            recorders.append(recorder)
+
+        if 'report_ingestion' in args.scenarios:
+            recorder = LatencyRecorder('report_ingestion')
+            await on_vtn_loop(vtn_service, ingest_reports(vtn_service, fleet, args.report_readings, recorder))
+            recorders.append(recorder)
+
+    return recorders
+
+
+def run(args) -> dict:
+    fleet = build_fleet(args.fleet, args.seed)
+    recorders: List[LatencyRecorder] = []
+
+    http_scenarios = [scenario for scenario in args.scenarios if scenario != 'db_query_mix']
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+        if http_scenarios:
+            vtn_service = start_local_vtn(fleet)
+            recorders.extend(asyncio.run(drive(vtn_service, fleet, args)))
+        if 'db_query_mix' in args.scenarios:
+            recorders.extend(db_query_mix(fleet, args.db_operations, args.seed).values())
+
+    return build_report(
+        recorders,
+        fleet_size=args.fleet,
+        seed=args.seed,
+        shards=args.shards,
+        concurrency=args.concurrency,
+        poll_rounds=args.poll_rounds,
+        report_readings=args.report_readings,
+        template_intervals=args.template_intervals,
+        db_operations=args.db_operations,
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Load-test harness for the OpenADR VTN.')
+    parser.add_argument('--fleet', type=fleet_size, default=FLEET_SIZES['1k'],
+                        help='Fleet size: 1k, 10k, 100k or an explicit number of VENs (default: 1k)')
+    parser.add_argument('--scenarios', type=lambda value: value.split(','), default=list(SCENARIOS),
+                        help=f'Comma separated scenarios to run (default: {",".join(SCENARIOS)})')
+    parser.add_argument('--seed', type=int, default=0, help='Seed used to build the fleet and the query mix')
+    parser.add_argument('--port', type=int, default=None, help='Port of the local VTN (default: settings)')
+    parser.add_argument('--shards', type=int, default=1, help='VTN shards, on consecutive ports from --port')
+    parser.add_argument('--concurrency', type=int, default=100, help='Maximum number of requests in flight')
+    parser.add_argument('--poll-rounds', type=int, default=3, help='Polls per VEN for steady_state_polling')
+    parser.add_argument('--report-readings', type=int, default=10, help='Readings per report for report_ingestion')
+    parser.add_argument('--template-intervals', type=int, default=1,
+                        help='Intervals of the event sent from a template, for template_dispatch/template_delivery')
+    parser.add_argument('--db-operations', type=int, default=10_000, help='Operations for db_query_mix')
+    parser.add_argument('--output', default=None, help='Write the JSON report to this file instead of stdout')
+    parser.add_argument('--baseline', default=None, help='Previous JSON report to compare this run against')
+    parser.add_argument('--verbose', action='store_true', help='Keep the VTN output on stdout')
+    args = parser.parse_args(argv)
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+    return args
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+
+    # The settings singleton reads the environment on first import, so configure it before
+    # any project module is loaded. Debug logging would dominate the measured latencies.
+    os.environ.setdefault('OPEN_KICK__CORE__DEBUG', 'false')
+    # The scenarios measure the capacity of the handlers, see benchmarks.recovery for the admission control
+    os.environ.setdefault('OPEN_KICK__ADMISSION__ENABLED', 'false')
+    if args.port is not None:
+        os.environ['OPEN_KICK__VTN__LOCATION__PORT'] = str(args.port)
+    os.environ['OPEN_KICK__VTN__SHARDS'] = str(args.shards)
+
+    report = run(args)
+    write_report(report, args.output)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        print(json.dumps({'delta_pct': compare_reports(baseline, report)}, indent=2), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
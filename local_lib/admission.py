@@ -0,0 +1,217 @@
+"""
+Admission control of the OpenADR messages the VENs send in bulk (registrations, polls).
+
+After a VTN restart every VEN registers at once. Each message first takes a token from the
+bucket of its VEN and from the global bucket, then a slot among `max_concurrency` messages
+in flight, waiting in a bounded queue for at most `queue_timeout` seconds. A message that
+cannot be admitted is rejected right away with a hint of when to retry, which the VEN client
+honours on top of its jittered exponential backoff (see `backoff_delay`). The tokens of a
+rejected message are given back, so that its retry is not rejected by the rate of its VEN.
+"""
+import asyncio
+import random
+import re
+import time
+from collections import OrderedDict, deque
+from typing import Optional, Deque, Iterable, Callable
+
+from local_lib.metrics import registry
+from local_lib.settings import settings
+
+admissions = registry.counter(
+    'vtn_admissions_total', 'Admission decisions of the VTN, by service and outcome', ('service', 'outcome'))
+admission_wait = registry.histogram(
+    'vtn_admission_wait_seconds', 'Time an admitted message waited for a slot', ('service',))
+
+# The VEN identity of a message, read from the raw XML before openleadr parses it
+VEN_KEY_PATTERN = re.compile(rb'<(?:[\w-]+:)?ven(?:ID|Name)>\s*([^<\s]{1,256})\s*</')
+RETRY_HINT_PATTERN = re.compile(r'retry after ([0-9.]+)s')
+
+
+def ven_key(body: bytes) -> Optional[str]:
+    """The venID (or venName) of a raw OpenADR message, None if it has none (e.g. oadrQueryRegistration)."""
+    match = VEN_KEY_PATTERN.search(body)
+    return match.group(1).decode('utf-8', 'replace') if match else None
+
+
+def rejection_message(reason: str, retry_after: float) -> str:
+    return f'VTN busy ({reason}), retry after {retry_after:.3f}s'
+
+
+def parse_retry_hint(content: str) -> Optional[float]:
+    """The retry hint of a rejection body (see `rejection_message`), None for any other content."""
+    match = RETRY_HINT_PATTERN.search(content)
+    return float(match.group(1)) if match else None
+
+
+def backoff_delay(attempt: int, base: float, cap: float, retry_after: Optional[float] = None,
+                  rng: random.Random = random) -> float:
+    """
+    Delay before the retry number `attempt` (from 0): the retry hint of the VTN, if any, plus a
+    "full jitter" exponential backoff, uniform between 0 and min(cap, base * 2 ** attempt), so
+    that VENs rejected together do not come back together.
+    """
+    return (retry_after or 0.0) + rng.uniform(0, min(cap, base * 2 ** min(attempt, 32)))
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated_at')
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = now
+
+    def take(self, now: float) -> float:
+        """Takes a token, returns 0 or (without taking anything) the seconds until one is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self) -> None:
+        """Gives back a token taken for a message rejected afterwards."""
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(rejection_message(reason, retry_after))
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Admission of the messages handled by one event loop (one VTN shard), not thread safe.
+
+    Attributes:
+        services: OpenADR services (EiRegisterParty, OadrPoll...) under admission control
+    """
+
+    def __init__(self,
+                 services: Iterable[str] = settings.admission['services'],
+                 rate: float = settings.admission['rate'],
+                 burst: float = settings.admission['burst'],
+                 ven_rate: float = settings.admission['ven_rate'],
+                 ven_burst: float = settings.admission['ven_burst'],
+                 max_concurrency: int = settings.admission['max_concurrency'],
+                 max_queue: int = settings.admission['max_queue'],
+                 queue_timeout: float = settings.admission['queue_timeout'],
+                 max_tracked_vens: int = settings.admission['max_tracked_vens'],
+                 clock: Callable[[], float] = time.monotonic):
+        self.services = frozenset(services)
+        self.rate = rate
+        self.ven_rate = ven_rate
+        self.ven_burst = ven_burst
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_tracked_vens = max_tracked_vens
+        self.clock = clock
+        self._bucket = TokenBucket(rate, burst, clock())
+        # Least recently seen first, the oldest buckets are dropped (a new bucket starts full)
+        self._ven_buckets: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+        self._in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._retry_at = 0.0  # Last retry time handed out
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _ven_bucket(self, key: str, now: float) -> TokenBucket:
+        bucket = self._ven_buckets.get(key)
+        if bucket is None:
+            bucket = self._ven_buckets[key] = TokenBucket(self.ven_rate, self.ven_burst, now)
+            if len(self._ven_buckets) > self.max_tracked_vens:
+                self._ven_buckets.popitem(last=False)
+        else:
+            self._ven_buckets.move_to_end(key)
+        return bucket
+
+    def _retry_hint(self, now: float, wait: float) -> float:
+        """
+        Retry hint of a message rejected by the global limits. Each rejected message is handed
+        the next retry time at the global rate, so the rejected VENs come back spread out rather
+        than all together as soon as a token is available.
+        """
+        self._retry_at = max(self._retry_at + 1 / self.rate, now + wait)
+        return self._retry_at - now
+
+    async def acquire(self, service: str, key: Optional[str]) -> None:
+        """
+        Waits for a slot for a message of the VEN `key` (None when the message carries no VEN
+        identity, it is then only subject to the global limits). Every successful call must
+        be followed by `release`.
+
+        Raises:
+            AdmissionRejected: If the message must be retried later
+        """
+        now = self.clock()
+        ven_bucket = self._ven_bucket(key, now) if key is not None else None
+        retry_after = ven_bucket.take(now) if ven_bucket is not None else 0.0
+        if retry_after:
+            admissions.inc(service, 'rejected_ven')
+            raise AdmissionRejected('ven rate', retry_after)
+        retry_after = self._bucket.take(now)
+        if retry_after:
+            self._refund(ven_bucket, global_token=False)
+            admissions.inc(service, 'rejected_rate')
+            raise AdmissionRejected('rate', self._retry_hint(now, retry_after))
+
+        if self._in_flight < self.max_concurrency and not self._waiters:
+            self._in_flight += 1
+            admissions.inc(service, 'admitted')
+            return
+        if len(self._waiters) >= self.max_queue:
+            self._refund(ven_bucket)
+            admissions.inc(service, 'rejected_queue_full')
+            raise AdmissionRejected('queue full', self._retry_hint(now, 1 / self.rate))
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait((waiter,), timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            if not waiter.done():
+                self._refund(ven_bucket)
+            self._abandon(waiter)
+            raise
+        if not waiter.done():
+            self._abandon(waiter)
+            self._refund(ven_bucket)
+            admissions.inc(service, 'rejected_timeout')
+            raise AdmissionRejected('queue timeout', self._retry_hint(self.clock(), 1 / self.rate))
+        admission_wait.observe(self.clock() - now, service)
+        admissions.inc(service, 'admitted')
+
+    def _refund(self, ven_bucket: Optional[TokenBucket], global_token: bool = True) -> None:
+        """Gives back the tokens of a message rejected after taking them."""
+        if ven_bucket is not None:
+            ven_bucket.refund()
+        if global_token:
+            self._bucket.refund()
+
+    def _abandon(self, waiter: asyncio.Future) -> None:
+        if waiter.done():
+            self.release()  # The slot was handed over meanwhile, pass it on
+        else:
+            self._waiters.remove(waiter)
+            waiter.cancel()
+
+    def release(self) -> None:
+        """Frees a slot, handed over to the first waiting message if any."""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # The slot changes hands, _in_flight is unchanged
+                return
+        self._in_flight -= 1
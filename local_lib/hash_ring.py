@@ -0,0 +1,75 @@
+import bisect
+import hashlib
+from typing import Dict, Iterable, List, Tuple
+
+
+def ring_hash(key: str) -> int:
+    """Position of `key` on the ring, stable across processes and restarts (unlike `hash`)."""
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """
+    Consistent hashing of keys (VEN ids) onto nodes (VTN shards).
+
+    Every node is placed `virtual_nodes` times on the ring and a key belongs to the first
+    node point found clockwise from its own position. Adding a node only takes keys over
+    from the other nodes (about 1/N of them) and removing one only hands its own keys over,
+    every other key keeps its node.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), virtual_nodes: int = 256):
+        self.virtual_nodes = virtual_nodes
+        self._nodes: List[str] = []
+        # (sorted positions of the virtual nodes, node of each position), replaced as a whole
+        self._ring: Tuple[List[int], List[str]] = ([], [])
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self) -> List[str]:
+        return self._nodes.copy()
+
+    def _node_points(self, node: str) -> List[Tuple[int, str]]:
+        return [(ring_hash(f'{node}#{replica}'), node) for replica in range(self.virtual_nodes)]
+
+    def _rebuild(self, points: List[Tuple[int, str]]) -> None:
+        points.sort()
+        self._ring = ([point for point, _ in points], [node for _, node in points])
+
+    def add(self, node: str) -> None:
+        if node in self._nodes:
+            raise ValueError(f'Node {node} is already on the ring')
+        self._nodes.append(node)
+        self._rebuild(list(zip(*self._ring)) + self._node_points(node))
+
+    def remove(self, node: str) -> None:
+        if node not in self._nodes:
+            raise KeyError(f'Node {node} is not on the ring')
+        self._nodes.remove(node)
+        self._rebuild([(point, owner) for point, owner in zip(*self._ring) if owner != node])
+
+    def copy(self) -> 'HashRing':
+        ring = HashRing(virtual_nodes=self.virtual_nodes)
+        ring._nodes = self._nodes.copy()
+        ring._ring = self._ring  # Never mutated in place
+        return ring
+
+    def node_for(self, key: str) -> str:
+        points, owners = self._ring
+        if not points:
+            raise LookupError('The ring has no node')
+        return owners[bisect.bisect(points, ring_hash(key)) % len(points)]
+
+    def assign(self, keys: Iterable[str]) -> Dict[str, List[str]]:
+        """Groups `keys` by node, every node of the ring is listed even without any key."""
+        assignment: Dict[str, List[str]] = {node: [] for node in self._nodes}
+        for key in keys:
+            assignment[self.node_for(key)].append(key)
+        return assignment
+
+    def __contains__(self, node: str) -> bool:
+        return node in self._nodes
+
+    def __len__(self) -> int:
+        return len(self._nodes)
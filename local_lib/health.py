@@ -0,0 +1,187 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Dict, Optional
+
+from local_lib.metrics import registry, loop_lag, loop_lag_last
+from local_lib.settings import settings
+from local_lib.utils.main import SingletonMeta
+
+loop_stalls = registry.counter(
+    'event_loop_stalls_total', 'Times an event loop did not answer a probe within the stall threshold', ('loop',))
+
+
+class _Watched:
+    """State of one watched thread and, once it registered it, the event loop it runs."""
+    __slots__ = ('name', 'thread', 'loop', 'probe_sent_at', 'last_lag', 'max_lag', 'last_seen_at', 'stalled',
+                 'stalls', 'samples')
+
+    def __init__(self, name: str, thread: threading.Thread, max_samples: int):
+        self.name = name
+        self.thread = thread
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.probe_sent_at: Optional[float] = None
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.last_seen_at: Optional[float] = None
+        self.stalled = False
+        self.stalls = 0
+        self.samples = deque(maxlen=max_samples)
+
+
+class HealthMonitor(metaclass=SingletonMeta):
+    """
+    Watches the threads of the process (API server, VTN server, VEN clients) and the
+    event loops registered with `register_loop`.
+
+    A watchdog thread schedules a probe on every loop with `call_soon_threadsafe` and
+    measures how long the loop takes to run it (its scheduling lag). While a probe is
+    pending for longer than `stall_threshold`, the stack of the loop thread is sampled
+    so that blocking callbacks can be identified.
+    """
+
+    def __init__(self,
+                 interval: float = settings.health['interval'],
+                 stall_threshold: float = settings.health['stall_threshold'],
+                 max_samples: int = settings.health['max_samples']):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.max_samples = max_samples
+        self._watched: Dict[str, _Watched] = {}
+        self._lock = threading.Lock()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def register_thread(self, name: str, thread: threading.Thread) -> None:
+        """Watches a thread for liveness, its loop can be attached later with `register_loop`."""
+        with self._lock:
+            watched = self._watched.get(name)
+            if watched is None:
+                self._watched[name] = _Watched(name, thread, self.max_samples)
+            else:
+                watched.thread = thread
+            self.start()
+
+    def register_loop(self, name: str, loop: asyncio.AbstractEventLoop,
+                      thread: Optional[threading.Thread] = None) -> None:
+        """Watches an event loop, by default run by the calling thread."""
+        thread = thread or threading.current_thread()
+        with self._lock:
+            watched = self._watched.get(name)
+            if watched is None:
+                watched = self._watched[name] = _Watched(name, thread, self.max_samples)
+            watched.thread = thread
+            watched.loop = loop
+            watched.probe_sent_at = None
+            self.start()
+
+    def unregister(self, name: str) -> None:
+        with self._lock:
+            self._watched.pop(name, None)
+
+    def start(self) -> None:
+        """Starts the watchdog thread, called whenever something gets registered."""
+        if self._watchdog is not None and self._watchdog.is_alive():
+            return
+        self._watchdog = threading.Thread(target=self._watch, name='health-watchdog', daemon=True)
+        self._watchdog.start()
+
+    def _acknowledge(self, watched: _Watched, sent_at: float) -> None:
+        """Runs on the watched loop when it gets to the probe."""
+        now = time.perf_counter()
+        lag = now - sent_at
+        watched.last_lag = lag
+        watched.max_lag = max(watched.max_lag, lag)
+        watched.last_seen_at = now
+        watched.probe_sent_at = None
+        watched.stalled = False
+        loop_lag.observe(lag, watched.name)
+        loop_lag_last.set(lag, watched.name)
+
+    def _sample_stack(self, watched: _Watched, pending_for: float) -> None:
+        frame = sys._current_frames().get(watched.thread.ident)
+        if frame is None:
+            return
+        watched.samples.append({
+            'timestamp': time.time(),
+            'pending_for_s': round(pending_for, 6),
+            'stack': [line.strip() for line in traceback.format_stack(frame)],
+        })
+
+    def _watch(self) -> None:
+        # Probes go out every `interval`, pending probes are checked more often so that a
+        # stall shows up (and gets sampled) while the slow callback is still running.
+        check_interval = min(self.interval, self.stall_threshold) / 4
+        next_probe_at = 0.0
+        while True:
+            now = time.perf_counter()
+            send_probes = now >= next_probe_at
+            if send_probes:
+                next_probe_at = now + self.interval
+
+            for watched in list(self._watched.values()):
+                loop = watched.loop
+                if loop is None or loop.is_closed() or not watched.thread.is_alive():
+                    continue
+                sent_at = watched.probe_sent_at
+                if sent_at is None:
+                    if send_probes:
+                        watched.probe_sent_at = now
+                        try:
+                            loop.call_soon_threadsafe(self._acknowledge, watched, now)
+                        except RuntimeError:  # The loop was closed in between
+                            watched.probe_sent_at = None
+                    continue
+
+                pending_for = now - sent_at
+                if pending_for >= self.stall_threshold:
+                    # Sampled first: a stall is counted once its stack can be read
+                    self._sample_stack(watched, pending_for)
+                    if not watched.stalled:
+                        watched.stalled = True
+                        watched.stalls += 1
+                        loop_stalls.inc(watched.name)
+
+            time.sleep(check_interval)
+
+    def loops_status(self) -> Dict[str, dict]:
+        now = time.perf_counter()
+        status = {}
+        for watched in list(self._watched.values()):
+            pending_for = now - watched.probe_sent_at if watched.probe_sent_at is not None else 0.0
+            status[watched.name] = {
+                'thread': watched.thread.name,
+                'thread_alive': watched.thread.is_alive(),
+                'has_loop': watched.loop is not None,
+                'stalled': pending_for >= self.stall_threshold,
+                'pending_probe_s': round(pending_for, 6),
+                'last_lag_s': round(watched.last_lag, 6),
+                'max_lag_s': round(watched.max_lag, 6),
+                'stalls': watched.stalls,
+                'slow_callback_samples': list(watched.samples),
+            }
+        return status
+
+    def status(self) -> dict:
+        """
+        Summarizes the health of the process: 'down' when a watched thread died,
+        'degraded' when a loop is currently stalled, 'ok' otherwise.
+        """
+        loops = self.loops_status()
+        dead_threads = sorted(name for name, loop in loops.items() if not loop['thread_alive'])
+        stalled_loops = sorted(name for name, loop in loops.items() if loop['stalled'])
+        if dead_threads:
+            overall = 'down'
+        elif stalled_loops:
+            overall = 'degraded'
+        else:
+            overall = 'ok'
+        return {
+            'status': overall,
+            'watchdog_alive': self._watchdog is not None and self._watchdog.is_alive(),
+            'threads': len(loops),
+            'dead_threads': dead_threads,
+            'stalled_loops': stalled_loops,
+        }
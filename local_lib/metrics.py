@@ -0,0 +1,212 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Sequence
+
+from local_lib.utils.main import SingletonMeta
+
+# Seconds, tuned for in-process handlers: from 100µs up to 10s
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """
+    Base class of the metrics. Every thread writes to its own shard (a plain dict keyed
+    by label values) so the hot path never takes a lock; shards are only merged when
+    the registry is scraped.
+    """
+    type_name = 'untyped'
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._local = threading.local()
+        self._shards: List[dict] = []
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            self._shards.append(shard)  # list.append is atomic, no lock required
+            return shard
+
+    def _snapshots(self) -> List[dict]:
+        # dict() copies a shard atomically under the GIL while its owner keeps writing
+        return [dict(shard) for shard in list(self._shards)]
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+        lines.extend(f'{name}{labels} {_format_value(value)}' for name, labels, value in self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        shard = self._shard()
+        shard[label_values] = shard.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return sum(shard.get(label_values, 0) for shard in self._snapshots())
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        totals: Dict[tuple, float] = {}
+        for shard in self._snapshots():
+            for label_values, value in shard.items():
+                totals[label_values] = totals.get(label_values, 0) + value
+        return [(self.name, _format_labels(self.label_names, key), value) for key, value in sorted(totals.items())]
+
+
+class Gauge(_Metric):
+    """A gauge keeps the last value set from any thread, writes are plain dict assignments."""
+    type_name = 'gauge'
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[tuple, float] = {}
+
+    def set(self, value: float, *label_values: str) -> None:
+        self._values[label_values] = value
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        return [(self.name, _format_labels(self.label_names, key), value)
+                for key, value in sorted(dict(self._values).items())]
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *label_values: str) -> None:
+        shard = self._shard()
+        state = shard.get(label_values)
+        if state is None:
+            # One slot per bucket, one for +Inf, then sum and count
+            state = shard[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        state[bisect_left(self.buckets, value)] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    @contextmanager
+    def time(self, *label_values: str):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, *label_values)
+
+    def count(self, *label_values: str) -> int:
+        return sum(shard[label_values][-1] for shard in self._snapshots() if label_values in shard)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        merged: Dict[tuple, list] = {}
+        for shard in self._snapshots():
+            for label_values, state in shard.items():
+                state = list(state)
+                total = merged.get(label_values)
+                merged[label_values] = state if total is None else [a + b for a, b in zip(total, state)]
+
+        samples = []
+        for label_values, state in sorted(merged.items()):
+            cumulative = 0
+            for upper_bound, bucket_count in zip(self.buckets + (float('inf'),), state):
+                cumulative += bucket_count
+                le = f'le="{_format_value(upper_bound)}"'
+                samples.append((f'{self.name}_bucket', _format_labels(self.label_names, label_values, le), cumulative))
+            samples.append((f'{self.name}_sum', _format_labels(self.label_names, label_values), state[-2]))
+            samples.append((f'{self.name}_count', _format_labels(self.label_names, label_values), state[-1]))
+        return samples
+
+
+class MetricsRegistry(metaclass=SingletonMeta):
+    """
+    Holds every metric of the process and renders them in the Prometheus text format.
+    Registering the same name twice returns the existing metric.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()  # Only guards registration, never the hot path
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, *args, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, label_names)
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, label_names)
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, label_names, buckets=buckets)
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in list(self._metrics.values())) + '\n'
+
+
+registry = MetricsRegistry()
+
+# --- Application metrics ---
+openadr_messages = registry.counter(
+    'openadr_messages_total', 'OpenADR messages handled by the VTN', ('service', 'status'))
+openadr_message_duration = registry.histogram(
+    'openadr_message_duration_seconds', 'Time spent handling an OpenADR message', ('service',))
+registrations = registry.counter(
+    'vtn_registrations_total', 'Party registrations handled by the VTN', ('result',))
+event_dispatch_duration = registry.histogram(
+    'vtn_event_dispatch_seconds', 'Time spent queuing an event for a VEN')
+shared_event_dispatch_duration = registry.histogram(
+    'vtn_shared_event_dispatch_seconds', 'Time spent queuing an event sent from a template for all of its VENs')
+event_fragments = registry.counter(
+    'vtn_event_fragments_total', 'Lookups of the rendered XML of the events sent from templates, by outcome (hit, miss)',
+    ('outcome',))
+report_values = registry.counter(
+    'vtn_report_values_total', 'Report values ingested by the VTN')
+db_query_duration = registry.histogram(
+    'db_query_duration_seconds', 'InMemoryDB operation time', ('collection', 'operation'))
+db_query_cache = registry.counter(
+    'db_query_cache_total', 'InMemoryDB query cache lookups, by collection and outcome (hit, miss, bypass)',
+    ('collection', 'outcome'))
+loop_lag = registry.histogram(
+    'event_loop_lag_seconds', 'Scheduling lag of an event loop', ('loop',),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+loop_lag_last = registry.gauge(
+    'event_loop_lag_last_seconds', 'Last measured scheduling lag of an event loop', ('loop',))
+
@@ -1,23 +1,44 @@
 import asyncio
+import hashlib
+import random
 import threading
 import time
 from datetime import timedelta
 
-from faker import Faker
-from functools import cached_property
-from typing import TypedDict, List, Optional
-from openleadr import OpenADRClient, enable_default_logging
+from collections import deque
+from functools import cached_property, lru_cache, partial
+from typing import TypedDict, List, Dict, Deque, Tuple, Optional, Callable, Iterable, Iterator
 
+from local_lib.admission import backoff_delay, parse_retry_hint
+from local_lib.health import HealthMonitor
 from local_lib.settings import settings
+from local_lib.ven_fleet import VenFleet, open_session
 from local_lib.utils.main import slugify, generate_id
 
 ID_PREFIX = 'ID'
 REGISTRATION_PREFIX = 'REG'
 
-fake = Faker()
+CHANGE_LOG_SIZE = 4096  # VenList changes kept for the consumers applying them incrementally
+FINGERPRINT_BLOCK = 256  # Fingerprints generated per SHAKE-256 digest by generate_ven_props_batch
 
-if settings.core['DEBUG']:
-    enable_default_logging()
+# Precompiled (already slugified) name tables of generate_ven_props_batch
+FIRST_NAMES = (
+    'james', 'mary', 'robert', 'patricia', 'john', 'jennifer', 'michael', 'linda', 'david', 'elizabeth', 'william',
+    'barbara', 'richard', 'susan', 'joseph', 'jessica', 'thomas', 'sarah', 'charles', 'karen', 'daniel', 'lisa',
+    'matthew', 'nancy', 'anthony', 'betty', 'mark', 'sandra', 'steven', 'ashley', 'paul', 'emily',
+)
+LAST_NAMES = (
+    'smith', 'johnson', 'williams', 'brown', 'jones', 'garcia', 'miller', 'davis', 'rodriguez', 'martinez',
+    'hernandez', 'lopez', 'gonzalez', 'wilson', 'anderson', 'thomas', 'taylor', 'moore', 'jackson', 'martin', 'lee',
+    'perez', 'thompson', 'white', 'harris', 'sanchez', 'clark', 'ramirez', 'lewis', 'robinson', 'walker', 'young',
+)
+
+
+@lru_cache(maxsize=None)
+def _faker():
+    """Faker is slow to import and to instantiate, it is only loaded once a VEN is generated."""
+    from faker import Faker
+    return Faker()
 
 
 class VenProps(TypedDict):
@@ -28,9 +49,15 @@ class VenProps(TypedDict):
 
 
 class Ven:
+    # No per-instance __dict__, a registry can hold 100k+ VENs
+    __slots__ = ('_client_thread', '_stop_client', '_is_connected', '_on_change', 'name', 'id', 'registration_id',
+                 'fingerprint')
+
     def __init__(self, ven_props: VenProps):
         self._client_thread: Optional[threading.Thread] = None
+        self._stop_client: Optional[Callable[[], None]] = None  # Set by run
         self._is_connected = False
+        self._on_change: Optional[Callable[['Ven'], None]] = None  # Set by the VenList holding this VEN
         self.name = ven_props['name']
         self.id = ven_props['id']
         self.registration_id = ven_props['registration_id']
@@ -44,6 +71,11 @@ class Ven:
     def is_connected(self, value):
         pass
 
+    def _set_connected(self, value: bool) -> None:
+        self._is_connected = value
+        if self._on_change is not None:
+            self._on_change(self)
+
     async def collect_report_value(self):
         # This callback is called when you need to collect a value for your Report
         return 1.23
@@ -55,8 +87,12 @@ class Ven:
         # You should include code here that sends control signals to your resources.
         return 'optIn'  # Accept the event
 
-    def _run_client(self, ven_name, ven_id, registration_id, vtn_url, debug, check_hostname, disable_signature) -> None:
-        """Internal method to run the client in a separate thread."""
+    def _build_client(self, ven_name, ven_id, registration_id, vtn_url, debug, check_hostname, disable_signature):
+        from openleadr import OpenADRClient, enable_default_logging  # Only loaded once a VEN connects
+
+        if settings.core['DEBUG']:
+            enable_default_logging()
+
         # Create a VEN and connect to the VTN
         client = OpenADRClient(
             ven_name=ven_name,
@@ -79,107 +115,333 @@ class Ven:
 
         # Add event handling capability to the client
         client.add_handler('on_event', self.handle_event)
+        return client
+
+    def _run_client(self, loop: asyncio.AbstractEventLoop, *client_args) -> None:
+        """
+        Internal method to run the client in a separate thread, on `loop` until it is stopped
+        (see `_stop_loop`), then stops the client on that same loop.
+        """
+        client = self._build_client(*client_args)
 
         # Run the client in the Python AsyncIO Event Loop
-        loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
-        loop.create_task(client.run())
-        loop.run_forever()
+        # Only the thread of the client is watched (see run), probing one loop per VEN would not scale
+        connecting = loop.create_task(self._connect(client, open_session))
+        try:
+            loop.run_forever()
+        finally:
+            loop.run_until_complete(self._close_client(client))
+            tasks = asyncio.all_tasks(loop) | {connecting}
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.close()
+
+    @staticmethod
+    def _stop_loop(loop: asyncio.AbstractEventLoop) -> None:
+        try:
+            loop.call_soon_threadsafe(loop.stop)  # Also stops a loop its thread has not started yet
+        except RuntimeError:  # The loop is already closed
+            pass
+
+    def _run_in_fleet(self, *client_args) -> None:
+        """Runs the client on the loop and the connection pool shared by the VEN clients of the process."""
+        fleet = VenFleet()
+        client = self._build_client(*client_args)
+        connecting = fleet.submit(self._connect(client, fleet.session))
 
-    def run(self):
+        def stop_client():
+            connecting.cancel()
+            fleet.submit(self._close_client(client))
+
+        self._stop_client = stop_client
+
+    @staticmethod
+    async def _close_client(client) -> None:
+        if client.client_session is not None:  # None when stopped before connecting
+            await client.stop()
+
+    async def _connect(self, client, session_factory: Callable) -> None:
+        """
+        Runs the client until it is registered, on a session from `session_factory`. While the
+        VTN rejects the registration (e.g. admission control after a restart), it is retried
+        after the hint of the VTN plus a jittered exponential backoff, so the fleet does not
+        come back all at once.
+        """
+        retry_hints: Deque[Optional[float]] = deque(maxlen=1)
+        client.add_hook('after_receive_xml', lambda content: retry_hints.append(parse_retry_hint(content)))
+
+        attempt = 0
+        while True:
+            client.client_session = session_factory()
+            await client.run()
+            if client.registration_id:
+                return
+            # openleadr closes its session when the registration fails, a new one is opened for the retry
+            delay = backoff_delay(attempt, settings.ven['backoff_base'], settings.ven['backoff_cap'],
+                                  retry_hints[-1] if retry_hints else None)
+            if settings.core['DEBUG']:
+                print(f'VEN {self.id} not registered, retrying in {delay:.2f}s (attempt {attempt + 1})')
+            retry_hints.clear()
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def run(self, vtn_url: Optional[str] = None):
+        """
+        Connects the VEN client to the VTN, in a background thread or, in fleet mode
+        (OPEN_KICK__VEN__FLEET_MODE), on the loop shared by the VEN clients of the process.
+
+        Args:
+            vtn_url: URL of the VTN (shard) this VEN belongs to, defaults to settings.vtn_url
+        """
+        client_args = (
+            self.name,
+            self.id,
+            self.registration_id,
+            f'{vtn_url or settings.vtn_url}/OpenADR2/Simple/2.0b',
+            True,
+            False,  # Should probably be True in production
+            False,  # Should probably be True in production
+        )
         try:
-            self._client_thread = threading.Thread(
-                target=self._run_client,
-                args=(
-                    self.name,
-                    self.id,
-                    self.registration_id,
-                    f'{settings.vtn_url}/OpenADR2/Simple/2.0b',
-                    True,
-                    False,  # Should probably be True in production
-                    False,  # Should probably be True in production
-                ),
-                daemon=True
-            )
-            self._client_thread.start()
-            self._is_connected = True
+            if settings.ven['fleet_mode']:
+                self._run_in_fleet(*client_args)
+            else:
+                # The loop is created here so that `stop` right after `run` stops the client
+                loop = asyncio.new_event_loop()
+                self._stop_client = partial(self._stop_loop, loop)
+                self._client_thread = threading.Thread(target=self._run_client, args=(loop, *client_args),
+                                                       daemon=True)
+                self._client_thread.start()
+                HealthMonitor().register_thread(f'ven:{self.id}', self._client_thread)
+            VenFleet().attach(self.id)
+            self._set_connected(True)
         except Exception as e:
-            self._is_connected = False
+            self._set_connected(False)
             raise RuntimeError(f"Failed to connect VEN client: {str(e)}") from e
 
+    def stop(self) -> None:
+        """Stops the VEN client (e.g. before connecting it to another VTN shard)."""
+        if self._stop_client is not None:
+            self._stop_client()
+            self._stop_client = None
+        HealthMonitor().unregister(f'ven:{self.id}')
+        VenFleet().detach(self.id)
+        self._set_connected(False)
+
     def __str__(self) -> str:
         return f"VEN(name={self.name}, id={self.id}, registration_id={self.registration_id}, fingerprint={self.fingerprint}), is_connected={self._is_connected})"
 
 
 class VenList:
-    __ven_list: List[Ven] = []
+    """
+    Registry of the VENs known by the VTN, stored column by column (struct of arrays).
+
+    Every VEN is a row of the name / id / registration_id / fingerprint columns, whose strings
+    are the ones of the DB documents (nothing is copied). A column gets a hash index the first
+    time it is searched, lookups are O(1) from then on. `Ven` instances are only materialized
+    when asked for, and then kept since they hold the client thread and the connection state.
+    """
 
-    def __init__(self, ven_list: List[Ven], debug: bool = settings.core['DEBUG']):
+    def __init__(self, ven_list: Iterable[Ven] = (), debug: bool = settings.core['DEBUG']):
         self.debug = debug
-        self.__ven_list = ven_list
+        self._columns: Dict[str, List[str]] = {key: [] for key in VenProps.__annotations__}
+        self._indexes: Dict[str, Dict[str, int]] = {}  # column -> {value: first row holding it}
+        self._instances: List[Optional[Ven]] = []  # row -> materialized Ven, None until asked for
+        self._lock = threading.Lock()  # Guards the writes, lookups never take it
+        self._version = 0
+        self._changes: Deque[Tuple[int, int]] = deque(maxlen=CHANGE_LOG_SIZE)  # (version, row), row -1 = appended
+        self._on_ven_change = self._ven_changed  # Bound once, shared by every materialized Ven
+        for ven in ven_list:
+            self._attach(self._add_row(ven.name, ven.id, ven.registration_id, ven.fingerprint), ven)
+
+    @classmethod
+    def from_props(cls, ven_props: Iterable[VenProps], debug: bool = settings.core['DEBUG']) -> 'VenList':
+        """Builds the registry straight from VenProps (e.g. DB documents), without creating any `Ven`."""
+        ven_list = cls(debug=debug)
+        for props in ven_props:
+            ven_list._add_row(props['name'], props['id'], props['registration_id'], props['fingerprint'])
+        return ven_list
+
+    @classmethod
+    def gather(cls, ven_lists: Iterable['VenList'], keep: Callable[[str], bool],
+               debug: bool = settings.core['DEBUG']) -> 'VenList':
+        """
+        Builds a registry out of the VENs of `ven_lists` whose id satisfies `keep`, e.g. the
+        VENs a VTN shard owns after a rebalancing. Materialized VENs are moved over as they
+        are, with their client and connection state.
+        """
+        ven_list = cls(debug=debug)
+        for source in ven_lists:
+            columns = source._columns
+            for row, ven_id in enumerate(columns['id']):
+                if keep(ven_id):
+                    new_row = ven_list._add_row(columns['name'][row], ven_id, columns['registration_id'][row],
+                                                columns['fingerprint'][row])
+                    ven = source._instances[row]
+                    if ven is not None:
+                        ven_list._attach(new_row, ven)
+        return ven_list
+
+    def _add_row(self, name: str, ven_id: str, registration_id: str, fingerprint: str) -> int:
+        columns = self._columns
+        with self._lock:
+            row = len(self._instances)
+            columns['name'].append(name)
+            columns['id'].append(ven_id)
+            columns['registration_id'].append(registration_id)
+            columns['fingerprint'].append(fingerprint)
+            self._instances.append(None)
+            for key, index in self._indexes.items():
+                index.setdefault(columns[key][row], row)  # The first VEN wins on duplicates, as a scan would
+        return row
+
+    def _attach(self, row: int, ven: Ven) -> None:
+        ven._on_change = self._on_ven_change
+        self._instances[row] = ven
+
+    def _changed(self, row: int = -1) -> None:
+        with self._lock:
+            self._version += 1
+            self._changes.append((self._version, row))
+        # Safely clear the cached property if it exists, it is rebuilt lazily on next access
+        self.__dict__.pop("ven_props_list", None)
+
+    def _ven_changed(self, ven: Ven) -> None:
+        row = self._index('id').get(ven.id)
+        if row is None or self._instances[row] is not ven:  # Duplicated id, not the first row holding it
+            row = self._instances.index(ven)
+        self._changed(row)
+
+    def _ven(self, row: int) -> Ven:
+        ven = self._instances[row]
+        if ven is None:
+            columns = self._columns
+            ven = Ven({key: column[row] for key, column in columns.items()})
+            with self._lock:
+                if self._instances[row] is None:  # Another thread may have materialized it meanwhile
+                    self._attach(row, ven)
+                ven = self._instances[row]
+        return ven
+
+    def _index(self, key: str) -> Dict[str, int]:
+        index = self._indexes.get(key)
+        if index is None:
+            with self._lock:
+                index = {}
+                for row, value in enumerate(self._columns[key]):
+                    index.setdefault(value, row)
+                self._indexes[key] = index
+        return index
+
+    def _find(self, key: str, value: str) -> Ven | None:
+        row = self._index(key).get(value)
+        return None if row is None else self._ven(row)
+
+    @property
+    def version(self) -> int:
+        """Incremented whenever a VEN is added or one of them connects / disconnects."""
+        return self._version
+
+    def changes_since(self, version: int) -> Optional[List[int]]:
+        """
+        Rows whose VEN changed after `version` (VENs appended since then are not listed, they
+        are the rows past the length known at `version`).
+
+        Returns:
+            The changed rows, or None when the change log no longer goes back to `version`
+        """
+        if version == self._version:
+            return []
+        changes = list(self._changes)  # Copied at once, writers may append meanwhile
+        if not changes or changes[0][0] > version + 1:
+            return None
+        return sorted({row for changed_at, row in changes if changed_at > version and row >= 0})
+
+    def ven_props_at(self, row: int) -> VenProps:
+        """Same dict as `ven_props_list[row]`, without building the whole list."""
+        ven = self._instances[row]
+        ven_props = {key: column[row] for key, column in self._columns.items()}
+        ven_props['is_connected'] = ven is not None and ven.is_connected
+        return ven_props
 
     # Here I'm just experimenting with a cached property
     @cached_property
     def ven_props_list(self) -> List[VenProps]: # TODO VenProps union { 'is_connected': bool }
         """
         Computes and stores a cached version of the VEN list.
-        Whenever accessed, it returns a deep copy of the internal VEN list (ensure immutability).
+        Whenever accessed, it returns dicts built from the registry columns (ensure immutability).
 
-        @return: A deep copy of the internal VEN list
+        @return: A list of VenProps dicts with their connection state
         @rtype: list
         """
-        # return copy.deepcopy(self.__ven_list) @DEPRECATED remove deep copy to test another flow...
+        columns = self._columns
         return [
             {
-                'name': ven.name,
-                'id': ven.id,
-                'registration_id': ven.registration_id,
-                'fingerprint': ven.fingerprint,
-                'is_connected': ven.is_connected,
+                'name': name,
+                'id': ven_id,
+                'registration_id': registration_id,
+                'fingerprint': fingerprint,
+                'is_connected': ven is not None and ven.is_connected,
             }
-            for ven in self.__ven_list
+            for name, ven_id, registration_id, fingerprint, ven in zip(
+                columns['name'], columns['id'], columns['registration_id'], columns['fingerprint'], self._instances)
         ]
 
     def ven_instances(self) -> List[Ven]:
-        return self.__ven_list.copy() # Shallow Copy
+        return [self._ven(row) for row in range(len(self._instances))]
 
     def get_ids(self) -> List[str]:
-        return [ven.id for ven in self.__ven_list]
+        return self._columns['id'].copy()
 
     def get_names(self) -> List[str]:
-        return [ven.name for ven in self.__ven_list]
+        return self._columns['name'].copy()
 
     def find_by_id(self, ven_id: str) -> Ven | None:
-        return next((ven for ven in self.__ven_list if ven.id == ven_id), None)
+        return self._find('id', ven_id)
 
     def find_by_mame(self, ven_name: str) -> Ven | None:
-        return next((ven for ven in self.__ven_list if ven.name == ven_name), None)
+        return self._find('name', ven_name)
 
     def find_by_registration_id(self, registration_id: str) -> Ven | None:
-        return next((ven for ven in self.__ven_list if ven.registration_id == registration_id), None)
+        return self._find('registration_id', registration_id)
 
     def has_ven_with_id(self, id: str) -> bool:
-        return any(ven.id == id for ven in self.__ven_list)
+        return id in self._index('id')
 
     def has_ven_with_name(self, name: str) -> bool:
-        return any(ven.name == name for ven in self.__ven_list)
+        return name in self._index('name')
 
-    def append(self, ven: Ven) -> None:
-        self.__ven_list.append(ven)
+    def is_connected(self, ven_id: str) -> bool:
+        """Connection state of a VEN, without materializing it."""
+        row = self._index('id').get(ven_id)
+        ven = None if row is None else self._instances[row]
+        return ven is not None and ven.is_connected
 
-        # Safely clear the cached property if it exists
-        if "ven_props_list" in self.__dict__:
-            del self.__dict__["ven_props_list"]
+    def extend(self, vens: Iterable[Ven]) -> None:
+        """Appends many VENs at once, the cached `ven_props_list` is only invalidated once."""
+        initial_length = len(self)
+        for ven in vens:
+            self._attach(self._add_row(ven.name, ven.id, ven.registration_id, ven.fingerprint), ven)
+        self._changed()
 
-        new_count = len(self.ven_props_list)  # Computes and caches again
         if self.debug:
-            print(f"Adding VEN: {ven.name} at index {new_count - 1}")
+            print(f"Adding {len(self) - initial_length} VENs from index {initial_length}")
+
+    def append(self, ven: Ven) -> None:
+        row = self._add_row(ven.name, ven.id, ven.registration_id, ven.fingerprint)
+        self._attach(row, ven)
+        self._changed()
+
+        if self.debug:
+            print(f"Adding VEN: {ven.name} at index {row}")
 
     def __str__(self) -> str:
-        return f"VenList({len(self.__ven_list)} VENs)"
+        return f"VenList({len(self)} VENs)"
 
     def __len__(self) -> int:
-        return len(self.__ven_list)
+        return len(self._instances)
 
 
 def generate_ven_props(index: int = 0) -> VenProps:
@@ -198,6 +460,7 @@ def generate_ven_props(index: int = 0) -> VenProps:
         VenProps: A dictionary containing 'name', 'id', 'registration_id', and
         'fingerprint' keys.
     """
+    fake = _faker()
     current_timestamp = time.time()
     name = slugify(fake.name()).lower()
 
@@ -209,6 +472,57 @@ def generate_ven_props(index: int = 0) -> VenProps:
     }
 
 
+@lru_cache(maxsize=8)
+def _name_table(seed: int) -> List[str]:
+    rng = random.Random(seed)
+    first_names, last_names = list(FIRST_NAMES), list(LAST_NAMES)
+    rng.shuffle(first_names)
+    rng.shuffle(last_names)
+    return [f'{first_name}-{last_name}' for first_name in first_names for last_name in last_names]
+
+
+def generate_ven_props_batch(count: int, seed: int = 0, start: int = 0) -> List[VenProps]:
+    """
+    Generates `count` VenProps in bulk, for indexes `start` to `start + count - 1`.
+
+    Unlike `generate_ven_props` nothing goes through Faker: names come from precompiled
+    tables shuffled by `seed` (suffixed by the index so they stay unique) and the
+    fingerprints of FINGERPRINT_BLOCK consecutive indexes are sliced out of a single
+    SHAKE-256 digest. A given (seed, index) always produces the same VEN, whatever the
+    batch it is generated in.
+
+    Args:
+        count: Number of VENs to generate
+        seed: Seed of the name tables and of the fingerprints
+        start: Index of the first VEN
+
+    Returns:
+        A list of VenProps with unique names, ids, registration ids and fingerprints
+    """
+    names = _name_table(seed)
+    table_size = len(names)
+    end = start + count
+
+    ven_props = []
+    for block in range(start // FINGERPRINT_BLOCK, -(-end // FINGERPRINT_BLOCK)):
+        block_start = block * FINGERPRINT_BLOCK
+        fingerprints = hashlib.shake_256(f'{seed}:{block}'.encode()).hexdigest(32 * FINGERPRINT_BLOCK)
+        ven_props.extend({
+            'name': f'{names[index % table_size]}-{index}',
+            'id': generate_id(ID_PREFIX, index, 0),
+            'registration_id': generate_id(REGISTRATION_PREFIX, index, 0),
+            'fingerprint': fingerprints[(index - block_start) * 64:(index - block_start + 1) * 64],
+        } for index in range(max(start, block_start), min(end, block_start + FINGERPRINT_BLOCK)))
+    return ven_props
+
+
+def iter_ven_props_batches(count: int, seed: int = 0, start: int = 0,
+                           chunk_size: int = 10_000) -> Iterator[List[VenProps]]:
+    """Streams `generate_ven_props_batch(count, seed, start)` in chunks of at most `chunk_size` VENs."""
+    for chunk_start in range(start, start + count, chunk_size):
+        yield generate_ven_props_batch(min(chunk_size, start + count - chunk_start), seed, chunk_start)
+
+
 if __name__ == "__main__":
     """
     For learning purposes...
@@ -1,6 +1,17 @@
-from local_lib.models.domain import generate_ven_props
+import sys
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Optional, Tuple
+
+from local_lib.metrics import db_query_duration, db_query_cache
+from local_lib.models.domain import iter_ven_props_batches
+from local_lib.settings import settings
 from local_lib.utils.main import SingletonMeta, extract_values_from_dicts
 
+PROXY_SIZE = sys.getsizeof(MappingProxyType({}))
+
 
 def match_condition(doc, key, condition):
     if isinstance(condition, dict):
@@ -17,33 +28,253 @@ def match_condition(doc, key, condition):
     return doc.get(key) == condition  # $eq
 
 
+def _is_hashable(value):
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+def normalize_query(query) -> Optional[tuple]:
+    """
+    Hashable key of a find query, the same for equivalent queries whatever the order of their
+    keys and operators. None when the query holds an unhashable value (it cannot be cached).
+    """
+    if not query:
+        return ()
+    items = []
+    for key, condition in query.items():
+        if isinstance(condition, dict):
+            condition = ('$', tuple(sorted(condition.items(), key=lambda item: item[0])))
+        items.append((key, condition))
+    key = tuple(sorted(items, key=lambda item: item[0]))
+    return key if _is_hashable(key) else None
+
+
+class QueryCache:
+    """
+    LRU cache of the find results of one collection, capped in entries and in bytes. Every entry
+    belongs to the version of the collection it was computed at: the cache is cleared as soon as
+    a lookup or a store carries a newer version, results of an older version are never stored.
+
+    Results are tuples of read-only views of the documents, their size only accounts for the
+    tuple and the views, the documents themselves belong to the collection.
+    """
+
+    def __init__(self,
+                 max_entries: int = settings.db['query_cache']['max_entries'],
+                 max_bytes: int = settings.db['query_cache']['max_bytes']):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries: 'OrderedDict[tuple, Tuple[tuple, int]]' = OrderedDict()  # Least recently used first
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def result_size(result: tuple) -> int:
+        return sys.getsizeof(result) + len(result) * PROXY_SIZE
+
+    def _invalidate(self, version: int) -> None:
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self.bytes = 0
+        self.version = version
+
+    def get(self, key: tuple, version: int) -> Optional[tuple]:
+        with self._lock:
+            if version > self.version:
+                self._invalidate(version)
+            entry = self._entries.get(key) if version == self.version else None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: tuple, version: int, result: tuple) -> None:
+        size = self.result_size(result)
+        with self._lock:
+            if version < self.version or size > self.max_bytes:
+                return  # Written meanwhile, or too large to ever fit
+            if version > self.version:
+                self._invalidate(version)
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            self._entries[key] = (result, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+
 class InMemoryDB(metaclass=SingletonMeta):
-    def __init__(self):
+    def __init__(self, query_cache_collections=settings.db['query_cache']['collections']):
         self.collections = {}
+        self.indexes = {}  # {collection_name: {key: {value: [documents]}}}
+        self.versions = {}  # {collection_name: version}, bumped by every write
+        self.query_caches = {}  # {collection_name: QueryCache}
+        for collection_name in query_cache_collections:
+            self.enable_query_cache(collection_name)
 
-    def seed(self):
+    def seed(self, count=5, seed=0, chunk_size=10_000):
+        """Seeds the 'ven_props' collection with a deterministic fleet of `count` VENs, streamed in chunks."""
         self.create_collection('ven_props')
-        ven_props = [generate_ven_props(i) for i in range(5)]
-        [self.insert('ven_props', ven_prop) for ven_prop in ven_props]
+        for ven_props in iter_ven_props_batches(count, seed, chunk_size=chunk_size):
+            self.insert_many('ven_props', ven_props)
 
     def create_collection(self, name):
         if name not in self.collections:
             self.collections[name] = []
         return self.collections[name]
 
+    def enable_query_cache(self, collection_name, max_entries=settings.db['query_cache']['max_entries'],
+                           max_bytes=settings.db['query_cache']['max_bytes']):
+        """
+        Caches the results of the find queries on the collection until it is written to. Its
+        find results are then tuples of read-only views (MappingProxyType) of the documents,
+        shared by every caller of the same query (see `find`). The views are shallow: the
+        nested values of a document (lists, dicts) can still be mutated, which is not seen
+        by the cache.
+        """
+        if collection_name not in self.query_caches:
+            self.query_caches[collection_name] = QueryCache(max_entries, max_bytes)
+        return self.query_caches[collection_name]
+
+    def disable_query_cache(self, collection_name):
+        self.query_caches.pop(collection_name, None)
+
+    def query_cache_stats(self):
+        return {collection_name: cache.stats() for collection_name, cache in self.query_caches.items()}
+
+    def _bump_version(self, collection_name):
+        self.versions[collection_name] = self.versions.get(collection_name, 0) + 1
+
+    def create_index(self, collection_name, key):
+        """
+        Creates a hash index on `key` so that equality queries on it no longer scan the
+        whole collection. Documents whose value for `key` is unhashable are not indexed.
+        """
+        self.create_collection(collection_name)
+        collection_indexes = self.indexes.setdefault(collection_name, {})
+        if key not in collection_indexes:
+            collection_indexes[key] = {}
+            self._rebuild_indexes(collection_name)
+        return key
+
+    def drop_index(self, collection_name, key):
+        self.indexes.get(collection_name, {}).pop(key, None)
+
+    def _rebuild_indexes(self, collection_name):
+        for key, index in self.indexes.get(collection_name, {}).items():
+            index.clear()
+            for doc in self.collections[collection_name]:
+                self._index_document(index, key, doc)
+
+    @staticmethod
+    def _index_document(index, key, doc):
+        value = doc.get(key)
+        if _is_hashable(value):
+            index.setdefault(value, []).append(doc)
+
+    def _candidates(self, collection_name, query):
+        """Returns the smallest known superset of documents matching `query`."""
+        collection_indexes = self.indexes.get(collection_name)
+        if collection_indexes:
+            for key, condition in query.items():
+                if key in collection_indexes and not isinstance(condition, dict) and _is_hashable(condition):
+                    return collection_indexes[key].get(condition, [])
+        return self.collections[collection_name]
+
     def insert(self, collection_name, document):
+        started_at = time.perf_counter()
         if collection_name not in self.collections:
             self.create_collection(collection_name)
         self.collections[collection_name].append(document)
+        for key, index in self.indexes.get(collection_name, {}).items():
+            self._index_document(index, key, document)
+        self._bump_version(collection_name)
+        db_query_duration.observe(time.perf_counter() - started_at, collection_name, 'insert')
         return document
 
+    def insert_many(self, collection_name, documents):
+        started_at = time.perf_counter()
+        collection = self.create_collection(collection_name)
+        first_inserted = len(collection)
+        collection.extend(documents)
+        inserted = collection[first_inserted:]
+        for key, index in self.indexes.get(collection_name, {}).items():
+            for doc in inserted:
+                self._index_document(index, key, doc)
+        if inserted:
+            self._bump_version(collection_name)
+        db_query_duration.observe(time.perf_counter() - started_at, collection_name, 'insert_many')
+        return len(inserted)
+
     def find(self, collection_name, query=None):
+        """
+        The documents of the collection matching `query`, all of them when None.
+
+        The result depends on the collection: a list of the documents themselves, or a tuple
+        of read-only views (MappingProxyType) of them once its query cache is enabled (see
+        `enable_query_cache`). Callers must only iterate, index and read the documents;
+        copy them (`dict(doc)`) to modify or serialize them.
+        """
+        started_at = time.perf_counter()
+        try:
+            cache = self.query_caches.get(collection_name)
+            if cache is not None and collection_name in self.collections:
+                return self._find_cached(cache, collection_name, query)
+            return self._find(collection_name, query)
+        finally:
+            db_query_duration.observe(time.perf_counter() - started_at, collection_name, 'find')
+
+    def _find_cached(self, cache, collection_name, query=None):
+        key = normalize_query(query)
+        if key is None:
+            db_query_cache.inc(collection_name, 'bypass')
+            return tuple(map(MappingProxyType, self._find(collection_name, query)))
+
+        version = self.versions.get(collection_name, 0)  # Read first, a write meanwhile makes the result stale
+        result = cache.get(key, version)
+        if result is not None:
+            db_query_cache.inc(collection_name, 'hit')
+            return result
+        db_query_cache.inc(collection_name, 'miss')
+        result = tuple(map(MappingProxyType, self._find(collection_name, query)))
+        cache.put(key, version, result)
+        return result
+
+    def _find(self, collection_name, query=None):
         if collection_name not in self.collections:
             return []
         if query is None:
             return self.collections[collection_name]
 
-        return [doc for doc in self.collections[collection_name]
+        return [doc for doc in self._candidates(collection_name, query)
                 if all(match_condition(doc, k, v) for k, v in query.items())]
 
     def find_one(self, collection_name, query=None):
@@ -51,24 +282,38 @@ class InMemoryDB(metaclass=SingletonMeta):
         return doc if doc else None
 
     def update(self, collection_name, query, update_data):
-        documents = self.find(collection_name, query)
+        started_at = time.perf_counter()
+        documents = self._find(collection_name, query)
         for doc in documents:
             doc.update(update_data)
+        if documents:
+            self._bump_version(collection_name)
+        if documents and any(key in update_data for key in self.indexes.get(collection_name, {})):
+            self._rebuild_indexes(collection_name)
+        db_query_duration.observe(time.perf_counter() - started_at, collection_name, 'update')
         return len(documents)
 
     def delete(self, collection_name, query):
         if collection_name not in self.collections:
             return 0
+        started_at = time.perf_counter()
         initial_length = len(self.collections[collection_name])
         self.collections[collection_name] = [
             doc for doc in self.collections[collection_name]
             if not all(doc.get(k) == v for k, v in query.items())
         ]
-        return initial_length - len(self.collections[collection_name])
+        deleted_count = initial_length - len(self.collections[collection_name])
+        if deleted_count:
+            self._rebuild_indexes(collection_name)
+            self._bump_version(collection_name)
+        db_query_duration.observe(time.perf_counter() - started_at, collection_name, 'delete')
+        return deleted_count
 
     def drop_collection(self, collection_name):
         if collection_name in self.collections:
             del self.collections[collection_name]
+            self._bump_version(collection_name)
+        self.indexes.pop(collection_name, None)
 
     def list_collections(self):
         return list(self.collections.keys())
@@ -0,0 +1,265 @@
+import cProfile
+import functools
+import inspect
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Callable, Awaitable
+
+from local_lib.metrics import registry
+from local_lib.settings import settings
+from local_lib.utils.main import SingletonMeta
+
+handler_duration = registry.histogram(
+    'profiled_handler_duration_seconds', 'Wall time of the profiled handlers', ('handler',))
+
+SORT_KEYS = tuple(key.value for key in pstats.SortKey)
+
+
+class _HandlerProfile:
+    """Everything collected for one handler: call counts, cProfile stats and stack samples."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.profiled_calls = 0
+        self.stats: Optional[pstats.Stats] = None
+        self.stacks: Counter = Counter()
+
+    def summary(self) -> dict:
+        return {
+            'calls': self.calls,
+            'profiled_calls': self.profiled_calls,
+            'stack_samples': sum(self.stacks.values()),
+            'duration_count': handler_duration.count(self.name),
+        }
+
+
+class _Segment:
+    """Marks a handler as running on the current thread, optionally under cProfile."""
+    __slots__ = ('profiler', 'name', 'profile', 'profiling')
+
+    def __init__(self, profiler: 'HandlerProfiler', name: str, profile: Optional[cProfile.Profile]):
+        self.profiler = profiler
+        self.name = name
+        self.profile = profile
+        self.profiling = False
+
+    def __enter__(self):
+        self.profiler._active.setdefault(threading.get_ident(), []).append(self.name)
+        # Only one cProfile may be active per thread, a nested segment is left to the sampler
+        if self.profile is not None and not getattr(self.profiler._cprofile_active, 'value', False):
+            self.profiling = self.profiler._cprofile_active.value = True
+            self.profile.enable()
+
+    def __exit__(self, *exc_info):
+        if self.profiling:
+            self.profile.disable()
+            self.profiling = self.profiler._cprofile_active.value = False
+        self.profiler._active[threading.get_ident()].pop()
+
+
+class _Profiled:
+    """
+    Awaitable stepping a coroutine by hand so that profiling (cProfile and the stack
+    sampler) only covers the handler's own execution, not the other tasks the event
+    loop runs while the handler is suspended.
+    """
+
+    def __init__(self, profiler: 'HandlerProfiler', name: str, coroutine, use_cprofile: bool):
+        self._profiler = profiler
+        self._name = name
+        self._coroutine = coroutine
+        self._use_cprofile = use_cprofile
+
+    def __await__(self):
+        profile = cProfile.Profile() if self._use_cprofile else None
+        started_at = time.perf_counter()
+        value, error = None, None
+        try:
+            while True:
+                with _Segment(self._profiler, self._name, profile):
+                    try:
+                        if error is not None:
+                            yielded = self._coroutine.throw(error)
+                        else:
+                            yielded = self._coroutine.send(value)
+                    except StopIteration as stop:
+                        return stop.value
+                try:
+                    value, error = (yield yielded), None
+                except GeneratorExit:
+                    self._coroutine.close()
+                    raise
+                except BaseException as exc:
+                    value, error = None, exc
+        finally:
+            self._profiler._finish(self._name, started_at, profile)
+
+
+class HandlerProfiler(metaclass=SingletonMeta):
+    """
+    Opt-in profiler for the OpenADR handlers, enabled with OPEN_KICK__CORE__PROFILE.
+
+    Every call of a wrapped handler is timed. One call out of `sample_every` also runs
+    under cProfile, and a sampler thread records the stack of every thread running a
+    wrapped handler every `stack_interval` seconds. Results are available per handler as
+    collapsed stacks (flamegraph.pl / speedscope) or as a marshalled pstats dump.
+    """
+
+    def __init__(self,
+                 enabled: bool = settings.core['PROFILE'],
+                 sample_every: int = settings.profiling['sample_every'],
+                 stack_interval: float = settings.profiling['stack_interval']):
+        self.enabled = enabled
+        self.sample_every = max(sample_every, 1)
+        self.stack_interval = stack_interval
+        self._profiles: Dict[str, _HandlerProfile] = {}
+        self._active: Dict[int, List[str]] = {}  # thread ident -> handlers running on that thread
+        self._cprofile_active = threading.local()
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+
+    def _profile(self, name: str) -> _HandlerProfile:
+        profile = self._profiles.get(name)
+        if profile is None:
+            with self._lock:
+                profile = self._profiles.setdefault(name, _HandlerProfile(name))
+        return profile
+
+    def _should_cprofile(self, profile: _HandlerProfile) -> bool:
+        return profile.calls % self.sample_every == 0 and not getattr(self._cprofile_active, 'value', False)
+
+    def _finish(self, name: str, started_at: float, profile: Optional[cProfile.Profile]) -> None:
+        handler_duration.observe(time.perf_counter() - started_at, name)
+        if profile is None:
+            return
+        handler_profile = self._profile(name)
+        with self._lock:
+            handler_profile.profiled_calls += 1
+            if handler_profile.stats is None:
+                handler_profile.stats = pstats.Stats(profile)
+            else:
+                handler_profile.stats.add(profile)
+
+    def profile_awaitable(self, name: str, coroutine, cprofile: bool = True) -> Awaitable:
+        """
+        Profiles an already created coroutine. Pass `cprofile=False` for outer scopes (e.g. the
+        handling of a whole OpenADR message) so the handlers they call keep their cProfile sample.
+        """
+        profile = self._profile(name)
+        use_cprofile = cprofile and self._should_cprofile(profile)
+        profile.calls += 1
+        return _Profiled(self, name, coroutine, use_cprofile)
+
+    def wrap(self, name: str, func: Callable) -> Callable:
+        """
+        Wraps a handler (sync or async) with the profiling hooks. Returns `func` untouched
+        when profiling is disabled, so the wrapped handlers cost nothing by default.
+        """
+        if not self.enabled:
+            return func
+        self.start()
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await self.profile_awaitable(name, func(*args, **kwargs))
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = self._profile(name)
+            cprofile = cProfile.Profile() if self._should_cprofile(profile) else None
+            profile.calls += 1
+            started_at = time.perf_counter()
+            try:
+                with _Segment(self, name, cprofile):
+                    return func(*args, **kwargs)
+            finally:
+                self._finish(name, started_at, cprofile)
+
+        return wrapper
+
+    def start(self) -> None:
+        """Starts the stack sampler thread."""
+        with self._lock:
+            if self._sampler is not None and self._sampler.is_alive():
+                return
+            self._sampler = threading.Thread(target=self._sample, name='handler-profiler', daemon=True)
+            self._sampler.start()
+
+    def _sample(self) -> None:
+        while True:
+            time.sleep(self.stack_interval)
+            active = {ident: list(names) for ident, names in list(self._active.items()) if names}
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for ident, names in active.items():
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = collapse_stack(frame)
+                for name in set(names):
+                    self._profile(name).stacks[stack] += 1
+
+    def handlers(self) -> Dict[str, dict]:
+        return {name: profile.summary() for name, profile in sorted(self._profiles.items())}
+
+    def collapsed(self, name: str) -> Optional[str]:
+        """Collapsed stacks ('root;...;leaf count' per line) of a handler, None if unknown."""
+        profile = self._profiles.get(name)
+        if profile is None:
+            return None
+        return ''.join(f'{stack} {count}\n' for stack, count in profile.stacks.most_common())
+
+    def pstats_dump(self, name: str) -> Optional[bytes]:
+        """Marshalled cProfile stats of a handler, loadable with `pstats.Stats(path)`."""
+        profile = self._profiles.get(name)
+        if profile is None or profile.stats is None:
+            return None
+        with self._lock:
+            return marshal.dumps(profile.stats.stats)
+
+    def top(self, name: str, sort: str = 'cumulative', limit: int = 30) -> Optional[str]:
+        """
+        The `limit` top functions of a handler, sorted by one of SORT_KEYS.
+
+        Raises:
+            ValueError: If `sort` is not one of SORT_KEYS
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Unknown sort key '{sort}', expected one of {', '.join(SORT_KEYS)}")
+        profile = self._profiles.get(name)
+        if profile is None or profile.stats is None:
+            return None
+        stream = io.StringIO()
+        with self._lock:
+            previous_stream = profile.stats.stream
+            profile.stats.stream = stream
+            try:
+                profile.stats.sort_stats(sort).print_stats(limit)
+            finally:
+                profile.stats.stream = previous_stream
+        return stream.getvalue()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._profiles.clear()
+
+
+def collapse_stack(frame) -> str:
+    entries = []
+    while frame is not None:
+        code = frame.f_code
+        entries.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(entries))
+
@@ -12,13 +12,20 @@ default_protocol = RequestProtocol.HTTP.value
 class Settings(metaclass=SingletonMeta):
     def __init__(self):
         DEBUG = os.getenv("OPEN_KICK__CORE__DEBUG", "false").lower() == "true"
+        PROFILE = os.getenv("OPEN_KICK__CORE__PROFILE", "false").lower() == "true"
         stage = os.environ.get("OPEN_KICK__STAGE", "local").lower()  # local | dev | staging | prod...
 
         self.core = {
             'DEBUG': DEBUG,
+            'PROFILE': PROFILE,  # Wraps the OpenADR handlers with profiling hooks, see local_lib/profiling.py
             'stage': stage,
         }
 
+        self.profiling = {
+            'sample_every': int(os.environ.get("OPEN_KICK__PROFILING__SAMPLE_EVERY", 10)),  # 1 call out of N runs under cProfile
+            'stack_interval': float(os.environ.get("OPEN_KICK__PROFILING__STACK_INTERVAL", 0.005)),  # seconds
+        }
+
         fast_api_host = os.environ.get("OPEN_KICK__FAST_API__LOCATION__HOST", "0.0.0.0").lower()
         fast_api_hostname = os.environ.get("OPEN_KICK__FAST_API__LOCATION__HOSTNAME", "fast-api").lower()
         fast_api_wan_protocol = os.environ.get("OPEN_KICK__FAST_API__LOCATION__WAN_PROTOCOL", default_protocol).lower()
@@ -28,6 +35,12 @@ class Settings(metaclass=SingletonMeta):
 
         self.fast_api = {
             'title': fast_api_id,
+            # > 1 serves the API from that many processes reading a shared-memory snapshot of the VTN state
+            'workers': int(os.environ.get("OPEN_KICK__FAST_API__WORKERS", 1)),
+            'snapshot': {
+                'size': int(os.environ.get("OPEN_KICK__FAST_API__SNAPSHOT__SIZE", 64 * 1024 * 1024)),  # bytes
+                'interval': float(os.environ.get("OPEN_KICK__FAST_API__SNAPSHOT__INTERVAL", 0.05)),  # seconds
+            },
             'location': {
                 'port': fast_api_port,
                 'host': fast_api_host,
@@ -44,6 +57,7 @@ class Settings(metaclass=SingletonMeta):
         vtn_lan_protocol = os.environ.get("OPEN_KICK__VTN__LOCATION__LAN_PROTOCOL", default_protocol).lower()
         vtn_port = int(os.environ.get("OPEN_KICK__VTN__LOCATION__PORT", 8080))
         vtn_id = os.environ.get("OPEN_KICK__VTN__ID", vtn_hostname).lower()
+        vtn_shard_count = int(os.environ.get("OPEN_KICK__VTN__SHARDS", 1))
 
         self.vtn = {
             'id': os.environ.get("OPEN_KICK__VTN__ID", vtn_hostname).lower(),
@@ -54,6 +68,15 @@ class Settings(metaclass=SingletonMeta):
                 'wan': f'{vtn_wan_protocol}://{vtn_hostname}{(":" + str(vtn_port)) if vtn_port else ""}',
                 'lan': f'{vtn_lan_protocol}://localhost{(":" + str(vtn_port)) if vtn_port else ""}',
             },
+            'event_ledger_size': int(os.environ.get("OPEN_KICK__VTN__EVENT_LEDGER_SIZE", 1000)),  # Events kept by the VTN
+            # Rendered XML of the events sent from templates, kept per event state, see vtn_fast_api/event_templates.py
+            'event_fragment_cache_size': int(os.environ.get("OPEN_KICK__VTN__EVENT_FRAGMENT_CACHE_SIZE", 256)),
+            # One OpenADR server per shard, on consecutive ports from OPEN_KICK__VTN__LOCATION__PORT
+            'shards': [
+                self.vtn_shard(vtn_id if vtn_shard_count == 1 else f'{vtn_id}-{index}', vtn_port + index)
+                for index in range(vtn_shard_count)
+            ],
+            'virtual_nodes': int(os.environ.get("OPEN_KICK__VTN__VIRTUAL_NODES", 256)),  # Ring points per shard
             'OpenADRServerOptions': {
                 'vtn_id': vtn_id,
                 'http_host': vtn_host,
@@ -63,6 +86,72 @@ class Settings(metaclass=SingletonMeta):
             }
         }
 
+        # Result cache of the InMemoryDB find queries, per collection, see local_lib/models/in_memory_db.py
+        self.db = {
+            'query_cache': {
+                # Comma separated collections whose find results are cached, none when empty
+                'collections': tuple(name for name in
+                                     os.environ.get("OPEN_KICK__DB__QUERY_CACHE__COLLECTIONS", "").split(',') if name),
+                'max_entries': int(os.environ.get("OPEN_KICK__DB__QUERY_CACHE__MAX_ENTRIES", 1024)),  # per collection
+                'max_bytes': int(os.environ.get("OPEN_KICK__DB__QUERY_CACHE__MAX_BYTES", 16 * 1024 * 1024)),
+            },
+        }
+
+        # Admission control of the registration storms, per VTN shard, see local_lib/admission.py
+        self.admission = {
+            'enabled': os.environ.get("OPEN_KICK__ADMISSION__ENABLED", "true").lower() == "true",
+            'services': tuple(os.environ.get("OPEN_KICK__ADMISSION__SERVICES", "EiRegisterParty,OadrPoll").split(',')),
+            'rate': float(os.environ.get("OPEN_KICK__ADMISSION__RATE", 500)),  # messages per second
+            'burst': float(os.environ.get("OPEN_KICK__ADMISSION__BURST", 1000)),
+            'ven_rate': float(os.environ.get("OPEN_KICK__ADMISSION__VEN_RATE", 1)),  # messages per second and VEN
+            'ven_burst': float(os.environ.get("OPEN_KICK__ADMISSION__VEN_BURST", 10)),
+            'max_concurrency': int(os.environ.get("OPEN_KICK__ADMISSION__MAX_CONCURRENCY", 32)),  # messages in flight
+            'max_queue': int(os.environ.get("OPEN_KICK__ADMISSION__MAX_QUEUE", 512)),  # messages waiting for a slot
+            'queue_timeout': float(os.environ.get("OPEN_KICK__ADMISSION__QUEUE_TIMEOUT", 2.0)),  # seconds
+            'max_tracked_vens': int(os.environ.get("OPEN_KICK__ADMISSION__MAX_TRACKED_VENS", 100_000)),
+        }
+
+        # Append-only log of the OpenADR traffic of the VTN, replayed by benchmarks.replay, see local_lib/traffic_log.py
+        self.capture = {
+            'path': os.environ.get("OPEN_KICK__CAPTURE__PATH", ""),  # Capture disabled when empty
+            # Comma separated OpenADR services to capture, every service when empty
+            'services': tuple(service for service in os.environ.get("OPEN_KICK__CAPTURE__SERVICES", "").split(',')
+                              if service),
+            'compress': os.environ.get("OPEN_KICK__CAPTURE__COMPRESS", "true").lower() == "true",  # zlib bodies
+        }
+
+        # Reconnection of the VEN clients rejected by the VTN (jittered exponential backoff)
+        self.ven = {
+            'backoff_base': float(os.environ.get("OPEN_KICK__VEN__BACKOFF_BASE", 0.5)),  # seconds
+            'backoff_cap': float(os.environ.get("OPEN_KICK__VEN__BACKOFF_CAP", 30.0)),  # seconds
+            # Runs every VEN client on one loop thread sharing a connection pool, see local_lib/ven_fleet.py
+            'fleet_mode': os.environ.get("OPEN_KICK__VEN__FLEET_MODE", "false").lower() == "true",
+            'pool': {
+                'limit': int(os.environ.get("OPEN_KICK__VEN__POOL__LIMIT", 100)),  # connections, 0 for no limit
+                'limit_per_host': int(os.environ.get("OPEN_KICK__VEN__POOL__LIMIT_PER_HOST", 0)),  # 0 for no limit
+                'keepalive_timeout': float(os.environ.get("OPEN_KICK__VEN__POOL__KEEPALIVE_TIMEOUT", 30.0)),  # seconds
+            },
+        }
+
+        self.health = {
+            'interval': float(os.environ.get("OPEN_KICK__HEALTH__INTERVAL", 1.0)),  # seconds between loop probes
+            'stall_threshold': float(os.environ.get("OPEN_KICK__HEALTH__STALL_THRESHOLD", 0.25)),  # seconds
+            'max_samples': int(os.environ.get("OPEN_KICK__HEALTH__MAX_SAMPLES", 20)),  # stack samples kept per loop
+        }
+
+    @staticmethod
+    def vtn_shard(shard_id: str, port: int) -> dict:
+        """Location of a VTN shard, VENs are spread over the shards by consistent hashing of their id."""
+        hostname = os.environ.get("OPEN_KICK__VTN__LOCATION__HOSTNAME", "vtn").lower()
+        wan_protocol = os.environ.get("OPEN_KICK__VTN__LOCATION__WAN_PROTOCOL", default_protocol).lower()
+        lan_protocol = os.environ.get("OPEN_KICK__VTN__LOCATION__LAN_PROTOCOL", default_protocol).lower()
+        return {
+            'id': shard_id,
+            'port': port,
+            'wan': f'{wan_protocol}://{hostname}:{port}',
+            'lan': f'{lan_protocol}://localhost:{port}',
+        }
+
     @property
     def fast_api_url(self) -> str:
         lan_url = self.fast_api["location"]["lan"]
@@ -75,6 +164,9 @@ class Settings(metaclass=SingletonMeta):
         wan_url = self.vtn["location"]["wan"]
         return lan_url if self.core['stage'] == 'local' else wan_url
 
+    def vtn_shard_url(self, shard: dict) -> str:
+        return shard['lan'] if self.core['stage'] == 'local' else shard['wan']
+
 
 # Singleton pattern — one shared instance
 settings = Settings()
@@ -0,0 +1,148 @@
+"""
+Append-only binary log of the OpenADR traffic received by the VTN, replayed by benchmarks.replay.
+
+    file    MAGIC, then one record per message
+    record  RECORD header, little-endian (21 bytes):
+                received_at_ns  uint64  wall clock time the message was received
+                duration_us     uint32  time the VTN took to answer it
+                status          uint16  HTTP status of the answer
+                flags           uint8   FLAG_ZLIB when the body is zlib compressed
+                service_length  uint8
+                shard_length    uint8
+                body_length     uint32
+            followed by the service (EiRegisterParty, OadrPoll...), the id of the VTN shard
+            that received the message and the body as the VEN sent it
+
+Records are appended once the message is answered, so they are not strictly ordered by
+reception time: `read_traffic_log` returns them in file order, sort on `received_at_ns`.
+A record cut short (the process died while writing it) ends the log, a writer reopening the
+log truncates it there before appending.
+"""
+import atexit
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import NamedTuple, Iterator
+
+MAGIC = b'OKTRAF01'
+RECORD = struct.Struct('<QIHBBBI')
+FLAG_ZLIB = 0x01
+MAX_DURATION_US = 0xFFFFFFFF
+
+
+class TrafficRecord(NamedTuple):
+    received_at_ns: int
+    duration_us: int
+    status: int
+    service: str
+    shard: str
+    body: bytes
+
+
+class TrafficLogWriter:
+    """
+    Appends records to a traffic log, shared by the threads of the VTN shards. Writes are
+    buffered and flushed every `flush_interval` seconds, on `close` and at exit. Appending to
+    an existing log keeps its complete records and drops a record cut short.
+
+    Raises:
+        ValueError: If `path` exists and is not a traffic log
+    """
+
+    def __init__(self, path: str, compress: bool = True, flush_interval: float = 1.0, buffer_size: int = 1 << 20):
+        self.path = path
+        self.compress = compress
+        self.flush_interval = flush_interval
+        self.records = 0
+        self._lock = threading.Lock()
+
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not is_new:
+            with open(path, 'r+b') as file:
+                if file.read(len(MAGIC)) != MAGIC:
+                    raise ValueError(f'{path} is not a traffic log')
+                file.truncate(_complete_length(file))
+        self._file = open(path, 'ab', buffering=buffer_size)
+        if is_new:
+            self._file.write(MAGIC)
+        self._flushed_at = time.monotonic()
+        atexit.register(self.close)
+
+    def write(self, received_at_ns: int, duration_us: int, status: int, service: str, shard: str,
+              body: bytes) -> None:
+        flags = 0
+        if self.compress:
+            compressed = zlib.compress(body, 1)
+            if len(compressed) < len(body):
+                body, flags = compressed, FLAG_ZLIB
+        service_bytes = service.encode('utf-8')[:255]
+        shard_bytes = shard.encode('utf-8')[:255]
+        header = RECORD.pack(received_at_ns, min(duration_us, MAX_DURATION_US), status, flags, len(service_bytes),
+                             len(shard_bytes), len(body))
+
+        with self._lock:
+            if self._file.closed:
+                return  # Messages still answered while the process exits
+            self._file.write(b''.join((header, service_bytes, shard_bytes, body)))
+            self.records += 1
+            now = time.monotonic()
+            if now - self._flushed_at >= self.flush_interval:
+                self._file.flush()
+                self._flushed_at = now
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+def _complete_length(file) -> int:
+    """Length of the complete records of a traffic log, `file` is positioned after MAGIC."""
+    size = os.fstat(file.fileno()).st_size
+    end = file.tell()
+    while True:
+        header = file.read(RECORD.size)
+        if len(header) < RECORD.size:
+            return end
+        *_, service_length, shard_length, body_length = RECORD.unpack(header)
+        record_end = end + RECORD.size + service_length + shard_length + body_length
+        if record_end > size:
+            return end
+        end = file.seek(record_end)
+
+
+def read_traffic_log(path: str) -> Iterator[TrafficRecord]:
+    """
+    Reads the records of a traffic log, in file order.
+
+    Raises:
+        ValueError: If `path` is not a traffic log
+    """
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a traffic log')
+        while True:
+            header = file.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            received_at_ns, duration_us, status, flags, service_length, shard_length, body_length = \
+                RECORD.unpack(header)
+            payload = file.read(service_length + shard_length + body_length)
+            if len(payload) < service_length + shard_length + body_length:
+                return
+            body = payload[service_length + shard_length:]
+            yield TrafficRecord(
+                received_at_ns,
+                duration_us,
+                status,
+                payload[:service_length].decode('utf-8'),
+                payload[service_length:service_length + shard_length].decode('utf-8'),
+                zlib.decompress(body) if flags & FLAG_ZLIB else body,
+            )
@@ -0,0 +1,192 @@
+"""
+Connections of the simulated VEN clients to the VTN.
+
+By default every VEN client runs its own thread and event loop, and opens its own aiohttp
+session and connection pool: thousands of simulated VENs hold thousands of threads and
+sockets. In fleet mode (OPEN_KICK__VEN__FLEET_MODE) the clients of the process share one loop
+thread and one keep-alive connection pool (OPEN_KICK__VEN__POOL__*), each client only holds a
+session on top of it.
+
+In both modes the sessions are traced: the connections opened (a TCP handshake each, plus a
+TLS one over https), those reused from the pool and their setup time are reported along with
+the file descriptors and sockets of the process by `fleet_stats`.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Optional, Set, Deque, Coroutine
+
+from local_lib.health import HealthMonitor
+from local_lib.metrics import registry
+from local_lib.settings import settings
+from local_lib.utils.main import SingletonMeta
+
+SETUP_SAMPLES = 1024  # Latest connection setup times kept for the percentiles of fleet_stats
+
+ven_connections = registry.counter(
+    'ven_connections_total', 'Connections of the VEN clients to the VTN, by outcome (created, reused)', ('outcome',))
+ven_tls_handshakes = registry.counter(
+    'ven_tls_handshakes_total', 'TLS handshakes of the VEN clients with the VTN')
+ven_connection_setup = registry.histogram(
+    'ven_connection_setup_seconds', 'Time a VEN client takes to open a connection to the VTN')
+
+_setup_samples: Deque[float] = deque(maxlen=SETUP_SAMPLES)
+
+
+@lru_cache(maxsize=None)
+def _trace_config():
+    """Counts the connections of the sessions opened by `open_session`, shared by all of them."""
+    import aiohttp  # Only loaded once a VEN connects
+
+    async def on_request_start(session, context, params):
+        context.tls = params.url.scheme == 'https'
+
+    async def on_connection_create_start(session, context, params):
+        context.connect_started_at = time.perf_counter()
+
+    async def on_connection_create_end(session, context, params):
+        elapsed = time.perf_counter() - context.connect_started_at
+        ven_connections.inc('created')
+        ven_connection_setup.observe(elapsed)
+        _setup_samples.append(elapsed)
+        if context.tls:
+            ven_tls_handshakes.inc()
+
+    async def on_connection_reuseconn(session, context, params):
+        ven_connections.inc('reused')
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    return trace_config
+
+
+def open_session(connector=None):
+    """
+    A traced aiohttp session configured like the one openleadr opens for its client. Opened on
+    `connector` when given, which is shared and then left open when the session closes.
+    """
+    import aiohttp
+
+    return aiohttp.ClientSession(
+        connector=connector,
+        connector_owner=connector is None,
+        headers={'content-type': 'application/xml'},
+        timeout=aiohttp.ClientTimeout(sock_connect=5, sock_read=10),
+        trace_configs=[_trace_config()],
+    )
+
+
+def process_stats() -> dict:
+    """Threads, open file descriptors and sockets of the process (None where /proc is not available)."""
+    stats = {'threads': threading.active_count(), 'fds': None, 'sockets': None}
+    try:
+        fds = os.listdir('/proc/self/fd')
+    except OSError:
+        return stats
+    sockets = 0
+    for fd in fds:
+        try:
+            sockets += os.readlink(f'/proc/self/fd/{fd}').startswith('socket:')
+        except OSError:
+            pass  # Closed meanwhile
+    stats.update(fds=len(fds), sockets=sockets)
+    return stats
+
+
+class VenFleet(metaclass=SingletonMeta):
+    """
+    Keeps track of the VEN clients of the process and, in fleet mode, runs the event loop and
+    the connection pool they share. The loop thread and the pool are only started by the first
+    client, the pool keeps idle connections open for `keepalive_timeout` seconds.
+    """
+
+    def __init__(self,
+                 limit: int = settings.ven['pool']['limit'],
+                 limit_per_host: int = settings.ven['pool']['limit_per_host'],
+                 keepalive_timeout: float = settings.ven['pool']['keepalive_timeout']):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._connector = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._clients: Set[str] = set()
+
+    @property
+    def clients(self) -> int:
+        return len(self._clients)
+
+    def attach(self, ven_id: str) -> None:
+        self._clients.add(ven_id)
+
+    def detach(self, ven_id: str) -> None:
+        self._clients.discard(ven_id)
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        """Starts the shared loop thread and connection pool unless running, returns the loop."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                ready = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(ready,), name='ven-fleet', daemon=True)
+                self._thread.start()
+                ready.wait()
+                HealthMonitor().register_thread('ven-fleet', self._thread)
+        return self._loop
+
+    def _run(self, ready: threading.Event) -> None:
+        import aiohttp
+
+        async def create_connector():
+            return aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                        keepalive_timeout=self.keepalive_timeout)
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._connector = loop.run_until_complete(create_connector())
+        self._loop = loop
+        HealthMonitor().register_loop('ven-fleet', loop)
+        ready.set()
+        loop.run_forever()
+
+    def session(self):
+        """A session on the shared connection pool, to be opened on the shared loop."""
+        return open_session(self._connector)
+
+    def submit(self, coroutine: Coroutine) -> Future:
+        """Runs `coroutine` on the shared loop, started if needed."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.start())
+
+    def pool_stats(self) -> Optional[dict]:
+        if self._connector is None:
+            return None
+        return {'limit': self.limit, 'limit_per_host': self.limit_per_host, 'keepalive_timeout': self.keepalive_timeout}
+
+
+def fleet_stats() -> dict:
+    """Connection usage of the VEN clients of the process, see the module docstring."""
+    samples = sorted(_setup_samples)
+    fleet = VenFleet()
+
+    def percentile(fraction: float) -> Optional[float]:
+        return round(samples[min(len(samples) - 1, int(fraction * len(samples)))], 6) if samples else None
+
+    return {
+        'mode': 'fleet' if settings.ven['fleet_mode'] else 'threads',
+        'clients': fleet.clients,
+        'pool': fleet.pool_stats(),
+        'connections': {
+            'created': int(ven_connections.value('created')),
+            'reused': int(ven_connections.value('reused')),
+            'tls_handshakes': int(ven_tls_handshakes.value()),
+        },
+        'connection_setup_s': {'p50': percentile(0.5), 'p99': percentile(0.99), 'max': percentile(1.0)},
+        **process_stats(),
+    }
@@ -1,16 +1,10 @@
 import asyncio
-import time
+from local_lib.health import HealthMonitor
 from local_lib.models.in_memory_db import InMemoryDB
 from vtn_fast_api.api_service import APIService
 from vtn_fast_api.vtn_service import VTNService
 
 
-def health_check_loop():
-    # TODO implement health check
-    while True:
-        time.sleep(10)  # pause 10 second each loop
-
-
 if __name__ == "__main__":
     db = InMemoryDB()
     db.seed()
@@ -26,5 +20,5 @@ if __name__ == "__main__":
     # Prevent the main process from exiting since both servers are running in the background
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
-    loop.create_task(health_check_loop())
+    HealthMonitor().register_loop('main', loop)  # Threads and loops of both servers register themselves
     loop.run_forever()
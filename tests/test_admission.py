@@ -0,0 +1,110 @@
+import asyncio
+import random
+
+import pytest
+
+from local_lib.admission import (TokenBucket, AdmissionController, AdmissionRejected, backoff_delay, ven_key,
+                                 parse_retry_hint, rejection_message)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=2, burst=2, now=0.0)
+    assert bucket.take(0.0) == 0 and bucket.take(0.0) == 0
+    assert bucket.take(0.0) == pytest.approx(0.5)
+    assert bucket.take(0.5) == 0  # Refilled meanwhile
+    assert bucket.take(10.0) == 0 and bucket.tokens == 1  # Never above the burst
+
+
+def test_backoff_delay():
+    rng = random.Random(0)
+    delays = [backoff_delay(attempt, base=0.5, cap=4.0, rng=rng) for attempt in range(10)]
+    assert all(0 <= delay <= min(4.0, 0.5 * 2 ** attempt) for attempt, delay in enumerate(delays))
+    assert len(set(delays)) == len(delays)  # Jittered
+    assert 3.0 <= backoff_delay(0, base=0.5, cap=4.0, retry_after=3.0, rng=rng) <= 3.5
+
+
+def test_ven_key_and_retry_hint():
+    from openleadr.messaging import create_message
+
+    assert ven_key(create_message('oadrPoll', ven_id='ID-42').encode()) == 'ID-42'
+    assert ven_key(create_message('oadrQueryRegistration', request_id='request').encode()) is None
+    assert parse_retry_hint(rejection_message('rate', 1.25)) == 1.25
+    assert parse_retry_hint('<oadrPayload/>') is None
+
+
+def test_rate_limits():
+    clock = FakeClock()
+    controller = AdmissionController(services=('OadrPoll',), rate=1, burst=2, ven_rate=1, ven_burst=1,
+                                     max_concurrency=10, max_queue=10, queue_timeout=1, clock=clock)
+
+    async def scenario():
+        await controller.acquire('OadrPoll', 'ID-0')
+        with pytest.raises(AdmissionRejected) as rejection:
+            await controller.acquire('OadrPoll', 'ID-0')
+        assert rejection.value.reason == 'ven rate' and rejection.value.retry_after == pytest.approx(1)
+        await controller.acquire('OadrPoll', 'ID-1')
+
+        # The global bucket is empty, the rejected messages are told to come back one after the other
+        hints = []
+        for index in range(2, 5):
+            with pytest.raises(AdmissionRejected) as rejection:
+                await controller.acquire('OadrPoll', f'ID-{index}')
+            assert rejection.value.reason == 'rate'
+            hints.append(rejection.value.retry_after)
+        assert hints == pytest.approx([1, 2, 3])
+
+        clock.now = 1.0
+        await controller.acquire('OadrPoll', None)  # No VEN identity, only the global limits apply
+        assert controller.in_flight == 3
+
+    asyncio.run(scenario())
+
+
+def test_bounded_concurrency():
+    controller = AdmissionController(services=('EiRegisterParty',), rate=1000, burst=1000, ven_rate=1000,
+                                     ven_burst=1000, max_concurrency=1, max_queue=1, queue_timeout=0.05)
+
+    async def scenario():
+        await controller.acquire('EiRegisterParty', 'ID-0')
+        waiting = asyncio.create_task(controller.acquire('EiRegisterParty', 'ID-1'))
+        await asyncio.sleep(0)
+        assert controller.queued == 1
+        with pytest.raises(AdmissionRejected, match='queue full'):
+            await controller.acquire('EiRegisterParty', 'ID-2')
+
+        controller.release()  # The slot is handed over to the waiting message
+        await waiting
+        assert controller.in_flight == 1 and controller.queued == 0
+
+        with pytest.raises(AdmissionRejected, match='queue timeout'):
+            await controller.acquire('EiRegisterParty', 'ID-3')
+        assert controller.queued == 0
+        controller.release()
+        assert controller.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_rejected_ven_can_retry_after_the_hint():
+    clock = FakeClock()
+    controller = AdmissionController(services=('OadrPoll',), rate=1, burst=1, ven_rate=0.1, ven_burst=1,
+                                     max_concurrency=10, max_queue=10, queue_timeout=1, clock=clock)
+
+    async def scenario():
+        await controller.acquire('OadrPoll', 'ID-0')
+        with pytest.raises(AdmissionRejected) as rejection:
+            await controller.acquire('OadrPoll', 'ID-1')  # Rejected by the global rate
+        assert rejection.value.reason == 'rate'
+
+        clock.now = rejection.value.retry_after  # Well before ID-1 would get a new token at its own rate
+        await controller.acquire('OadrPoll', 'ID-1')
+
+    asyncio.run(scenario())
@@ -0,0 +1,87 @@
+from benchmarks.harness import LatencyRecorder, percentile, compare_reports
+from benchmarks.memory import measure as measure_memory
+from benchmarks.startup import parse_importtime, measure_import
+
+
+def test_percentile_nearest_rank():
+    samples = list(range(1, 101))
+    assert percentile(samples, 50) == 50
+    assert percentile(samples, 99) == 99
+    assert percentile(samples, 100) == 100
+    assert percentile([], 50) == 0.0
+
+
+def test_latency_recorder_summary():
+    recorder = LatencyRecorder('scenario')
+    for elapsed_ns in (1_000_000, 2_000_000, 3_000_000):
+        recorder.record(elapsed_ns)
+    recorder.record_error()
+    summary = recorder.summary()
+    assert summary['count'] == 3
+    assert summary['errors'] == 1
+    assert summary['p50_ms'] == 2.0
+    assert summary['p99_ms'] == 3.0
+    assert summary['ops_per_sec'] == 500.0  # 3 ops over 6ms of recorded time
+
+
+def test_compare_reports():
+    baseline = {'scenarios': {'poll': {'p50_ms': 1.0, 'p99_ms': 2.0, 'ops_per_sec': 100.0}}}
+    current = {'scenarios': {'poll': {'p50_ms': 1.5, 'p99_ms': 2.0, 'ops_per_sec': 50.0},
+                             'new': {'p50_ms': 1.0, 'p99_ms': 1.0, 'ops_per_sec': 1.0}}}
+    assert compare_reports(baseline, current) == {'poll': {'p50_ms': 50.0, 'p99_ms': 0.0, 'ops_per_sec': -50.0}}
+
+
+def test_complexity_exponent():
+    from benchmarks.micro import complexity_exponent
+    sizes = [1000, 2000, 4000]
+    assert round(complexity_exponent(sizes, [1.0, 1.0, 1.0]), 2) == 0.0
+    assert round(complexity_exponent(sizes, [1.0, 2.0, 4.0]), 2) == 1.0
+    assert round(complexity_exponent(sizes, [1.0, 4.0, 16.0]), 2) == 2.0
+
+
+def test_micro_complexity_budgets():
+    from benchmarks.micro import run_benchmarks
+    results = run_benchmarks(['venlist_append', 'db_find_eq_indexed'], sizes=[500, 4000],
+                             check_time=False, min_time_s=0.005)
+    assert {name: result['violations'] for name, result in results.items()} == {
+        'venlist_append': [],
+        'db_find_eq_indexed': [],
+    }
+
+
+def test_parse_importtime():
+    output = (
+        'import time: self [us] | cumulative | imported package\n'
+        'import time:       120 |        120 |   local_lib.settings\n'
+        'import time:      2206 |      52001 | local_lib.models.domain\n'
+    )
+    assert parse_importtime(output) == {'local_lib.settings': (120, 120), 'local_lib.models.domain': (2206, 52001)}
+
+
+def test_api_import_is_lazy():
+    result = measure_import('vtn_fast_api.api_service')
+    assert result['import_us'] > 0
+    assert result['heavy_modules'] == []  # Faker, openleadr, aiohttp and uvicorn load on first use
+
+
+def test_registry_memory_per_ven():
+    representations = measure_memory(2_000)
+    baseline = representations['dict_ven_baseline']['bytes_per_ven']
+    assert representations['venlist_columnar']['bytes_per_ven'] < baseline
+    assert representations['venlist_materialized']['bytes_per_ven'] < baseline
+
+
+def test_replay_fleet_and_schedule():
+    from benchmarks.replay import fleet_from_records, replay_schedule
+    from local_lib.traffic_log import TrafficRecord
+
+    registration = (b'<oadr:oadrCreatePartyRegistration><ei:venID>ID-1</ei:venID>'
+                    b'<oadr:oadrVenName>ven-one</oadr:oadrVenName></oadr:oadrCreatePartyRegistration>')
+    records = [
+        TrafficRecord(1_000_000_000, 0, 200, 'OadrPoll', 'vtn', b'<oadrPoll><ei:venID>ID-2</ei:venID></oadrPoll>'),
+        TrafficRecord(2_000_000_000, 0, 200, 'OadrPoll', 'vtn', b'<oadrPoll><ei:venID>ID-1</ei:venID></oadrPoll>'),
+        TrafficRecord(3_000_000_000, 0, 200, 'EiRegisterParty', 'vtn', registration),
+        TrafficRecord(5_000_000_000, 0, 200, 'EiRegisterParty', 'vtn', b'<oadrQueryRegistration/>'),
+    ]
+    assert [(ven['id'], ven['name']) for ven in fleet_from_records(records)] == [('ID-2', 'ID-2'), ('ID-1', 'ven-one')]
+    assert replay_schedule(records, speed=10) == [0.0, 0.1, 0.2, 0.4]
@@ -1,5 +1,6 @@
 import pytest
-from local_lib.models.domain import Ven, VenList, generate_ven_props, VenProps
+from local_lib.models.domain import (Ven, VenList, generate_ven_props, VenProps, generate_ven_props_batch,
+                                    iter_ven_props_batches)
 
 
 @pytest.fixture
@@ -30,10 +31,23 @@ class TestVen:
         assert ven.registration_id == sample_ven_props['registration_id']
         assert ven.fingerprint == sample_ven_props['fingerprint']
 
+    def test_ven_has_no_instance_dict(self, sample_ven):
+        assert not hasattr(sample_ven, '__dict__')
+
     def test_ven_string_representation(self, sample_ven):
         expected = f"VEN(name={sample_ven.name}, id={sample_ven.id}, registration_id={sample_ven.registration_id}, fingerprint={sample_ven.fingerprint})"
         assert str(sample_ven) == expected
 
+    def test_stop_right_after_run_stops_the_client(self, sample_ven, monkeypatch):
+        from local_lib.settings import settings
+        monkeypatch.setitem(settings.ven, 'fleet_mode', False)
+
+        sample_ven.run('http://127.0.0.1:9')  # Nothing listens, the client retries until stopped
+        thread = sample_ven._client_thread
+        sample_ven.stop()
+        thread.join(10)
+        assert not thread.is_alive() and not sample_ven.is_connected
+
 
 class TestVenList:
     def test_venlist_initialization(self, sample_ven):
@@ -85,6 +99,43 @@ class TestVenList:
         modified_list[0].name = "modified"
         assert original_list[0].name != modified_list[0].name
 
+    def test_extend(self, sample_ven_list):
+        sample_ven_list.ven_props_list  # Cached before extending
+        sample_ven_list.extend(Ven(ven_props) for ven_props in generate_ven_props_batch(3, start=1))
+        assert len(sample_ven_list) == 4
+        assert len(sample_ven_list.ven_props_list) == 4
+        assert sample_ven_list.find_by_id('ID-3') is not None
+
+    def test_from_props_materializes_on_demand(self):
+        ven_list = VenList.from_props(generate_ven_props_batch(10), debug=False)
+        assert len(ven_list) == 10
+        assert ven_list._instances == [None] * 10
+        ven = ven_list.find_by_mame(ven_list.get_names()[3])
+        assert ven.id == 'ID-3'
+        assert ven_list.find_by_id('ID-3') is ven
+        assert ven_list.find_by_registration_id('REG-3') is ven
+        assert ven_list._instances.count(None) == 9
+
+    def test_connection_change_refreshes_ven_props_list(self):
+        ven_list = VenList.from_props(generate_ven_props_batch(2), debug=False)
+        assert not any(ven_props['is_connected'] for ven_props in ven_list.ven_props_list)
+        version = ven_list.version
+        ven_list.find_by_id('ID-1')._set_connected(True)
+        assert ven_list.version == version + 1
+        assert [ven_props['is_connected'] for ven_props in ven_list.ven_props_list] == [False, True]
+
+    def test_gather_moves_materialized_vens(self):
+        first = VenList.from_props(generate_ven_props_batch(4), debug=False)
+        second = VenList.from_props(generate_ven_props_batch(4, start=4), debug=False)
+        connected = first.find_by_id('ID-1')
+        connected._set_connected(True)
+
+        gathered = VenList.gather([first, second], lambda ven_id: int(ven_id.split('-')[1]) % 2 == 1, debug=False)
+        assert gathered.get_ids() == ['ID-1', 'ID-3', 'ID-5', 'ID-7']
+        assert gathered.find_by_id('ID-1') is connected and gathered.is_connected('ID-1')
+        assert not gathered.is_connected('ID-3')
+        assert gathered._instances[1] is None  # Not materialized by the move
+
     def test_venlist_string_representation(self, sample_ven_list):
         assert str(sample_ven_list) == "VenList(1 VENs)"
 
@@ -96,3 +147,17 @@ def test_generate_ven_props():
     assert ven_props['id'].startswith('ID_')
     assert ven_props['registration_id'].startswith('REG_')
     assert len(ven_props['fingerprint']) == 64  # SHA256 hash length
+
+
+def test_generate_ven_props_batch():
+    fleet = generate_ven_props_batch(1_000, seed=7)
+    assert len({ven_props['name'] for ven_props in fleet}) == 1_000
+    assert len({ven_props['fingerprint'] for ven_props in fleet}) == 1_000
+    assert all(len(ven_props['fingerprint']) == 64 for ven_props in fleet)
+    assert fleet[10]['id'] == 'ID-10' and fleet[10]['registration_id'] == 'REG-10'
+
+    # Reproducible, whatever the batch or chunk a VEN is generated in
+    assert generate_ven_props_batch(1_000, seed=7) == fleet
+    assert generate_ven_props_batch(300, seed=7, start=200) == fleet[200:500]
+    assert [ven_props for chunk in iter_ven_props_batches(1_000, seed=7, chunk_size=333) for ven_props in chunk] == fleet
+    assert generate_ven_props_batch(1, seed=8)[0] != fleet[0]
@@ -0,0 +1,131 @@
+import asyncio
+import copy
+import threading
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from local_lib.models.domain import VenList, generate_ven_props_batch
+from vtn_fast_api.event_templates import EventTemplate, EventFragments
+from vtn_fast_api.vtn_service import VTNService
+
+SIGNALS = [{
+    'signal_name': 'simple',
+    'signal_type': 'level',
+    'intervals': [{'dtstart': datetime(2030, 1, 1, tzinfo=timezone.utc) + timedelta(hours=hour),
+                   'duration': timedelta(hours=1), 'signal_payload': 1} for hour in range(24)],
+}]
+
+
+@pytest.fixture
+def vtn_service():
+    """The VTN service with a fleet loaded on its shards, the servers are not started."""
+    vtn_service = VTNService()
+    fleet = generate_ven_props_batch(20)
+    ring, shards = vtn_service.ring, vtn_service.shards
+    for shard_id, shard in shards.items():
+        shard.ven_list = VenList.from_props([ven for ven in fleet if ring.node_for(ven['id']) == shard_id], debug=False)
+    return vtn_service
+
+
+async def poll(vtn_service, ven_id: str) -> str:
+    """The answer of the shard owning the VEN to its next poll, as sent over HTTP."""
+    poll_service = vtn_service.shard_for(ven_id).server.services['poll_service']
+    message_type, payload = await poll_service.handle_message('oadrPoll', {'ven_id': ven_id, 'request_id': 'request-1'})
+    return poll_service._create_message(message_type, **payload)
+
+
+def test_shared_event_renders_like_openleadr():
+    from openleadr.messaging import create_message, parse_message, validate_xml_schema
+
+    fragments = EventFragments()
+    event = EventTemplate('template-1', SIGNALS).build_event()
+    payload = {'vtn_id': 'vtn', 'request_id': 'request-1',
+               'response': {'request_id': 'request-0', 'response_code': 200, 'response_description': 'OK'}}
+    for ven_id in ('ID-1', 'ID-2'):
+        message = fragments.render_message('oadrDistributeEvent', events=[event], ven_id=ven_id, **payload)
+        validate_xml_schema(message.encode('utf-8'))
+        per_ven_event = copy.deepcopy(event)
+        per_ven_event.targets, per_ven_event.targets_by_type = [{'ven_id': ven_id}], {'ven_id': [ven_id]}
+        expected = create_message('oadrDistributeEvent', events=[per_ven_event], ven_id=ven_id, **payload)
+        assert parse_message(message.encode('utf-8')) == parse_message(expected.encode('utf-8'))
+    assert fragments.stats()['entries'] == 1  # Rendered once for both VENs
+
+
+def test_template_is_sent_once_to_every_ven(vtn_service):
+    template = vtn_service.add_event_template(SIGNALS, template_id='template-1', market_context='oadr://dr.program')
+    ven_ids = ['ID-0', 'ID-1', 'ID-2']
+    sent = vtn_service.send_event_template(template['template_id'], ven_ids + ['ID-0', 'ID-unknown'])
+    assert sent['vens'] == 3 and sent['unknown_vens'] == 1
+
+    queued = [vtn_service.shard_for(ven_id).server.events[ven_id][-1] for ven_id in ven_ids]
+    assert all(event is queued[0] for event in queued)  # Built once, shared by the queues
+
+    from openleadr.messaging import parse_message
+
+    async def deliver_and_respond():
+        for ven_id in ven_ids:
+            message_type, message = parse_message((await poll(vtn_service, ven_id)).encode('utf-8'))
+            assert message_type == 'oadrDistributeEvent'
+            event = message['events'][-1]
+            assert event['event_descriptor']['event_id'] == sent['event_id']
+            assert event['event_descriptor']['market_context'] == 'oadr://dr.program'
+            assert event['targets'] == [{'ven_id': ven_id}]
+            assert len(event['event_signals'][0]['intervals']) == 24
+
+            event_service = vtn_service.shard_for(ven_id).server.services['event_service']
+            await event_service.created_event({'ven_id': ven_id, 'event_responses': [
+                {'event_id': sent['event_id'], 'modification_number': 0, 'opt_type': 'optIn',
+                 'response_code': 200, 'response_description': 'OK', 'request_id': 'request-1'}]})
+
+    asyncio.run(deliver_and_respond())
+    ledger = {event['event_id']: event for event in vtn_service.events()}
+    assert ledger[sent['event_id']]['vens'] == 3
+    assert ledger[sent['event_id']]['responses'] == {'optIn': 3}  # Every VEN, not only the first one
+
+    with pytest.raises(KeyError):
+        vtn_service.send_event_template('template-unknown')
+
+
+def test_template_is_queued_on_the_shard_loops(vtn_service):
+    vtn_service.add_event_template(SIGNALS, template_id='template-1')
+    loops = []
+    for shard in vtn_service.shards.values():
+        shard._loop = asyncio.new_event_loop()
+        threading.Thread(target=shard._loop.run_forever, daemon=True).start()
+        loops.append(shard._loop)
+
+        async def send_shared_event(event, ven_ids, send=shard.send_shared_event, loop=shard._loop):
+            assert asyncio.get_running_loop() is loop
+            ledger = {entry['event_id'] for entry in vtn_service.events()}
+            assert event.event_descriptor.event_id in ledger  # Recorded before any VEN can poll it
+            await send(event, ven_ids)
+
+        shard.send_shared_event = send_shared_event
+    try:
+        sent = vtn_service.send_event_template('template-1')
+        assert sent['vens'] == 20
+        assert all(server.events[ven_id][-1].event_descriptor.event_id == sent['event_id']
+                   for server in (shard.server for shard in vtn_service.shards.values())
+                   for ven_id in server.events)
+    finally:
+        for loop in loops:
+            loop.call_soon_threadsafe(loop.stop)
+        for shard in vtn_service.shards.values():
+            shard._loop = None  # The VTN service is a singleton
+
+
+def test_invalid_template_is_rejected():
+    with pytest.raises(ValueError):
+        EventTemplate('template-1', [{**SIGNALS[0], 'signal_type': 'unknown'}])
+    with pytest.raises(ValueError):
+        EventTemplate('template-1', [{**SIGNALS[0], 'intervals': []}])
+    with pytest.raises(ValueError):
+        EventTemplate('template-1', SIGNALS, response_required='sometimes')
+
+
+def test_default_template_request_is_a_future_event():
+    from vtn_fast_api.dto.main import EventTemplateRequest
+
+    template = EventTemplate('template-1', EventTemplateRequest().model_dump()['signals'])
+    assert template.build_event().active_period.dtstart > datetime.now(timezone.utc)
@@ -0,0 +1,50 @@
+import pytest
+
+from local_lib.hash_ring import HashRing
+
+VEN_IDS = [f'ID-{index}' for index in range(10_000)]
+
+
+def test_node_for_is_deterministic():
+    ring = HashRing(['vtn-0', 'vtn-1', 'vtn-2'])
+    assert [ring.node_for(ven_id) for ven_id in VEN_IDS[:100]] == \
+           [HashRing(['vtn-2', 'vtn-0', 'vtn-1']).node_for(ven_id) for ven_id in VEN_IDS[:100]]
+
+
+def test_keys_are_spread_over_the_nodes():
+    assignment = HashRing(['vtn-0', 'vtn-1', 'vtn-2', 'vtn-3']).assign(VEN_IDS)
+    for ven_ids in assignment.values():
+        assert abs(len(ven_ids) - 2500) < 500
+
+
+def test_adding_a_node_only_moves_keys_to_it():
+    ring = HashRing(['vtn-0', 'vtn-1', 'vtn-2'])
+    before = {ven_id: ring.node_for(ven_id) for ven_id in VEN_IDS}
+    grown = ring.copy()
+    grown.add('vtn-3')
+    moved = [ven_id for ven_id in VEN_IDS if grown.node_for(ven_id) != before[ven_id]]
+    assert all(grown.node_for(ven_id) == 'vtn-3' for ven_id in moved)
+    assert 1500 < len(moved) < 3500  # About 1/4 of the keys
+    assert ring.node_for(moved[0]) == before[moved[0]]  # The copy did not change the original ring
+
+
+def test_removing_a_node_only_moves_its_keys():
+    ring = HashRing(['vtn-0', 'vtn-1', 'vtn-2'])
+    before = {ven_id: ring.node_for(ven_id) for ven_id in VEN_IDS}
+    ring.remove('vtn-1')
+    for ven_id in VEN_IDS:
+        if before[ven_id] != 'vtn-1':
+            assert ring.node_for(ven_id) == before[ven_id]
+        else:
+            assert ring.node_for(ven_id) != 'vtn-1'
+
+
+def test_invalid_changes():
+    ring = HashRing(['vtn-0'])
+    with pytest.raises(ValueError):
+        ring.add('vtn-0')
+    with pytest.raises(KeyError):
+        ring.remove('vtn-1')
+    ring.remove('vtn-0')
+    with pytest.raises(LookupError):
+        ring.node_for('ID-0')
@@ -0,0 +1,62 @@
+import asyncio
+import threading
+import time
+
+from local_lib.health import HealthMonitor
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_detects_stalled_loop_and_samples_stack():
+    monitor = HealthMonitor()
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    def run_loop():
+        asyncio.set_event_loop(loop)
+        monitor.register_loop('test-stall', loop)
+        loop.call_soon(ready.set)
+        loop.run_forever()
+
+    def blocking_callback():
+        time.sleep(monitor.interval + 4 * monitor.stall_threshold)
+
+    thread = threading.Thread(target=run_loop, daemon=True)
+    thread.start()
+    assert ready.wait(2)
+
+    try:
+        loop.call_soon_threadsafe(blocking_callback)
+        assert _wait_for(lambda: monitor.loops_status()['test-stall']['stalls'] >= 1)
+        status = monitor.loops_status()['test-stall']
+        assert status['thread_alive'] is True
+        assert any('blocking_callback' in line
+                   for sample in status['slow_callback_samples'] for line in sample['stack'])
+        # Once the callback returns the next probe is answered again
+        assert _wait_for(lambda: not monitor.loops_status()['test-stall']['stalled'])
+    finally:
+        monitor.unregister('test-stall')
+        loop.call_soon_threadsafe(loop.stop)
+
+
+def test_reports_dead_threads():
+    monitor = HealthMonitor()
+    thread = threading.Thread(target=lambda: None)
+    thread.start()
+    thread.join()
+
+    monitor.register_thread('test-dead', thread)
+    try:
+        status = monitor.status()
+        assert status['status'] == 'down'
+        assert 'test-dead' in status['dead_threads']
+        assert monitor.loops_status()['test-dead']['has_loop'] is False
+    finally:
+        monitor.unregister('test-dead')
@@ -64,3 +64,115 @@ def test_find_with_conditions(db):
     db.insert("test_collection", {"id": 2, "value": 20})
     result = db.find("test_collection", {"value": {"$gt": 15}})
     assert result == [{"id": 2, "value": 20}]
+
+
+def test_find_with_index(db):
+    db.drop_collection("indexed_collection")
+    db.create_index("indexed_collection", "id")
+    db.insert("indexed_collection", {"id": 1, "value": 10})
+    db.insert("indexed_collection", {"id": 2, "value": 20})
+    db.insert("indexed_collection", {"id": 2, "value": 30})
+    assert db.find("indexed_collection", {"id": 2, "value": {"$gt": 25}}) == [{"id": 2, "value": 30}]
+    assert db.find("indexed_collection", {"id": 3}) == []
+
+
+def test_index_follows_update_and_delete(db):
+    db.drop_collection("indexed_collection")
+    db.insert("indexed_collection", {"id": 1, "name": "Test"})
+    db.create_index("indexed_collection", "id")
+    db.update("indexed_collection", {"id": 1}, {"id": 5})
+    assert db.find("indexed_collection", {"id": 1}) == []
+    assert db.find("indexed_collection", {"id": 5}) == [{"id": 5, "name": "Test"}]
+    db.delete("indexed_collection", {"id": 5})
+    assert db.find("indexed_collection", {"id": 5}) == []
+
+
+def test_insert_many(db):
+    db.drop_collection("bulk_collection")
+    db.create_index("bulk_collection", "id")
+    assert db.insert_many("bulk_collection", ({"id": i} for i in range(3))) == 3
+    assert db.insert_many("bulk_collection", [{"id": 3}]) == 1
+    assert db.find("bulk_collection", {"id": 2}) == [{"id": 2}]
+    assert len(db.find("bulk_collection")) == 4
+
+
+def test_seed(db):
+    db.drop_collection("ven_props")
+    db.seed(count=25, chunk_size=10)
+    ven_props = db.find("ven_props")
+    assert [doc["id"] for doc in ven_props] == [f"ID-{i}" for i in range(25)]
+    db.drop_collection("ven_props")
+
+
+def test_normalize_query():
+    from local_lib.models.in_memory_db import normalize_query
+    assert normalize_query(None) == normalize_query({}) == ()
+    assert normalize_query({"a": 1, "b": {"$gt": 1, "$lt": 5}}) == normalize_query({"b": {"$lt": 5, "$gt": 1}, "a": 1})
+    assert normalize_query({"a": 1}) != normalize_query({"a": {"$ne": 1}})
+    assert normalize_query({"a": [1, 2]}) is None
+
+
+def test_query_cache_invalidated_by_writes(db):
+    db.drop_collection("cached_collection")
+    cache = db.enable_query_cache("cached_collection")
+    try:
+        db.insert_many("cached_collection", [{"id": 1, "value": 10}, {"id": 2, "value": 20}])
+        first = db.find("cached_collection", {"value": {"$gt": 15}})
+        assert first == ({"id": 2, "value": 20},)
+        assert db.find("cached_collection", {"value": {"$gt": 15}}) is first
+        with pytest.raises(TypeError):
+            first[0]["value"] = 0  # Read-only views
+
+        db.update("cached_collection", {"id": 1}, {"value": 30})
+        assert db.find("cached_collection", {"value": {"$gt": 15}}) == ({"id": 1, "value": 30}, {"id": 2, "value": 20})
+        db.delete("cached_collection", {"id": 2})
+        assert db.find("cached_collection", {"value": {"$gt": 15}}) == ({"id": 1, "value": 30},)
+        db.insert("cached_collection", {"id": 3, "value": 40})
+        assert len(db.find("cached_collection")) == 2
+        assert db.find("cached_collection", {"id": [1]}) == ()  # Unhashable, not cached
+
+        stats = db.query_cache_stats()["cached_collection"]
+        assert (stats["hits"], stats["misses"], stats["invalidations"]) == (1, 4, 3)
+        assert stats["entries"] == 1 and stats["bytes"] == cache.bytes > 0
+    finally:
+        db.disable_query_cache("cached_collection")
+        db.drop_collection("cached_collection")
+
+
+def test_query_cache_lru_and_memory_cap():
+    from local_lib.models.in_memory_db import QueryCache
+    result = tuple({"id": i} for i in range(10))
+    cache = QueryCache(max_entries=2, max_bytes=2 * QueryCache.result_size(result))
+    cache.put(("a",), 0, result)
+    cache.put(("b",), 0, result)
+    assert cache.get(("a",), 0) is result  # "b" becomes the least recently used
+    cache.put(("c",), 0, result)
+    assert cache.get(("b",), 0) is None and cache.get(("a",), 0) is result
+
+    cache.put(("big",), 0, result * 3)  # Larger than the memory cap, never stored
+    assert cache.get(("big",), 0) is None
+    cache.put(("d",), 1, result)  # Newer version, the previous entries are dropped
+    cache.put(("e",), 0, result)  # Computed before the write, stale
+    assert cache.stats()["entries"] == 1 and cache.evictions == 1
+
+
+def test_cached_find_results_feed_the_ven_registry(db):
+    from local_lib.models.domain import VenList, generate_ven_props_batch
+
+    db.drop_collection("cached_ven_props")
+    db.enable_query_cache("cached_ven_props")
+    try:
+        db.insert_many("cached_ven_props", generate_ven_props_batch(3))
+        results = db.find("cached_ven_props")
+        assert isinstance(results, tuple)
+        with pytest.raises(TypeError):
+            results[0]["name"] = "renamed"  # Read-only views
+
+        # Loaded like VTNService.run loads the allowed VENs
+        ven_list = VenList.from_props(results, debug=False)
+        assert [{key: ven_props[key] for key in results[0]} for ven_props in ven_list.ven_props_list] == \
+            [dict(doc) for doc in results]
+        assert db.find("cached_ven_props", {"id": "ID-1"})[0]["id"] == "ID-1"
+    finally:
+        db.disable_query_cache("cached_ven_props")
+        db.drop_collection("cached_ven_props")
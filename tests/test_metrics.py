@@ -0,0 +1,47 @@
+import threading
+
+from local_lib.metrics import Counter, Gauge, Histogram, MetricsRegistry
+
+
+def test_counter_aggregates_thread_shards():
+    counter = Counter('test_total', 'Test counter', ('kind',))
+
+    def work():
+        for _ in range(1000):
+            counter.inc('a')
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+    counter.inc('b', amount=2)
+
+    assert counter.value('a') == 4000
+    assert counter.value('b') == 2
+    assert 'test_total{kind="a"} 4000' in counter.render()
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram('test_seconds', 'Test histogram', ('loop',), buckets=(0.1, 1.0))
+    histogram.observe(0.05, 'vtn')
+    histogram.observe(0.5, 'vtn')
+    histogram.observe(5.0, 'vtn')
+
+    rendered = histogram.render()
+    assert '# TYPE test_seconds histogram' in rendered
+    assert 'test_seconds_bucket{loop="vtn",le="0.1"} 1' in rendered
+    assert 'test_seconds_bucket{loop="vtn",le="1.0"} 2' in rendered
+    assert 'test_seconds_bucket{loop="vtn",le="+Inf"} 3' in rendered
+    assert 'test_seconds_count{loop="vtn"} 3' in rendered
+    assert histogram.count('vtn') == 3
+
+
+def test_gauge_escapes_label_values():
+    gauge = Gauge('test_gauge', 'Test gauge', ('name',))
+    gauge.set(1.5, 'quote"d')
+    assert 'test_gauge{name="quote\\"d"} 1.5' in gauge.render()
+
+
+def test_registry_returns_existing_metric():
+    registry = MetricsRegistry()
+    assert registry.counter('test_registry_total', 'doc') is registry.counter('test_registry_total', 'doc')
+    assert '# HELP test_registry_total doc' in registry.render()
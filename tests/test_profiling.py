@@ -0,0 +1,72 @@
+import asyncio
+import marshal
+import time
+
+import pytest
+
+from local_lib.profiling import HandlerProfiler
+
+
+@pytest.fixture
+def profiler():
+    profiler = HandlerProfiler()
+    profiler.enabled, profiler.sample_every = True, 1
+    profiler.reset()
+    yield profiler
+    profiler.reset()
+
+
+def busy_wait(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_wrap_is_a_no_op_when_disabled(profiler):
+    profiler.enabled = False
+    handler = lambda: None  # noqa: E731
+    assert profiler.wrap('disabled', handler) is handler
+
+
+def test_sync_handler_profile(profiler):
+    lookup = profiler.wrap('test_lookup', lambda ven_id: busy_wait(0.05) or {'ven_id': ven_id})
+    assert lookup('ID-1') == {'ven_id': 'ID-1'}
+
+    summary = profiler.handlers()['test_lookup']
+    assert summary['calls'] == 1
+    assert summary['profiled_calls'] == 1
+    assert summary['stack_samples'] > 0
+    assert 'busy_wait' in profiler.collapsed('test_lookup')
+    stats = marshal.loads(profiler.pstats_dump('test_lookup'))
+    assert any(function == 'busy_wait' for _, _, function in stats)
+
+
+def test_async_handler_only_profiles_its_own_segments(profiler):
+    async def handler(value):
+        busy_wait(0.02)
+        await asyncio.sleep(0.05)
+        return value * 2
+
+    async def other_task():
+        await asyncio.sleep(0.01)
+        busy_wait(0.02)
+
+    async def main():
+        wrapped = profiler.wrap('test_async', handler)
+        result, _ = await asyncio.gather(wrapped(21), other_task())
+        return result
+
+    assert asyncio.run(main()) == 42
+    assert profiler.handlers()['test_async']['profiled_calls'] == 1
+    assert 'other_task' not in profiler.top('test_async')
+    stats = profiler._profiles['test_async'].stats
+    stream = stats.stream
+    assert 'handler' in profiler.top('test_async', sort='time') and stats.stream is stream
+    with pytest.raises(ValueError):
+        profiler.top('test_async', sort='unknown')
+    assert 'other_task' not in profiler.collapsed('test_async')
+
+
+def test_unknown_handler(profiler):
+    assert profiler.collapsed('unknown') is None
+    assert profiler.pstats_dump('unknown') is None
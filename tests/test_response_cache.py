@@ -0,0 +1,53 @@
+import json
+
+from local_lib.models.domain import Ven, VenList, generate_ven_props_batch
+from vtn_fast_api.response_cache import EncodedVenListing, FleetListing, encode_json, etag_matches
+
+
+def test_listing_is_cached_by_version():
+    ven_list = VenList.from_props(generate_ven_props_batch(5), debug=False)
+    listing = EncodedVenListing()
+    body, etag = listing.get(ven_list)
+    assert json.loads(body) == ven_list.ven_props_list
+    assert listing.get(ven_list) == (body, etag)
+    assert listing.get(ven_list)[0] is body  # Served from the cache, not re-encoded
+
+
+def test_listing_splices_changed_vens():
+    ven_list = VenList.from_props(generate_ven_props_batch(5), debug=False)
+    listing = EncodedVenListing()
+    _, etag = listing.get(ven_list)
+
+    ven_list.find_by_id('ID-2')._set_connected(True)
+    ven_list.append(Ven(generate_ven_props_batch(1, start=5)[0]))
+    body, new_etag = listing.get(ven_list)
+    assert new_etag != etag
+    assert body == encode_json(ven_list.ven_props_list)
+    assert body == EncodedVenListing().get(ven_list)[0]  # Same bytes as a full encoding
+
+
+def test_fleet_listing_merges_the_shards():
+    shards = {
+        'vtn-0': VenList.from_props(generate_ven_props_batch(3), debug=False),
+        'vtn-1': VenList(debug=False),
+        'vtn-2': VenList.from_props(generate_ven_props_batch(2, start=3), debug=False),
+    }
+    listing = FleetListing()
+    body, etag = listing.get(shards)
+    assert json.loads(body) == [ven_props for ven_list in shards.values() for ven_props in ven_list.ven_props_list]
+    assert listing.get(shards)[0] is body
+
+    shards['vtn-2'].find_by_id('ID-4')._set_connected(True)
+    body, new_etag = listing.get(shards)
+    assert new_etag != etag and json.loads(body)[-1]['is_connected']
+
+    del shards['vtn-1']  # Removing an empty shard lists the same VENs
+    assert listing.get(shards)[0] == body
+
+
+def test_etag_matches():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('"xyz", W/"abc"', '"abc"')
+    assert etag_matches('*', '"abc"')
+    assert not etag_matches('"xyz"', '"abc"')
+    assert not etag_matches(None, '"abc"')
@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from local_lib.models.domain import VenList, generate_ven_props_batch
+from vtn_fast_api.backends import SharedStateBackend
+from vtn_fast_api.shared_state import SharedSnapshot, SnapshotPublisher, IPCServer, IPCClient
+
+
+class FakeVTNService:
+    """Just the part of VTNService the publisher and the IPC server use."""
+
+    def __init__(self, ven_count: int = 3):
+        self.is_running = True
+        self.ven_list = VenList.from_props(generate_ven_props_batch(ven_count), debug=False)
+        self.shards = {'vtn-0': self.ven_list}
+        self.events_version = 0
+        self.connect_calls = 0
+
+    def ven_lists(self):
+        return self.shards
+
+    def shards_status(self):
+        return [{'id': shard_id, 'vens': len(ven_list)} for shard_id, ven_list in self.shards.items()]
+
+    def events(self):
+        return [{'event_id': 'event-1', 'response': None}] if self.events_version else []
+
+    def ven_connect(self):
+        self.connect_calls += 1
+
+
+@pytest.fixture
+def snapshot():
+    snapshot = SharedSnapshot(size=1024 * 1024, create=True)
+    yield snapshot
+    snapshot.close()
+
+
+def test_snapshot_round_trip(snapshot):
+    reader = SharedSnapshot(snapshot.name)
+    assert reader.read() == (0, {'running': False, 'version': None, 'etag': '""', 'events': [], 'shards': []}, b'[]')
+
+    snapshot.write({'running': True, 'etag': '"abc"'}, b'[1,2]')
+    sequence, meta, listing = reader.read()
+    assert sequence == 2 and meta['running'] and listing == b'[1,2]'
+    assert reader.read()[1] is meta  # Unchanged, served from the reader cache
+
+    with pytest.raises(ValueError):
+        snapshot.write({}, b'x' * 1024 * 1024)
+    reader.close()
+
+
+def test_publisher_and_shared_state_backend(snapshot):
+    vtn_service = FakeVTNService()
+    publisher = SnapshotPublisher(vtn_service, snapshot, interval=0.01)
+    assert publisher.publish()
+    assert not publisher.publish()  # Nothing changed
+
+    backend = SharedStateBackend(snapshot.name, ipc_address='', authkey=b'')
+    body, etag = backend.registered()
+    assert json.loads(body) == vtn_service.ven_list.ven_props_list
+    assert backend.is_running() and backend.has_ven('ID-2') and backend.connected() == []
+
+    vtn_service.ven_list.find_by_id('ID-1')._set_connected(True)
+    vtn_service.events_version += 1
+    assert publisher.publish()
+    assert backend.registered()[1] != etag
+    assert [ven_props['id'] for ven_props in backend.connected()] == ['ID-1']
+    assert backend.events() == [{'event_id': 'event-1', 'response': None}]
+
+    vtn_service.shards['vtn-1'] = VenList.from_props(generate_ven_props_batch(2, start=3), debug=False)
+    assert publisher.publish()
+    assert len(json.loads(backend.registered()[0])) == 5 and backend.has_ven('ID-4')
+    assert backend.shards() == [{'id': 'vtn-0', 'vens': 3}, {'id': 'vtn-1', 'vens': 2}]
+    backend.snapshot.close()
+
+
+def test_ipc_round_trip():
+    vtn_service = FakeVTNService()
+    server = IPCServer(vtn_service)
+    server.start()
+    client = IPCClient(server.address, server.authkey)
+    client.call('ven_connect')
+    assert vtn_service.connect_calls == 1
+    assert 'status' in client.call('health')
+    assert client.call('fleet')['mode'] == 'threads'
+    with pytest.raises(RuntimeError):
+        client.call('send_event', ven_id='ID-0', signal_level=1)  # The fake VTN has no event loop
+    server.stop()
+    assert not server._thread.is_alive()  # Does not spin on the closed listener
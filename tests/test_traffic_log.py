@@ -0,0 +1,63 @@
+import pytest
+
+from local_lib.traffic_log import MAGIC, TrafficLogWriter, TrafficRecord, read_traffic_log
+
+POLL = b'<oadrPayload><oadrPoll><ei:venID>ID-0</ei:venID></oadrPoll></oadrPayload>' * 4
+
+
+def test_round_trip_and_append(tmp_path):
+    path = str(tmp_path / 'vtn.traffic')
+    writer = TrafficLogWriter(path)
+    writer.write(2_000, 150, 200, 'OadrPoll', 'vtn-0', POLL)
+    writer.write(1_000, 10_000_000_000, 503, 'EiRegisterParty', 'vtn-1', b'<short/>')
+    writer.close()
+
+    # A second capture appends to the same log
+    writer = TrafficLogWriter(path, compress=False)
+    writer.write(3_000, 90, 200, 'OadrPoll', 'vtn-0', POLL)
+    writer.close()
+    writer.write(4_000, 90, 200, 'OadrPoll', 'vtn-0', POLL)  # Ignored once closed
+
+    assert list(read_traffic_log(path)) == [
+        TrafficRecord(2_000, 150, 200, 'OadrPoll', 'vtn-0', POLL),
+        TrafficRecord(1_000, 0xFFFFFFFF, 503, 'EiRegisterParty', 'vtn-1', b'<short/>'),
+        TrafficRecord(3_000, 90, 200, 'OadrPoll', 'vtn-0', POLL),
+    ]
+
+
+def test_truncated_record_ends_the_log(tmp_path):
+    path = str(tmp_path / 'vtn.traffic')
+    writer = TrafficLogWriter(path, compress=False)
+    writer.write(1_000, 150, 200, 'OadrPoll', 'vtn', POLL)
+    writer.write(2_000, 150, 200, 'OadrPoll', 'vtn', POLL)
+    writer.close()
+
+    with open(path, 'r+b') as file:
+        file.truncate(file.seek(0, 2) - 10)
+    assert [record.received_at_ns for record in read_traffic_log(path)] == [1_000]
+
+
+def test_append_after_truncated_record(tmp_path):
+    path = str(tmp_path / 'vtn.traffic')
+    writer = TrafficLogWriter(path, compress=False)
+    writer.write(1_000, 150, 200, 'OadrPoll', 'vtn', POLL)
+    writer.write(2_000, 150, 200, 'OadrPoll', 'vtn', POLL)
+    writer.close()
+
+    with open(path, 'r+b') as file:
+        file.truncate(file.seek(0, 2) - 10)
+    writer = TrafficLogWriter(path, compress=False)
+    writer.write(3_000, 150, 200, 'OadrPoll', 'vtn', POLL)
+    writer.close()
+    assert list(read_traffic_log(path)) == [TrafficRecord(1_000, 150, 200, 'OadrPoll', 'vtn', POLL),
+                                            TrafficRecord(3_000, 150, 200, 'OadrPoll', 'vtn', POLL)]
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.log'
+    path.write_bytes(b'not a traffic log')
+    with pytest.raises(ValueError):
+        TrafficLogWriter(str(path))
+    with pytest.raises(ValueError):
+        list(read_traffic_log(str(path)))
+    assert MAGIC not in path.read_bytes()
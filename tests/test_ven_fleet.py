@@ -0,0 +1,60 @@
+import asyncio
+
+from local_lib.ven_fleet import VenFleet, fleet_stats, open_session, process_stats
+
+
+def test_fleet_sessions_share_the_connection_pool():
+    from aiohttp import web
+
+    fleet = VenFleet()
+    before = fleet_stats()['connections']
+
+    async def handle_poll(request):
+        return web.Response(text='ok')
+
+    async def start_server():
+        app = web.Application()
+        app.router.add_post('/OadrPoll', handle_poll)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        return runner, site._server.sockets[0].getsockname()[1]
+
+    async def poll(url: str) -> None:
+        # One session per VEN client, the connections are kept alive in the shared pool
+        async with fleet.session() as session:
+            for _ in range(5):
+                async with session.post(url, data='<oadrPayload/>') as response:
+                    assert await response.text() == 'ok'
+
+    runner, port = fleet.submit(start_server()).result(5)
+    try:
+        for _ in range(4):
+            fleet.submit(poll(f'http://127.0.0.1:{port}/OadrPoll')).result(5)
+    finally:
+        fleet.submit(runner.cleanup()).result(5)
+
+    stats = fleet_stats()
+    assert stats['pool'] == {'limit': fleet.limit, 'limit_per_host': fleet.limit_per_host,
+                             'keepalive_timeout': fleet.keepalive_timeout}
+    assert stats['connections']['created'] - before['created'] == 1  # 20 requests over one connection
+    assert stats['connections']['reused'] - before['reused'] == 19
+    assert stats['connections']['tls_handshakes'] == before['tls_handshakes']
+    assert stats['connection_setup_s']['p50'] is not None
+
+
+def test_own_session_owns_its_connector():
+    async def scenario():
+        session = open_session()
+        connector = session.connector
+        await session.close()
+        return connector.closed
+
+    assert asyncio.run(scenario())
+
+
+def test_process_stats():
+    stats = process_stats()
+    assert stats['threads'] >= 1
+    assert stats['fds'] is None or stats['fds'] >= stats['sockets'] >= 0
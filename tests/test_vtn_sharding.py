@@ -0,0 +1,72 @@
+import asyncio
+import threading
+
+import pytest
+
+from local_lib.models.domain import VenList, generate_ven_props_batch
+from local_lib.settings import settings
+from vtn_fast_api.vtn_service import VTNService
+
+
+@pytest.fixture
+def vtn_service():
+    """The VTN service with a fleet loaded on its shards, the servers are not started."""
+    vtn_service = VTNService()
+    fleet = generate_ven_props_batch(2_000)
+    ring, shards = vtn_service.ring, vtn_service.shards
+    for shard_id, shard in shards.items():
+        shard.ven_list = VenList.from_props([ven for ven in fleet if ring.node_for(ven['id']) == shard_id], debug=False)
+    yield vtn_service
+    for shard_id in list(vtn_service.shards):
+        if shard_id.startswith('test-'):
+            vtn_service.remove_shard(shard_id)
+
+
+def test_queries_are_routed_to_the_owning_shard(vtn_service):
+    assert sorted(vtn_service.ven_ids()) == sorted(ven['id'] for ven in generate_ven_props_batch(2_000))
+    for ven_id in ('ID-0', 'ID-1999'):
+        assert vtn_service.shard_for(ven_id).ven_list.has_ven_with_id(ven_id)
+        assert vtn_service.has_ven(ven_id)
+    assert not vtn_service.has_ven('ID-2000')
+
+
+def test_rebalancing_moves_the_minimal_set_of_vens(vtn_service):
+    before = {ven_id: vtn_service.shard_for(ven_id).id for ven_id in vtn_service.ven_ids()}
+    materialized = {ven_id: vtn_service.shard_for(ven_id).ven_list.find_by_id(ven_id) for ven_id in before}
+
+    moves = vtn_service.add_shard(settings.vtn_shard('test-1', 18081))
+    assert moves and all(target == 'test-1' for _, target in moves.values())
+    assert len(vtn_service.shards['test-1'].ven_list) == len(moves)
+    for ven_id, shard_id in before.items():
+        expected = 'test-1' if ven_id in moves else shard_id
+        assert vtn_service.shard_for(ven_id).id == expected
+        assert vtn_service.shards[expected].ven_list.find_by_id(ven_id) is materialized[ven_id]  # Moved over as is
+    assert len(vtn_service.ven_ids()) == 2_000
+
+    moves_back = vtn_service.remove_shard('test-1')
+    assert moves_back.keys() == moves.keys()
+    assert {ven_id: vtn_service.shard_for(ven_id).id for ven_id in vtn_service.ven_ids()} == before
+
+    with pytest.raises(ValueError):
+        vtn_service.remove_shard(next(iter(vtn_service.shards)))  # The last shard
+
+
+def test_events_are_queued_on_the_shard_loop(vtn_service):
+    shard = vtn_service.shard_for('ID-0')
+    shard._loop = asyncio.new_event_loop()
+    threading.Thread(target=shard._loop.run_forever, daemon=True).start()
+    queued_on = []
+    send_event = shard.send_event
+
+    async def record_loop(ven_id, signal_level):
+        queued_on.append(asyncio.get_running_loop())
+        return await send_event(ven_id, signal_level)
+
+    shard.send_event = record_loop
+    try:
+        event_id = asyncio.run(vtn_service.send_event('ID-0', signal_level=2))
+        assert queued_on == [shard.loop]
+        assert shard.server.events['ID-0'][-1].event_descriptor.event_id == event_id
+    finally:
+        shard._loop.call_soon_threadsafe(shard._loop.stop)
+        shard._loop = None  # The VTN service is a singleton
@@ -1,79 +1,249 @@
+import asyncio
+import atexit
+import multiprocessing
+import multiprocessing.connection
+import socket
 import threading
-from typing import Optional
+from typing import Optional, List
 
-import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Header
+from fastapi.responses import PlainTextResponse, JSONResponse, Response
 
-from vtn_fast_api.dto.main import SendEventRequest
+from vtn_fast_api.backends import LocalBackend, SharedStateBackend
+from vtn_fast_api.dto.main import SendEventRequest, EventTemplateRequest, SendEventTemplateRequest, AddShardRequest
+from vtn_fast_api.response_cache import etag_matches
+from vtn_fast_api.shared_state import SharedSnapshot, SnapshotPublisher, IPCServer
 from vtn_fast_api.vtn_service import VTNService
+from local_lib.health import HealthMonitor
+from local_lib.metrics import CONTENT_TYPE
+from local_lib.models.in_memory_db import InMemoryDB
+from local_lib.profiling import HandlerProfiler
 from local_lib.settings import settings
 from local_lib.utils.main import SingletonMeta
 
-vtn_service = VTNService()
+
+def build_app(backend, title: str = settings.fast_api['title']) -> FastAPI:
+    """
+    Creates the FastAPI app serving the VTN state of `backend`: a LocalBackend in the VTN
+    process, a SharedStateBackend in the API worker processes.
+    """
+    app = FastAPI(title=title)
+
+    # --- API Endpoints ---
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def get_metrics():
+        return PlainTextResponse(backend.metrics(), media_type=CONTENT_TYPE)
+
+    @app.get("/health")
+    def get_health():
+        status = backend.health()
+        return JSONResponse(status, status_code=503 if status['status'] == 'down' else 200)
+
+    @app.get("/ven/registered")
+    def get_registered_ven(if_none_match: Optional[str] = Header(None)):
+        if not backend.is_running():
+            return {"error": "VTN server is not running"}
+
+        # Served pre-encoded, unchanged polls only cost a version check (and no body with If-None-Match)
+        body, etag = backend.registered()
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(body, media_type="application/json", headers={"ETag": etag})
+
+    @app.get("/ven/connected")
+    def get_connected_ven():
+        if not backend.is_running():
+            return {"error": "VTN server is not running"}
+
+        return backend.connected()
+
+    @app.get("/ven/connect")
+    def get_connect_ven():
+        if not backend.is_running():
+            return {"error": "VTN server is not running"}
+
+        backend.ven_connect()
+        return {"status": "vent connection started"}
+
+    @app.get("/ven/fleet")
+    def get_ven_fleet():
+        return backend.fleet()
+
+    @app.post("/ven/create")
+    def create_ven():
+        if not backend.is_running():
+            return {"error": "VTN server is not running"}
+
+        return {"status": "Not implemented yet"}
+
+    @app.delete("/ven/delete")
+    def delete_ven():
+        if not backend.is_running():
+            return {"error": "VTN server is not running"}
+
+        return {"status": "Not implemented yet"}
+
+    @app.post("/event/send-event")
+    async def send_event(req: SendEventRequest):
+        if not backend.is_running():
+            return {"error": "VTN server is not running"}
+
+        if not backend.has_ven(req.ven_id):
+            return {"error": "VEN not registered"}
+
+        event_id = await backend.send_event(req.ven_id, req.signal_level)
+        return {"status": "event sent", "event_id": event_id}
+
+    @app.get("/event/templates")
+    def get_event_templates():
+        return backend.event_templates()
+
+    @app.post("/event/templates")
+    def add_event_template(req: EventTemplateRequest):
+        try:
+            template = backend.add_event_template(**req.model_dump())
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=422)
+        return {"status": "event template saved", "template": template}
+
+    @app.post("/event/templates/{template_id}/send")
+    def send_event_template(template_id: str, req: SendEventTemplateRequest):
+        if not backend.is_running():
+            return {"error": "VTN server is not running"}
+
+        try:
+            sent = backend.send_event_template(template_id, req.ven_ids)
+        except KeyError:
+            return JSONResponse({"error": f"No event template {template_id}"}, status_code=404)
+        return {"status": "event sent", **sent}
+
+    @app.get("/event/ledger")
+    def get_event_ledger():
+        return backend.events()
+
+    @app.get("/vtn/shards")
+    def get_vtn_shards():
+        return backend.shards()
+
+    return app
+
+
+def _serve_worker(sock: socket.socket, snapshot_name: str, ipc_address: str, authkey: bytes, title: str) -> None:
+    """Entry point of an API worker process, serves the shared listening socket."""
+    import uvicorn
+
+    app = build_app(SharedStateBackend(snapshot_name, ipc_address, authkey), title)
+    server = uvicorn.Server(uvicorn.Config(app=app, loop="asyncio", reload=False))
+
+    def exit_with_parent():
+        # The VTN process may be killed without stopping its workers, which would keep serving a stale snapshot
+        multiprocessing.connection.wait([multiprocessing.parent_process().sentinel])
+        server.should_exit = True
+
+    threading.Thread(target=exit_with_parent, name='parent-watcher', daemon=True).start()
+    server.run(sockets=[sock])
 
 
 class APIService(metaclass=SingletonMeta):
     """
     A singleton service class that manages the FastAPI application instance.
     Handles server initialization and runtime operations.
+
+    With OPEN_KICK__FAST_API__WORKERS > 1 the API is served by that many worker processes
+    instead of a thread: they read the VTN state from a shared-memory snapshot published by
+    this process and forward the writes (send event, connect VENs) to it.
     """
 
-    def __init__(self, title: str = settings.fast_api['title'], debug: bool = settings.core['DEBUG']):
+    def __init__(self,
+                 title: str = settings.fast_api['title'],
+                 debug: bool = settings.core['DEBUG'],
+                 workers: int = settings.fast_api['workers']):
         self.debug = debug
+        self.workers = workers
         self._is_running = False
         self._server_thread: Optional[threading.Thread] = None
+        self._worker_processes: List[multiprocessing.Process] = []
 
         # Create the FastAPI app
-        app = FastAPI(title=title)
+        app = build_app(LocalBackend(VTNService()), title)
         self.__app = app
 
-        # --- API Endpoints ---
-        @app.get("/ven/registered")
-        def get_registered_ven():
-            if not vtn_service.is_running:
-                return {"error": "VTN server is not running"}
+        @app.on_event("startup")
+        async def register_loop_health():
+            HealthMonitor().register_loop('api', asyncio.get_running_loop())
 
-            return vtn_service.ven_props_list()
+        @app.get("/health/loops")
+        def get_health_loops():
+            return HealthMonitor().loops_status()
 
-        @app.get("/ven/connected")
-        def get_connected_ven():
-            if not vtn_service.is_running:
-                return {"error": "VTN server is not running"}
+        # --- Admin Endpoints (VTN shards) ---
+        vtn_service = VTNService()
 
-            return vtn_service.ven_connected()
+        @app.post("/admin/shards")
+        def add_vtn_shard(req: AddShardRequest):
+            try:
+                moves = vtn_service.add_shard(settings.vtn_shard(req.shard_id, req.port))
+            except ValueError as e:
+                return JSONResponse({"error": str(e)}, status_code=409)
+            return {"status": "shard added", "moved_vens": len(moves)}
 
-        @app.get("/ven/connect")
-        def get_connect_ven():
-            if not vtn_service.is_running:
-                return {"error": "VTN server is not running"}
+        @app.delete("/admin/shards/{shard_id}")
+        def remove_vtn_shard(shard_id: str):
+            try:
+                moves = vtn_service.remove_shard(shard_id)
+            except KeyError:
+                return JSONResponse({"error": f"No VTN shard {shard_id}"}, status_code=404)
+            except ValueError as e:
+                return JSONResponse({"error": str(e)}, status_code=409)
+            return {"status": "shard removed", "moved_vens": len(moves)}
 
-            vtn_service.ven_connect()
-            return {"status": "vent connection started"}
+        # --- Admin Endpoints (InMemoryDB) ---
+        @app.get("/admin/db/query-cache")
+        def get_query_cache_stats():
+            return InMemoryDB().query_cache_stats()
 
-        @app.post("/ven/create")
-        def create_ven():
-            if not vtn_service.is_running:
-                return {"error": "VTN server is not running"}
+        # --- Admin Endpoints (profiling, requires OPEN_KICK__CORE__PROFILE=true) ---
+        profiler = HandlerProfiler()
 
-            return {"status": "Not implemented yet"}
+        def profile_not_found(handler: str):
+            if not profiler.enabled:
+                return JSONResponse({"error": "Profiling is disabled (OPEN_KICK__CORE__PROFILE)"}, status_code=404)
+            return JSONResponse({"error": f"No profile for handler {handler}"}, status_code=404)
 
-        @app.delete("/ven/delete")
-        def delete_ven():
-            if not vtn_service.is_running:
-                return {"error": "VTN server is not running"}
+        @app.get("/admin/profile")
+        def get_profiled_handlers():
+            return {"enabled": profiler.enabled, "sample_every": profiler.sample_every,
+                    "handlers": profiler.handlers()}
 
-            return {"status": "Not implemented yet"}
+        @app.delete("/admin/profile")
+        def reset_profiles():
+            profiler.reset()
+            return {"status": "profiles reset"}
 
-        @app.post("/event/send-event")
-        async def send_event(req: SendEventRequest):
-            if not vtn_service.is_running:
-                return {"error": "VTN server is not running"}
+        @app.get("/admin/profile/{handler}/collapsed")
+        def get_collapsed_stacks(handler: str):
+            collapsed = profiler.collapsed(handler)
+            if collapsed is None:
+                return profile_not_found(handler)
+            return PlainTextResponse(collapsed)
 
-            if req.ven_id not in vtn_service.ven_ids():
-                return {"error": "VEN not registered"}
+        @app.get("/admin/profile/{handler}/pstats")
+        def get_pstats_dump(handler: str):
+            dump = profiler.pstats_dump(handler)
+            if dump is None:
+                return profile_not_found(handler)
+            return Response(dump, media_type="application/octet-stream",
+                            headers={"Content-Disposition": f'attachment; filename="{handler}.pstats"'})
 
-            await vtn_service.send_event(req.ven_id, req.signal_level)
-            return {"status": "event sent"}
+        @app.get("/admin/profile/{handler}/top")
+        def get_top_functions(handler: str, sort: str = "cumulative", limit: int = 30):
+            try:
+                top = profiler.top(handler, sort, limit)
+            except ValueError as e:
+                return JSONResponse({"error": str(e)}, status_code=422)
+            if top is None:
+                return profile_not_found(handler)
+            return PlainTextResponse(top)
 
     @property
     def is_running(self):
@@ -94,6 +264,8 @@ class APIService(metaclass=SingletonMeta):
 
     def _run_server(self, host: str, port: int) -> None:
         """Internal method to run the server in a separate thread."""
+        import uvicorn  # Only loaded when the API is served, not when the app is built (tests, workers...)
+
         config = uvicorn.Config(
             app=self.app,
             host=host,
@@ -104,9 +276,36 @@ class APIService(metaclass=SingletonMeta):
         server = uvicorn.Server(config)
         server.run()
 
+    def _run_workers(self, host: str, port: int) -> None:
+        """Starts the snapshot publisher, the IPC server and the API worker processes."""
+        vtn_service = VTNService()
+        snapshot = SharedSnapshot(size=settings.fast_api['snapshot']['size'], create=True)
+        atexit.register(snapshot.close)
+        SnapshotPublisher(vtn_service, snapshot, settings.fast_api['snapshot']['interval']).start()
+        ipc_server = IPCServer(vtn_service)
+        ipc_server.start()
+
+        # Every worker accepts on the same listening socket, the kernel spreads the connections
+        sock = socket.create_server((host, port))
+        context = multiprocessing.get_context('spawn')  # Fresh interpreters, no thread state inherited
+        for index in range(self.workers):
+            process = context.Process(
+                target=_serve_worker,
+                args=(sock, snapshot.name, ipc_server.address, ipc_server.authkey, self.app.title),
+                name=f'api-worker-{index}',
+                daemon=True
+            )
+            process.start()
+            self._worker_processes.append(process)
+            # The health monitor watches threads: one waits on each worker so a dead worker reports 'down'
+            watcher = threading.Thread(target=process.join, name=f'api-worker-{index}-watcher', daemon=True)
+            watcher.start()
+            HealthMonitor().register_thread(f'api-worker-{index}', watcher)
+
     def run(self, host: str = settings.fast_api['location']['host'], port: int = settings.fast_api['location']['port']):
         """
-        Starts the FastAPI server with the specified host and port in a non-blocking manner.
+        Starts the FastAPI server with the specified host and port in a non-blocking manner,
+        in a thread or, with several workers, in worker processes.
 
         Args:
             host: The host address to bind the server to
@@ -120,12 +319,18 @@ class APIService(metaclass=SingletonMeta):
             return
 
         try:
+            if self.workers > 1:
+                self._run_workers(host, port)
+                self._is_running = True
+                return
+
             self._server_thread = threading.Thread(
                 target=self._run_server,
                 args=(host, port),
                 daemon=True
             )
             self._server_thread.start()
+            HealthMonitor().register_thread('api', self._server_thread)
             self._is_running = True
         except Exception as e:
             self._is_running = False
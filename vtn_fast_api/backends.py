@@ -0,0 +1,142 @@
+"""
+Where the API gets the VTN state from. `LocalBackend` calls the VTNService running in the
+same process, `SharedStateBackend` is used by the API worker processes: reads come from the
+shared-memory snapshot, writes are forwarded to the VTN process.
+"""
+import asyncio
+import json
+from typing import List, Tuple, Set, Optional
+
+from local_lib.health import HealthMonitor
+from local_lib.metrics import registry
+from local_lib.ven_fleet import fleet_stats
+from vtn_fast_api.response_cache import FleetListing
+from vtn_fast_api.shared_state import SharedSnapshot, IPCClient
+from vtn_fast_api.vtn_service import VTNService
+
+
+class LocalBackend:
+    def __init__(self, vtn_service: VTNService):
+        self.vtn_service = vtn_service
+        self._listing = FleetListing()
+
+    def is_running(self) -> bool:
+        return self.vtn_service.is_running
+
+    def registered(self) -> Tuple[bytes, str]:
+        """The encoded VEN listing and its ETag."""
+        return self._listing.get(self.vtn_service.ven_lists())
+
+    def connected(self) -> List[dict]:
+        return self.vtn_service.ven_connected()
+
+    def has_ven(self, ven_id: str) -> bool:
+        return self.vtn_service.has_ven(ven_id)
+
+    def ven_connect(self) -> None:
+        self.vtn_service.ven_connect()
+
+    async def send_event(self, ven_id: str, signal_level: int) -> str:
+        return await self.vtn_service.send_event(ven_id, signal_level)
+
+    def event_templates(self) -> List[dict]:
+        return [template.describe() for template in self.vtn_service.event_templates.values()]
+
+    def add_event_template(self, **template) -> dict:
+        return self.vtn_service.add_event_template(**template)
+
+    def send_event_template(self, template_id: str, ven_ids: Optional[List[str]]) -> dict:
+        return self.vtn_service.send_event_template(template_id, ven_ids)
+
+    def events(self) -> List[dict]:
+        return self.vtn_service.events()
+
+    def shards(self) -> List[dict]:
+        return self.vtn_service.shards_status()
+
+    @staticmethod
+    def fleet() -> dict:
+        return fleet_stats()
+
+    @staticmethod
+    def metrics() -> str:
+        return registry.render()
+
+    @staticmethod
+    def health() -> dict:
+        return HealthMonitor().status()
+
+
+class SharedStateBackend:
+    def __init__(self, snapshot_name: str, ipc_address: str, authkey: bytes):
+        self.snapshot = SharedSnapshot(snapshot_name)
+        self.client = IPCClient(ipc_address, authkey)
+        self._listing_view: Tuple[int, List[dict], Set[str]] = (-1, [], set())  # Decoded once per snapshot
+
+    def _view(self) -> Tuple[List[dict], Set[str]]:
+        sequence, _, listing = self.snapshot.read()
+        view_sequence, connected, ven_ids = self._listing_view
+        if sequence != view_sequence:
+            # Only the connected list and the ids need decoding, /ven/registered serves the bytes as they are
+            ven_props_list = json.loads(listing)
+            connected = [ven_props for ven_props in ven_props_list if ven_props['is_connected']]
+            ven_ids = {ven_props['id'] for ven_props in ven_props_list}
+            self._listing_view = (sequence, connected, ven_ids)
+        return connected, ven_ids
+
+    def is_running(self) -> bool:
+        return self.snapshot.read()[1]['running']
+
+    def registered(self) -> Tuple[bytes, str]:
+        _, meta, listing = self.snapshot.read()
+        return listing, meta['etag']
+
+    def connected(self) -> List[dict]:
+        return self._view()[0]
+
+    def has_ven(self, ven_id: str) -> bool:
+        return ven_id in self._view()[1]
+
+    def ven_connect(self) -> None:
+        self.client.call('ven_connect')
+
+    async def send_event(self, ven_id: str, signal_level: int) -> str:
+        return await asyncio.to_thread(self.client.call, 'send_event', ven_id=ven_id, signal_level=signal_level)
+
+    def event_templates(self) -> List[dict]:
+        return self.client.call('event_templates')
+
+    def add_event_template(self, **template) -> dict:
+        return self._call_raising('add_event_template', ValueError, **template)
+
+    def send_event_template(self, template_id: str, ven_ids: Optional[List[str]]) -> dict:
+        return self._call_raising('send_event_template', KeyError, template_id=template_id, ven_ids=ven_ids)
+
+    def _call_raising(self, operation: str, error: type, **kwargs):
+        """Calls `operation` in the VTN process, re-raising `error` when it failed with one."""
+        try:
+            return self.client.call(operation, **kwargs)
+        except RuntimeError as e:
+            if str(e).startswith(f'{error.__name__}: '):
+                raise error(str(e).split(': ', 1)[1]) from e
+            raise
+
+    def events(self) -> List[dict]:
+        return self.snapshot.read()[1]['events']
+
+    def shards(self) -> List[dict]:
+        return self.snapshot.read()[1]['shards']
+
+    def fleet(self) -> dict:
+        """Connection usage of the VEN clients, they run in the VTN process."""
+        return self.client.call('fleet')
+
+    def metrics(self) -> str:
+        """Metrics of the VTN process, where the OpenADR traffic is handled."""
+        return self.client.call('metrics')
+
+    def health(self) -> dict:
+        try:
+            return self.client.call('health')
+        except (OSError, EOFError, RuntimeError) as e:
+            return {'status': 'down', 'error': f'VTN process unreachable: {str(e)}'}
@@ -1,8 +1,17 @@
-from pydantic import BaseModel
+from datetime import datetime, timezone, timedelta
+from typing import List, Optional
 
-from local_lib.models.domain import generate_ven_props
+from pydantic import BaseModel, Field
 
-default_ven_prop = generate_ven_props(-1)
+from local_lib.models.domain import ID_PREFIX
+from local_lib.utils.main import generate_id
+from vtn_fast_api.event_templates import DEFAULT_MARKET_CONTEXT
+
+# Example values of the OpenAPI schema, computed without Faker so importing the API stays cheap
+default_ven_prop = {
+    'name': 'ven-example',
+    'id': generate_id(ID_PREFIX, -1, 0),
+}
 
 
 # --- API Models ---
@@ -15,3 +24,37 @@ class CreateVenRequest(BaseModel):
 class SendEventRequest(BaseModel):
     ven_id: str = default_ven_prop['id']
     signal_level: int = 1
+
+
+def tomorrow() -> datetime:
+    """Default start of the intervals: openleadr drops a completed event before delivering it."""
+    return datetime.now(timezone.utc).replace(second=0, microsecond=0) + timedelta(days=1)
+
+
+class EventIntervalRequest(BaseModel):
+    dtstart: datetime = Field(default_factory=tomorrow)
+    duration: timedelta = timedelta(minutes=10)
+    signal_payload: float = 1
+
+
+class EventSignalRequest(BaseModel):
+    signal_name: str = 'simple'
+    signal_type: str = 'level'
+    intervals: List[EventIntervalRequest] = Field(default_factory=lambda: [EventIntervalRequest()])
+
+
+class EventTemplateRequest(BaseModel):
+    template_id: Optional[str] = None  # Generated when omitted, an existing template is replaced
+    market_context: str = DEFAULT_MARKET_CONTEXT
+    response_required: str = 'always'
+    priority: int = 0
+    signals: List[EventSignalRequest] = Field(default_factory=lambda: [EventSignalRequest()])
+
+
+class SendEventTemplateRequest(BaseModel):
+    ven_ids: Optional[List[str]] = None  # Every registered VEN when omitted
+
+
+class AddShardRequest(BaseModel):
+    shard_id: str = 'vtn-1'
+    port: int = 8081
@@ -0,0 +1,272 @@
+"""
+Events defined once and sent to a whole set of VENs.
+
+`VTNShard.send_event` builds an event for one VEN: sending the same DR event to 10k VENs
+builds, validates and renders its signals and intervals 10k times. An `EventTemplate` holds
+the signals, intervals and market context of an event. Sending it builds a single openleadr
+Event, and the queue of every VEN of the set holds that same Event (a shared event).
+
+Shared events (`shared_event_type`) target the VEN_ID_PLACEHOLDER. When a VEN polls, `EventFragments.render_message`
+takes the XML of each shared event from a cache. That XML is rendered once per event state
+(modification number, status). Only the envelope of the message (request and response ids)
+and the target VEN are rendered per VEN.
+"""
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from datetime import datetime, timezone
+from typing import Optional, List, Tuple, Iterable
+
+from local_lib.metrics import event_fragments
+from local_lib.settings import settings
+
+VEN_ID_PLACEHOLDER = '\x00ven_id\x00'  # Replaced by the id of the VEN in the XML of a shared event
+SHARED_TARGETS = [{'ven_id': VEN_ID_PLACEHOLDER}]
+DEFAULT_MARKET_CONTEXT = 'oadr://unknown.context'
+
+
+@lru_cache(maxsize=None)
+def shared_event_type():
+    """
+    The openleadr Event subclass of the shared events. openleadr logs the payload of every answer
+    it builds, the shared events are logged by id rather than with all of their intervals.
+    """
+    from openleadr import objects  # Only loaded once the VTN is created
+
+    class SharedEvent(objects.Event):
+        def __repr__(self):
+            descriptor = self.event_descriptor
+            return (f'SharedEvent(event_id={descriptor.event_id!r}, modification_number={descriptor.modification_number}, '
+                    f'event_status={descriptor.event_status!r})')
+
+    return SharedEvent
+
+
+def is_shared(event) -> bool:
+    return isinstance(event, shared_event_type())
+
+
+class EventTemplate:
+    """
+    The signals, intervals and market context of an event, validated once when defined.
+
+    Every signal is a dict with a `signal_name`, a `signal_type` and its `intervals`. Each
+    interval is a dict with a `dtstart`, a `duration` (timedelta) and a `signal_payload`, like
+    the intervals of `OpenADRServer.add_event`. A naive `dtstart` is read as local time and converted to UTC.
+
+    Raises:
+        ValueError: If the template is not a valid OpenADR event
+    """
+
+    def __init__(self,
+                 template_id: str,
+                 signals: List[dict],
+                 market_context: str = DEFAULT_MARKET_CONTEXT,
+                 response_required: str = 'always',
+                 priority: int = 0):
+        from openleadr.preflight import preflight_message
+
+        if not signals:
+            raise ValueError('An event template needs at least one signal')
+        if response_required not in ('always', 'never'):
+            raise ValueError(f"'response_required' should be either 'always' or 'never', not '{response_required}'")
+        self.template_id = template_id
+        self.market_context = market_context
+        self.response_required = response_required
+        self.priority = priority
+        self.signals = [
+            {
+                'signal_name': signal['signal_name'],
+                'signal_type': signal['signal_type'],
+                'intervals': [self._interval(interval) for interval in signal['intervals']],
+            }
+            for signal in signals
+        ]
+        if not all(signal['intervals'] for signal in self.signals):
+            raise ValueError('Every signal of an event template needs at least one interval')
+
+        # The checks openleadr runs when an event is sent (signal names and types, durations, SIMPLE payloads)
+        preflight_message('oadrDistributeEvent', {'events': [self.build_event(template_id)]})
+
+    @staticmethod
+    def _interval(interval: dict) -> dict:
+        dtstart = interval['dtstart']
+        if dtstart.tzinfo is None:
+            dtstart = dtstart.astimezone(timezone.utc)
+        return {'dtstart': dtstart, 'duration': interval['duration'], 'signal_payload': interval['signal_payload']}
+
+    def build_event(self, event_id: Optional[str] = None):
+        """The openleadr Event of this template, shared by the queues of the VENs it is sent to."""
+        from openleadr import objects, utils
+
+        intervals = [interval for signal in self.signals for interval in signal['intervals']]
+        event_descriptor = objects.EventDescriptor(event_id=event_id or utils.generate_id(),
+                                                   modification_number=0,
+                                                   market_context=self.market_context,
+                                                   event_status='far',
+                                                   created_date_time=datetime.now(timezone.utc),
+                                                   priority=self.priority)
+        return shared_event_type()(
+            event_descriptor=event_descriptor,
+            event_signals=[objects.EventSignal(intervals=[dict(interval) for interval in signal['intervals']],
+                                               signal_name=signal['signal_name'],
+                                               signal_type=signal['signal_type'],
+                                               signal_id=utils.generate_id())
+                           for signal in self.signals],
+            targets=[dict(target) for target in SHARED_TARGETS],
+            active_period=utils.get_active_period_from_intervals(intervals, False),
+            response_required=self.response_required,
+        )
+
+    def describe(self) -> dict:
+        return {
+            'template_id': self.template_id,
+            'market_context': self.market_context,
+            'response_required': self.response_required,
+            'priority': self.priority,
+            'signals': [
+                {
+                    'signal_name': signal['signal_name'],
+                    'signal_type': signal['signal_type'],
+                    'intervals': [
+                        {
+                            'dtstart': interval['dtstart'].isoformat(),
+                            'duration': interval['duration'].total_seconds(),
+                            'signal_payload': interval['signal_payload'],
+                        }
+                        for interval in signal['intervals']
+                    ],
+                }
+                for signal in self.signals
+            ],
+        }
+
+
+class SharedEventCallbacks(dict):
+    """
+    The `event_callbacks` of the EventService of a shard. openleadr drops the callback of an
+    event on its first response, the callbacks of the shared events are kept for the responses
+    of every VEN. Only the last `max_events` shared events keep their callback.
+    """
+
+    def __init__(self, max_events: int = settings.vtn['event_ledger_size']):
+        super().__init__()
+        self.max_events = max_events
+        self._shared: 'OrderedDict[str, None]' = OrderedDict()
+
+    def share(self, event_id: str) -> None:
+        self._shared[event_id] = None
+        while len(self._shared) > self.max_events:
+            super().pop(self._shared.popitem(last=False)[0], None)
+
+    def pop(self, event_id, *default):
+        if event_id in self._shared:
+            return self[event_id]
+        return super().pop(event_id, *default)
+
+
+class EventFragments:
+    """
+    LRU cache of the XML of the shared events, by event id and state, shared by the shards.
+    Renders the oadrDistributeEvent messages of the shards in place of `create_message`.
+    """
+
+    def __init__(self, max_entries: int = settings.vtn['event_fragment_cache_size']):
+        from openleadr import utils
+        from openleadr.messaging import TEMPLATES
+
+        self.max_entries = max_entries
+        self._flatten_xml = utils.flatten_xml
+        self._getmember = utils.getmember
+        self._distribute_template = TEMPLATES.get_template('oadrDistributeEvent.xml')
+        self._event_template = TEMPLATES.get_template('parts/eiEvent.xml')
+        self._payload_template = TEMPLATES.get_template('oadrPayload.xml')
+        # The unsigned payload envelope, around the signed object
+        self._payload_head, _, self._payload_tail = self._payload_template.render(
+            signature=None, signed_object=VEN_ID_PLACEHOLDER).partition(VEN_ID_PLACEHOLDER)
+        self._entries: 'OrderedDict[tuple, Tuple[str, str]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _render_event(self, event) -> str:
+        """The flattened XML of one event, as create_message renders it in an oadrDistributeEvent."""
+        from openleadr.preflight import preflight_message
+
+        event = preflight_message('oadrDistributeEvent', {'events': [event]})['events'][0]
+        return self._flatten_xml(self._event_template.render(event=event))
+
+    def fragment(self, event) -> Tuple[str, str]:
+        """The XML of a shared event around its target VEN id, rendered once per state."""
+        descriptor = self._getmember(event, 'event_descriptor')
+        key = (descriptor.event_id, descriptor.modification_number, descriptor.event_status,
+               descriptor.created_date_time)
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is not None:
+                self._entries.move_to_end(key)
+        if fragment is not None:
+            event_fragments.inc('hit')
+            return fragment
+
+        event_fragments.inc('miss')
+        prefix, _, suffix = self._render_event(event).partition(VEN_ID_PLACEHOLDER)
+        fragment = (prefix, suffix)
+        with self._lock:
+            self._entries[key] = fragment
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return fragment
+
+    def render_message(self, message_type: str, cert=None, key=None, passphrase=None, disable_signature=False,
+                       **message_payload) -> str:
+        """
+        Renders an OpenADR message like `openleadr.messaging.create_message`. The shared
+        events of an oadrDistributeEvent come from the cache, other messages and events are
+        rendered by openleadr.
+        """
+        from openleadr.messaging import create_message
+
+        events: Iterable = message_payload.get('events') or ()
+        if message_type != 'oadrDistributeEvent' or not any(is_shared(event) for event in events):
+            return create_message(message_type, cert=cert, key=key, passphrase=passphrase,
+                                  disable_signature=disable_signature, **message_payload)
+
+        ven_id = str(message_payload['ven_id'])
+        envelope = self._flatten_xml(self._distribute_template.render(**{**message_payload, 'events': ()}))
+        head, closing, tail = envelope.rpartition('</oadr:oadrDistributeEvent>')
+        parts = [head]
+        for event in events:
+            if is_shared(event):
+                prefix, suffix = self.fragment(event)
+                parts += (prefix, ven_id, suffix)
+            else:
+                parts.append(self._render_event(event))
+        parts += (closing, tail)
+        if not cert or not key or disable_signature:
+            return ''.join((self._payload_head, *parts, self._payload_tail))
+        signed_object = ''.join(parts)
+        return self._payload_template.render(template=message_type,
+                                             signature=self._sign(signed_object, cert, key, passphrase),
+                                             signed_object=signed_object)
+
+    @staticmethod
+    def _sign(signed_object: str, cert, key, passphrase) -> str:
+        """The signature of a message, as create_message signs it."""
+        from lxml import etree
+        from openleadr import utils
+        from openleadr.messaging import SIGNER, _create_replay_protect
+
+        signature_tree = SIGNER.sign(etree.fromstring(signed_object),
+                                     key=key,
+                                     cert=cert,
+                                     passphrase=utils.ensure_bytes(passphrase),
+                                     reference_uri='#oadrSignedObject',
+                                     signature_properties=_create_replay_protect())
+        return etree.tostring(signature_tree).decode('utf-8')
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': int(event_fragments.value('hit')),
+            'misses': int(event_fragments.value('miss')),
+        }
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from local_lib.metrics import registry
+from local_lib.models.domain import VenList
+
+listing_encodes = registry.counter(
+    'api_ven_listing_encodes_total', 'Encodings of the VEN listing, by kind (hit, splice, full)', ('kind',))
+
+
+def encode_json(value) -> bytes:
+    """Encodes like FastAPI's JSONResponse, so cached bodies are byte for byte what FastAPI would send."""
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, indent=None, separators=(',', ':')).encode('utf-8')
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag, as required for GET requests."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque_tag = etag.removeprefix('W/')
+    return any(candidate.strip().removeprefix('W/') == opaque_tag for candidate in if_none_match.split(','))
+
+
+class EncodedVenListing:
+    """
+    Pre-encoded JSON body of `VenList.ven_props_list`, keyed by `VenList.version`.
+
+    Each VEN is kept as its own encoded fragment. When the registry changes, only the
+    fragments of the VENs that changed (or were appended) are re-encoded and spliced back
+    into the body. The ETag is a digest of the body, so it stays valid across restarts.
+    """
+
+    def __init__(self):
+        # (ven_list, version, fragments, body, etag), replaced as a whole so readers never see a torn state
+        self._state: Tuple[Optional[VenList], Optional[int], List[bytes], bytes, str] = (None, None, [], b'[]', '')
+        self._lock = threading.Lock()
+
+    def get(self, ven_list: VenList) -> Tuple[bytes, str]:
+        """
+        Returns the encoded listing of `ven_list` and its ETag, re-encoding only what changed.
+
+        Returns:
+            A tuple of (JSON body, ETag)
+        """
+        cached_list, cached_version, _, body, etag = self._state
+        if ven_list is cached_list and ven_list.version == cached_version:
+            listing_encodes.inc('hit')
+            return body, etag
+
+        with self._lock:
+            cached_list, cached_version, fragments, body, etag = self._state
+            version = ven_list.version  # Read first, changes made while encoding are applied on the next call
+            if ven_list is cached_list and version == cached_version:
+                listing_encodes.inc('hit')
+                return body, etag
+
+            changed_rows = ven_list.changes_since(cached_version) if ven_list is cached_list else None
+            if changed_rows is None:
+                listing_encodes.inc('full')
+                fragments = [encode_json(ven_props) for ven_props in ven_list.ven_props_list]
+            else:
+                listing_encodes.inc('splice')
+                fragments = fragments.copy()
+                for row in changed_rows:
+                    if row < len(fragments):
+                        fragments[row] = encode_json(ven_list.ven_props_at(row))
+                appended_rows = range(len(fragments), len(ven_list))
+                fragments.extend(encode_json(ven_list.ven_props_at(row)) for row in appended_rows)
+
+            body = b'[' + b','.join(fragments) + b']'
+            etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+            self._state = (ven_list, version, fragments, body, etag)
+            return body, etag
+
+
+class FleetListing:
+    """
+    Encoded listing of the whole fleet, merged from the EncodedVenListing of every VTN shard.
+
+    Shards are listed in order, each one with its VENs in registry order. The merged body is
+    only rebuilt when the ETag of a shard changed, and the ETag of the fleet is derived from
+    the ETags of the shards.
+    """
+
+    def __init__(self):
+        self._listings: Dict[str, EncodedVenListing] = {}
+        self._state: Tuple[Tuple[str, ...], bytes, str] = ((), b'[]', '')  # (shard ETags, body, etag)
+
+    def get(self, ven_lists: Dict[str, VenList]) -> Tuple[bytes, str]:
+        """
+        Returns the encoded listing of every VEN of `ven_lists` (by shard id) and its ETag.
+
+        Returns:
+            A tuple of (JSON body, ETag)
+        """
+        listings = self._listings
+        if listings.keys() != ven_lists.keys():  # Shards added or removed
+            listings = self._listings = {shard_id: listings.get(shard_id) or EncodedVenListing()
+                                         for shard_id in ven_lists}
+        parts = [listings[shard_id].get(ven_list) for shard_id, ven_list in ven_lists.items()]
+        if len(parts) == 1:
+            return parts[0]
+
+        shard_etags = tuple(etag for _, etag in parts)
+        cached_etags, body, etag = self._state
+        if shard_etags == cached_etags:
+            return body, etag
+        body = b'[' + b','.join(part[1:-1] for part, _ in parts if len(part) > 2) + b']'
+        etag = f'"{hashlib.blake2b(",".join(shard_etags).encode(), digest_size=16).hexdigest()}"'
+        self._state = (shard_etags, body, etag)
+        return body, etag
@@ -0,0 +1,289 @@
+"""
+State shared between the VTN process and the API worker processes.
+
+The VTN process publishes a snapshot of its state (the encoded VEN listing and the event
+ledger) in a shared memory segment that the workers read without any lock, and runs the
+writes the workers forward to it (send an event, connect the VENs...) over a local
+`multiprocessing.connection` channel.
+"""
+import asyncio
+import json
+import secrets
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from multiprocessing.connection import Listener, Client, AuthenticationError
+from typing import Optional, List, Tuple, Any
+
+from local_lib.health import HealthMonitor
+from local_lib.metrics import registry
+from local_lib.ven_fleet import fleet_stats
+from vtn_fast_api.response_cache import FleetListing
+
+SEQUENCE = struct.Struct('<Q')  # Odd while the writer is updating the snapshot
+LENGTHS = struct.Struct('<QQ')  # Meta and listing lengths
+HEADER_SIZE = SEQUENCE.size + LENGTHS.size
+
+EMPTY_META = {'running': False, 'version': None, 'etag': '""', 'events': [], 'shards': []}
+
+
+class SharedSnapshot:
+    """
+    Shared memory segment holding the latest snapshot, guarded by a seqlock.
+
+    The single writer makes the sequence odd, writes the payload and makes it even again.
+    Readers copy the payload and retry when the sequence was odd or moved meanwhile, so they
+    never block the writer. A reader also keeps the last snapshot it decoded and returns it
+    as long as the sequence did not move, an unchanged snapshot costs a single 8 bytes read.
+    """
+
+    def __init__(self, name: Optional[str] = None, size: int = 0, create: bool = False):
+        self._shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        self._owner = create
+        self._sequence = 0
+        self._last_read: Tuple[int, Any] = (0, None)  # (sequence, decoded snapshot), replaced as a whole
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def write(self, meta: dict, listing: bytes) -> None:
+        encoded_meta = json.dumps(meta, separators=(',', ':')).encode('utf-8')
+        end = HEADER_SIZE + len(encoded_meta) + len(listing)
+        if end > self._shm.size:
+            raise ValueError(f'Snapshot of {end} bytes does not fit in {self._shm.size} bytes '
+                             f'(see OPEN_KICK__FAST_API__SNAPSHOT__SIZE)')
+
+        buffer = self._shm.buf
+        self._sequence += 1
+        SEQUENCE.pack_into(buffer, 0, self._sequence)
+        buffer[HEADER_SIZE:HEADER_SIZE + len(encoded_meta)] = encoded_meta
+        buffer[HEADER_SIZE + len(encoded_meta):end] = listing
+        LENGTHS.pack_into(buffer, SEQUENCE.size, len(encoded_meta), len(listing))
+        self._sequence += 1
+        SEQUENCE.pack_into(buffer, 0, self._sequence)
+
+    def read(self) -> Tuple[int, dict, bytes]:
+        """
+        Returns:
+            A tuple of (sequence, meta, encoded VEN listing), sequence 0 until the first write
+        """
+        buffer = self._shm.buf
+        while True:
+            sequence = SEQUENCE.unpack_from(buffer, 0)[0]
+            if sequence == 0:
+                return 0, EMPTY_META, b'[]'
+            if sequence & 1:
+                time.sleep(0)  # Let the writer finish
+                continue
+            last_sequence, last_snapshot = self._last_read
+            if sequence == last_sequence:
+                return last_snapshot
+
+            meta_length, listing_length = LENGTHS.unpack_from(buffer, SEQUENCE.size)
+            listing_start = HEADER_SIZE + meta_length
+            encoded_meta = bytes(buffer[HEADER_SIZE:listing_start])
+            listing = bytes(buffer[listing_start:listing_start + listing_length])
+            if SEQUENCE.unpack_from(buffer, 0)[0] != sequence:
+                continue  # Overwritten while copying
+
+            snapshot = (sequence, json.loads(encoded_meta), listing)
+            self._last_read = (sequence, snapshot)
+            return snapshot
+
+    def close(self) -> None:
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+class SnapshotPublisher:
+    """Publishes the state of the VTNService in a SharedSnapshot whenever it changes."""
+
+    def __init__(self, vtn_service, snapshot: SharedSnapshot, interval: float):
+        self.vtn_service = vtn_service
+        self.snapshot = snapshot
+        self.interval = interval
+        self._listing = FleetListing()
+        self._published = None
+        self._thread: Optional[threading.Thread] = None
+
+    def publish(self) -> bool:
+        """Publishes a new snapshot if the VTN state changed since the last one, returns whether it did."""
+        vtn_service = self.vtn_service
+        running = vtn_service.is_running
+        ven_lists = vtn_service.ven_lists() if running else {}
+        versions = tuple((shard_id, id(ven_list), ven_list.version) for shard_id, ven_list in ven_lists.items())
+        state = (running, versions, vtn_service.events_version)
+        if state == self._published:
+            return False
+
+        listing, etag = self._listing.get(ven_lists) if running else (b'[]', EMPTY_META['etag'])
+        self.snapshot.write({
+            'running': running,
+            'version': [version for _, _, version in versions],
+            'etag': etag,
+            'events': vtn_service.events(),
+            'shards': vtn_service.shards_status(),
+        }, listing)
+        self._published = state
+        return True
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.publish()
+            except Exception as e:
+                print(f'Error publishing the API snapshot: {str(e)}')
+            time.sleep(self.interval)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name='snapshot-publisher', daemon=True)
+        self._thread.start()
+        HealthMonitor().register_thread('snapshot-publisher', self._thread)
+
+
+class IPCServer:
+    """
+    Runs, in the VTN process, the operations forwarded by the API workers. Each worker
+    connection is served by its own thread, coroutines run on the VTN event loop.
+    """
+
+    def __init__(self, vtn_service, timeout: float = 10.0):
+        self.vtn_service = vtn_service
+        self.timeout = timeout
+        self.authkey = secrets.token_bytes(32)
+        self._listener = Listener(family='AF_UNIX', authkey=self.authkey)
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    @property
+    def address(self) -> str:
+        return self._listener.address
+
+    def send_event(self, ven_id: str, signal_level: int) -> str:
+        # Runs on the event loop of the shard owning the VEN
+        future = asyncio.run_coroutine_threadsafe(self.vtn_service.send_event(ven_id, signal_level),
+                                                  self.vtn_service.shard_for(ven_id).loop)
+        return future.result(self.timeout)
+
+    def ven_connect(self) -> None:
+        self.vtn_service.ven_connect()
+
+    def event_templates(self) -> List[dict]:
+        return [template.describe() for template in self.vtn_service.event_templates.values()]
+
+    def add_event_template(self, **template) -> dict:
+        return self.vtn_service.add_event_template(**template)
+
+    def send_event_template(self, template_id: str, ven_ids: Optional[List[str]] = None) -> dict:
+        return self.vtn_service.send_event_template(template_id, ven_ids, self.timeout)
+
+    @staticmethod
+    def fleet() -> dict:
+        return fleet_stats()
+
+    @staticmethod
+    def metrics() -> str:
+        return registry.render()
+
+    @staticmethod
+    def health() -> dict:
+        return HealthMonitor().status()
+
+    def _serve(self, connection) -> None:
+        operations = {
+            'send_event': self.send_event,
+            'ven_connect': self.ven_connect,
+            'event_templates': self.event_templates,
+            'add_event_template': self.add_event_template,
+            'send_event_template': self.send_event_template,
+            'fleet': self.fleet,
+            'metrics': self.metrics,
+            'health': self.health,
+        }
+        with connection:
+            while True:
+                try:
+                    operation, kwargs = connection.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    reply = (True, operations[operation](**kwargs))
+                except Exception as e:
+                    reply = (False, f'{type(e).__name__}: {str(e)}')
+                connection.send(reply)
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                connection = self._listener.accept()
+            except (AuthenticationError, EOFError, ConnectionError):
+                continue  # One client failed the handshake
+            except OSError:
+                return  # The listener was closed
+            if self._stopping.is_set():
+                connection.close()
+                return
+            threading.Thread(target=self._serve, args=(connection,), name='ipc-connection', daemon=True).start()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._accept, name='ipc-server', daemon=True)
+        self._thread.start()
+        HealthMonitor().register_thread('ipc-server', self._thread)
+
+    def stop(self, timeout: float = 1.0) -> None:
+        """Stops accepting connections, the connections already open are still served."""
+        HealthMonitor().unregister('ipc-server')
+        self._stopping.set()
+        if self._thread is not None and self._thread.is_alive():
+            try:
+                Client(self.address, family='AF_UNIX', authkey=self.authkey).close()  # Wakes up accept()
+            except (OSError, EOFError, AuthenticationError):
+                pass
+        self._listener.close()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+class IPCClient:
+    """Connection of an API worker to the IPCServer, shared by the worker threads."""
+
+    def __init__(self, address: str, authkey: bytes):
+        self.address = address
+        self.authkey = authkey
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def call(self, operation: str, **kwargs):
+        """
+        Runs `operation` in the VTN process and returns its result.
+
+        Raises:
+            RuntimeError: If the operation failed in the VTN process
+            OSError / EOFError: If the VTN process cannot be reached
+        """
+        with self._lock:
+            try:
+                if self._connection is None:
+                    self._connection = Client(self.address, family='AF_UNIX', authkey=self.authkey)
+                self._connection.send((operation, kwargs))
+            except (OSError, EOFError):
+                # The VTN process may have dropped an idle connection, the request was not sent: retry once
+                self._close()
+                self._connection = Client(self.address, family='AF_UNIX', authkey=self.authkey)
+                self._connection.send((operation, kwargs))
+            try:
+                succeeded, result = self._connection.recv()
+            except (OSError, EOFError):
+                self._close()
+                raise
+        if not succeeded:
+            raise RuntimeError(result)
+        return result
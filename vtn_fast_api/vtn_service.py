@@ -1,51 +1,143 @@
 import asyncio
+import math
 import threading
+import time
+from collections import OrderedDict
 from functools import partial
 from datetime import datetime, timezone, timedelta
-from typing import Optional
-
-from openleadr import OpenADRServer, enable_default_logging
-
-from local_lib.models.domain import Ven, VenList
+from typing import Optional, List, Dict, Tuple, Iterable
+
+from local_lib.admission import AdmissionController, AdmissionRejected, ven_key
+from local_lib.hash_ring import HashRing
+from local_lib.health import HealthMonitor
+from local_lib.metrics import (openadr_messages, openadr_message_duration, registrations, event_dispatch_duration,
+                               shared_event_dispatch_duration, report_values)
+from local_lib.models.domain import VenList
 from local_lib.settings import settings
 from local_lib.models.in_memory_db import InMemoryDB
+from local_lib.profiling import HandlerProfiler
+from local_lib.traffic_log import TrafficLogWriter
 from local_lib.utils.main import SingletonMeta
-
-if settings.core['DEBUG']:
-    enable_default_logging()
+from vtn_fast_api.event_templates import EventTemplate, EventFragments, SharedEventCallbacks, DEFAULT_MARKET_CONTEXT
 
 db = InMemoryDB()
 
+# Handlers wrapped with the profiling hooks when OPEN_KICK__CORE__PROFILE is enabled
+PROFILED_HANDLERS = ('on_create_party_registration', 'on_register_report', 'on_update_report', 'ven_lookup',
+                     'send_event', 'send_shared_event')
 
-class VTNService(metaclass=SingletonMeta):
+
+async def metrics_middleware(request, handler):
+    """Counts and times every OpenADR message, labelled by service (EiRegisterParty, OadrPoll...)."""
+    service = 'unmatched' if request.match_info.http_exception else request.path.rsplit('/', 1)[-1]
+    started_at = time.perf_counter()
+    status = '500'
+    try:
+        response = await handler(request)
+        status = str(response.status)
+        return response
+    finally:
+        openadr_message_duration.observe(time.perf_counter() - started_at, service)
+        openadr_messages.inc(service, status)
+
+
+async def profiling_middleware(request, handler):
     """
-    VTNService is responsible for managing and operating a Virtual Top Node (VTN) server as part of
-    an OpenADR (Automated Demand Response) system. This includes handling client (VEN) registrations,
-    report registrations, and event notifications. It facilitates interaction between the VTN and the
-    VENs (Virtual End Nodes).
+    Samples the stacks of a whole message (XML parsing, validation, signing and handlers) so the
+    time spent outside of our handlers shows up in the collapsed stacks. cProfile stays with the handlers.
+    """
+    service = 'unmatched' if request.match_info.http_exception else request.path.rsplit('/', 1)[-1]
+    return await HandlerProfiler().profile_awaitable(f'message:{service}', handler(request), cprofile=False)
 
-    This class is designed to manage the lifecycle of the VTN server and handle various OpenADR server
-    functionalities. It includes mechanisms for the lookup of VEN information, managing event
-    responses, report callbacks, and communication with registered VENs. This implementation aligns
-    with OpenADR specifications and uses the SingletonMeta for ensuring a single instance.
 
-    Attributes:
-        debug: Indicates whether debugging mode is enabled for the VTN service.
-        _is_running: Represents the running state of the VTN server.
-        server: The OpenADR server instance that manages the core OpenADR functionalities.
+def capture_middleware(capture: TrafficLogWriter, shard_id: str, services: Iterable[str] = ()):
     """
+    Appends the OpenADR messages received by a shard to the traffic log, with the status and
+    time of their answer. Only `services` are captured when given.
+    """
+    services = frozenset(services)
+
+    async def middleware(request, handler):
+        service = request.path.rsplit('/', 1)[-1]
+        if request.match_info.http_exception or (services and service not in services):
+            return await handler(request)
+        received_at_ns = time.time_ns()
+        started_at = time.perf_counter()
+        body = await request.read()  # The body is cached for openleadr
+        status = 500
+        try:
+            response = await handler(request)
+            status = response.status
+            return response
+        finally:
+            capture.write(received_at_ns, int((time.perf_counter() - started_at) * 1e6), status, service, shard_id, body)
 
-    ven_list: VenList
+    return middleware
 
-    def __init__(self, debug: bool = settings.core['DEBUG']):
+
+def admission_middleware(controller: AdmissionController):
+    """
+    Admits the messages of the services under admission control before openleadr parses them.
+    Rejected messages get a 503 with a Retry-After header, the body holds the precise hint.
+    """
+    from aiohttp import web
+
+    async def middleware(request, handler):
+        service = request.path.rsplit('/', 1)[-1]
+        if service not in controller.services or request.match_info.http_exception:
+            return await handler(request)
+        try:
+            await controller.acquire(service, ven_key(await request.read()))  # The body is cached for openleadr
+        except AdmissionRejected as rejection:
+            return web.Response(status=503, text=str(rejection),
+                                headers={'Retry-After': str(max(1, math.ceil(rejection.retry_after)))})
+        try:
+            return await handler(request)
+        finally:
+            controller.release()
+
+    return middleware
+
+
+class VTNShard:
+    """
+    One OpenADR server (its own port and event loop thread) and the partition of the VEN
+    registry it owns. VENs are placed on the shards by consistent hashing of their id (see
+    VTNService.ring), a VEN registering with a shard that does not own it is rejected.
+
+    Attributes:
+        id: Shard id, its node on the ring and the vtn_id of its OpenADR server
+        url: URL the VENs owned by this shard connect to
+        ven_list: The VENs owned by this shard, replaced as a whole when the shards are rebalanced
+        server: The OpenADR server instance of this shard
+        shared_event_callbacks: Callbacks of the events of its server, kept for every VEN of a shared event
+        admission: Admission control of its registrations and polls, None when disabled
+    """
+
+    def __init__(self, shard: dict, vtn_service: 'VTNService', debug: bool = settings.core['DEBUG']):
+        self.id = shard['id']
+        self.port = shard['port']
+        self.url = settings.vtn_shard_url(shard)
         self.debug = debug
+        self.vtn_service = vtn_service  # Keeps the event ledger of every shard
+        self.ven_list = VenList(debug=debug)
         self._is_running = False
         self._server_thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # openleadr (and aiohttp) are only loaded once the VTN is created, not when this module is imported
+        from aiohttp import web
+        from openleadr import OpenADRServer
+
+        profiler = HandlerProfiler()
+        if profiler.enabled:
+            for name in PROFILED_HANDLERS:
+                setattr(self, name, profiler.wrap(name, getattr(self, name)))
 
         # Create the OpenADR Server
         self.server = OpenADRServer(
             # ven_lookup=ven_lookup,
-            **settings.vtn['OpenADRServerOptions'],
+            **{**settings.vtn['OpenADRServerOptions'], 'vtn_id': self.id, 'http_port': self.port},
             fingerprint_lookup=self.ven_lookup
             # Possibly deprecated (but still works) see https://openleadr.org/docs/server.html#things-you-should-implement
         )
@@ -56,34 +148,34 @@ class VTNService(metaclass=SingletonMeta):
         # Add the handler for report registrations from the VEN
         self.server.add_handler('on_register_report', self.on_register_report)
 
+        # Events sent from templates are shared by the queues of their VENs and rendered once per state
+        self.shared_event_callbacks = SharedEventCallbacks()
+        event_service = self.server.services['event_service']
+        event_service.event_callbacks = self.shared_event_callbacks
+        for service in (event_service, self.server.services['poll_service']):
+            signing = getattr(service._create_message, 'keywords', {})  # The certificate openleadr signs with
+            service._create_message = partial(vtn_service.event_fragments.render_message, **signing)
+
+        # Instrument every OpenADR message, the aiohttp app is only frozen once the server starts
+        self.server.app.middlewares.append(web.middleware(metrics_middleware))
+        if vtn_service.capture is not None:
+            self.server.app.middlewares.append(
+                web.middleware(capture_middleware(vtn_service.capture, self.id, settings.capture['services'])))
+        self.admission: Optional[AdmissionController] = None
+        if settings.admission['enabled']:
+            self.admission = AdmissionController()
+            self.server.app.middlewares.append(web.middleware(admission_middleware(self.admission)))
+        if profiler.enabled:
+            self.server.app.middlewares.append(web.middleware(profiling_middleware))
+
     @property
     def is_running(self):
         return self._is_running
 
-    @is_running.setter
-    def is_running(self, value):
-        pass
-
-    def ven_props_list(self):
-        return self.ven_list.ven_props_list
-
-    def ven_ids(self):
-        return self.ven_list.get_ids()
-
-    def ven_names(self):
-        return self.ven_list.get_names()
-
-    def ven_connected(self):
-        return [ven for ven in self.ven_list.ven_props_list if ven['is_connected']]
-
-    def ven_connect(self):
-        try:
-            for ven in self.ven_list.ven_instances():
-                if not ven.is_connected:
-                    ven.run()
-        except Exception as e:
-            print(f"Error connecting VEN: {str(e)}")
-            raise
+    @property
+    def loop(self) -> Optional[asyncio.AbstractEventLoop]:
+        """The event loop the OpenADR server runs on (None until the server thread started)."""
+        return self._loop
 
     def ven_lookup(self, ven_id):
         ven = self.ven_list.find_by_id(ven_id)
@@ -103,14 +195,17 @@ class VTNService(metaclass=SingletonMeta):
         """
         ven = self.ven_list.find_by_mame(registration_info['ven_name'])
         if ven:
+            registrations.inc('accepted')
             return ven.id, ven.registration_id
         else:
+            registrations.inc('rejected')
             return False
 
-    async def on_update_report(data, ven_id, resource_id, measurement):
+    async def on_update_report(self, data, ven_id, resource_id, measurement):
         """
         Callback that receives report data from the VEN and handles it.
         """
+        report_values.inc(amount=len(data))
         for time, value in data:
             print(f"Ven {ven_id} reported {measurement} = {value} at time {time} for resource {resource_id}")
 
@@ -130,34 +225,401 @@ class VTNService(metaclass=SingletonMeta):
         sampling_interval = min_sampling_interval
         return callback, sampling_interval
 
-    async def event_response_callback(ven_id, event_id, opt_type):
+    async def event_response_callback(self, ven_id, event_id, opt_type):
         """
         Callback that receives the response from a VEN to an Event.
         """
+        self.vtn_service._record_event(event_id, response=opt_type)
         print(f"VEN {ven_id} responded to Event {event_id} with: {opt_type}")
 
+    async def shared_event_response_callback(self, ven_id, event_id, opt_type):
+        """
+        Callback that receives the responses of the VENs to an event sent from a template.
+        """
+        self.vtn_service._record_response(event_id, opt_type)
+
+    async def send_shared_event(self, event, ven_ids: List[str]) -> None:
+        """
+        Queues the shared `event` (see EventTemplate.build_event) for every VEN of `ven_ids`.
+        openleadr validates the event and registers its callback with the first VEN, the
+        other ones only get the event appended to their queue. Runs on the loop of the shard,
+        like the services reading and popping the queues.
+        """
+        if not ven_ids:
+            return
+        self.shared_event_callbacks.share(event.event_descriptor.event_id)
+        self.server.add_raw_event(ven_id=ven_ids[0], event=event, callback=self.shared_event_response_callback)
+        events, events_updated = self.server.events, self.server.events_updated
+        for ven_id in ven_ids[1:]:
+            events.setdefault(ven_id, []).append(event)
+            events_updated[ven_id] = True
+
     async def send_event(self, ven_id: str, signal_level: int = 1):
-        await self.server.add_event(
-            ven_id=ven_id,
-            signal_name='simple',
-            signal_type='level',
-            intervals=[
-                {
-                    'dtstart': datetime(2021, 1, 1, 12, 0, 0, tzinfo=timezone.utc),
-                    'duration': timedelta(minutes=10),
-                    'signal_payload': signal_level,
-                }
-            ],
-            callback=self.event_response_callback
-        )
+        with event_dispatch_duration.time():
+            event_id = self.server.add_event(
+                ven_id=ven_id,
+                signal_name='simple',
+                signal_type='level',
+                intervals=[
+                    {
+                        'dtstart': datetime(2021, 1, 1, 12, 0, 0, tzinfo=timezone.utc),
+                        'duration': timedelta(minutes=10),
+                        'signal_payload': signal_level,
+                    }
+                ],
+                callback=self.event_response_callback
+            )
+        self.vtn_service._record_event(event_id, ven_id=ven_id, shard=self.id, signal_level=signal_level,
+                                       sent_at=datetime.now(timezone.utc).isoformat())
+        return event_id
 
     def _run_server(self) -> None:
         """Internal method to run the server in a separate thread."""
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
+        self._loop = loop
         loop.create_task(self.server.run())  # Run the server on the asyncio event loop
+        HealthMonitor().register_loop(f'vtn:{self.id}', loop)
         loop.run_forever()
 
+    def run(self) -> None:
+        if self.debug:
+            print(f'Starting VTN shard {self.id} with VENs ({len(self.ven_list)}) at {self.url}...')
+
+        self._server_thread = threading.Thread(
+            target=self._run_server,
+            args=(),
+            name=f'vtn:{self.id}',
+            daemon=True
+        )
+        self._server_thread.start()
+        HealthMonitor().register_thread(f'vtn:{self.id}', self._server_thread)
+        self._is_running = True
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stops the OpenADR server and its event loop, a stopped shard cannot be restarted."""
+        HealthMonitor().unregister(f'vtn:{self.id}')
+        loop = self._loop
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(self.server.stop(), loop).result(timeout)
+            loop.call_soon_threadsafe(loop.stop)
+            self._server_thread.join(timeout)
+        self._is_running = False
+
+
+class VTNService(metaclass=SingletonMeta):
+    """
+    VTNService is responsible for managing and operating a Virtual Top Node (VTN) server as part of
+    an OpenADR (Automated Demand Response) system. This includes handling client (VEN) registrations,
+    report registrations, and event notifications. It facilitates interaction between the VTN and the
+    VENs (Virtual End Nodes).
+
+    The VTN runs as one or more shards (OPEN_KICK__VTN__SHARDS), each one an OpenADR server on its
+    own port and event loop. VENs are placed on the shards by consistent hashing of their id:
+    queries about one VEN and events sent to it are routed to the shard owning it, fleet-wide
+    queries merge the shards. Adding or removing a shard only moves the VENs whose owner changed.
+    This implementation aligns with OpenADR specifications and uses the SingletonMeta for ensuring
+    a single instance.
+
+    Attributes:
+        debug: Indicates whether debugging mode is enabled for the VTN service.
+        _is_running: Represents the running state of the VTN servers.
+        capture: Log the OpenADR traffic is captured to (OPEN_KICK__CAPTURE__PATH), None when disabled.
+        event_templates: The event templates, by template id.
+        event_fragments: Rendered XML of the events sent from templates, shared by the shards.
+        _topology: The hash ring and the shards it places the VENs on, replaced as a whole.
+    """
+
+    def __init__(self, debug: bool = settings.core['DEBUG']):
+        self.debug = debug
+        self._is_running = False
+        self._events: 'OrderedDict[str, dict]' = OrderedDict()  # Event ledger, oldest first
+        self._events_version = 0
+        self._events_lock = threading.Lock()
+        self._rebalance_lock = threading.Lock()
+        # Traffic of every shard, captured before admission control so that rejected messages are replayed too
+        self.capture: Optional[TrafficLogWriter] = None
+        if settings.capture['path']:
+            self.capture = TrafficLogWriter(settings.capture['path'], compress=settings.capture['compress'])
+
+        from openleadr import enable_default_logging  # Only loaded once the VTN is created
+
+        if settings.core['DEBUG']:
+            enable_default_logging()
+
+        self.event_templates: Dict[str, EventTemplate] = {}
+        self.event_fragments = EventFragments()
+
+        ring = HashRing(virtual_nodes=settings.vtn['virtual_nodes'])
+        shards: Dict[str, VTNShard] = {}
+        for shard in settings.vtn['shards']:
+            shards[shard['id']] = VTNShard(shard, self, debug)
+            ring.add(shard['id'])
+        self._topology: Tuple[HashRing, Dict[str, VTNShard]] = (ring, shards)
+
+    @property
+    def is_running(self):
+        return self._is_running
+
+    @is_running.setter
+    def is_running(self, value):
+        pass
+
+    @property
+    def ring(self) -> HashRing:
+        return self._topology[0]
+
+    @property
+    def shards(self) -> Dict[str, VTNShard]:
+        return self._topology[1]
+
+    def shard_for(self, ven_id: str) -> VTNShard:
+        """The shard owning the VEN `ven_id` (whether that VEN is registered or not)."""
+        ring, shards = self._topology
+        return shards[ring.node_for(ven_id)]
+
+    def ven_lists(self) -> Dict[str, VenList]:
+        """The VEN registry partition of every shard, by shard id."""
+        return {shard_id: shard.ven_list for shard_id, shard in self.shards.items()}
+
+    def shards_status(self) -> List[dict]:
+        return [
+            {
+                'id': shard.id,
+                'url': shard.url,
+                'is_running': shard.is_running,
+                'vens': len(shard.ven_list),
+                'admission': None if shard.admission is None else {
+                    'in_flight': shard.admission.in_flight,
+                    'queued': shard.admission.queued,
+                },
+            }
+            for shard in self.shards.values()
+        ]
+
+    @property
+    def events_version(self) -> int:
+        """Incremented whenever an event is sent or a VEN responds to one."""
+        return self._events_version
+
+    def events(self) -> List[dict]:
+        """The event ledger: the last events sent (see OPEN_KICK__VTN__EVENT_LEDGER_SIZE) and the VEN responses."""
+        with self._events_lock:
+            return [dict(event) for event in self._events.values()]
+
+    def _record_event(self, event_id: str, **fields) -> None:
+        with self._events_lock:
+            event = self._events.setdefault(event_id, {'event_id': event_id, 'response': None})
+            event.update(fields)
+            while len(self._events) > settings.vtn['event_ledger_size']:
+                self._events.popitem(last=False)
+            self._events_version += 1
+
+    def _record_response(self, event_id: str, opt_type: str) -> None:
+        """Counts a response to an event sent from a template, the responses of an evicted event are dropped."""
+        with self._events_lock:
+            event = self._events.get(event_id)
+            if event is None:
+                return
+            responses = event['responses']
+            event['responses'] = {**responses, opt_type: responses.get(opt_type, 0) + 1}  # Replaced, never mutated
+            self._events_version += 1
+
+    def ven_props_list(self):
+        return [ven_props for shard in self.shards.values() for ven_props in shard.ven_list.ven_props_list]
+
+    def ven_ids(self):
+        return [ven_id for shard in self.shards.values() for ven_id in shard.ven_list.get_ids()]
+
+    def ven_names(self):
+        return [name for shard in self.shards.values() for name in shard.ven_list.get_names()]
+
+    def ven_connected(self):
+        return [ven for ven in self.ven_props_list() if ven['is_connected']]
+
+    def has_ven(self, ven_id: str) -> bool:
+        return self.shard_for(ven_id).ven_list.has_ven_with_id(ven_id)
+
+    def ven_connect(self):
+        try:
+            for shard in self.shards.values():
+                for ven in shard.ven_list.ven_instances():
+                    if not ven.is_connected:
+                        ven.run(shard.url)
+        except Exception as e:
+            print(f"Error connecting VEN: {str(e)}")
+            raise
+
+    async def send_event(self, ven_id: str, signal_level: int = 1):
+        """
+        Sends the event from the shard owning the VEN, returns its event_id. The event is
+        queued on the loop of the shard, like the services reading and popping the queues.
+        """
+        shard = self.shard_for(ven_id)
+        loop = shard.loop
+        if loop is None or loop is asyncio.get_running_loop():  # Not started, or already on the shard loop
+            return await shard.send_event(ven_id, signal_level)
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(shard.send_event(ven_id, signal_level), loop))
+
+    def add_event_template(self,
+                           signals: List[dict],
+                           template_id: Optional[str] = None,
+                           market_context: str = DEFAULT_MARKET_CONTEXT,
+                           response_required: str = 'always',
+                           priority: int = 0) -> dict:
+        """
+        Defines (or redefines) an event template, see EventTemplate. Events already sent from
+        the template are not changed.
+
+        Returns:
+            The template as stored
+
+        Raises:
+            ValueError: If the template is not a valid OpenADR event
+        """
+        from openleadr.utils import generate_id
+
+        template = EventTemplate(template_id or generate_id(), signals, market_context, response_required, priority)
+        self.event_templates[template.template_id] = template
+        return template.describe()
+
+    def send_event_template(self, template_id: str, ven_ids: Optional[Iterable[str]] = None,
+                            timeout: float = 10.0) -> dict:
+        """
+        Sends an event built from a template to `ven_ids`, every registered VEN when None. The
+        event is built once and shared by the queues of its VENs on every shard, it is queued
+        on the event loop of each shard. The VENs that are not registered are skipped.
+
+        Returns:
+            The event_id, the number of VENs it was sent to and the number of unknown VENs skipped
+
+        Raises:
+            KeyError: If there is no template `template_id`
+            TimeoutError: If a shard did not queue the event within `timeout` seconds
+        """
+        template = self.event_templates[template_id]
+        ring, shards = self._topology
+        partitions: Dict[str, List[str]] = {}
+        unknown_vens = 0
+        with shared_event_dispatch_duration.time():
+            event = template.build_event()
+            if ven_ids is None:
+                partitions = {shard_id: shard.ven_list.get_ids() for shard_id, shard in shards.items()}
+            else:
+                for ven_id in dict.fromkeys(ven_ids):
+                    shard = shards[ring.node_for(ven_id)]
+                    if shard.ven_list.has_ven_with_id(ven_id):
+                        partitions.setdefault(shard.id, []).append(ven_id)
+                    else:
+                        unknown_vens += 1
+
+            # In the ledger before any VEN can poll the event, so that no response is dropped
+            event_id = event.event_descriptor.event_id
+            vens = sum(len(partition) for partition in partitions.values())
+            self._record_event(event_id, template_id=template_id, vens=vens,
+                               shards=sorted(shard_id for shard_id, partition in partitions.items() if partition),
+                               sent_at=datetime.now(timezone.utc).isoformat(), responses={})
+
+            futures = []
+            for shard_id, partition in partitions.items():
+                shard = shards[shard_id]
+                sending = shard.send_shared_event(event, partition)
+                if shard.loop is None:
+                    asyncio.run(sending)  # The server is not started, nothing else uses its queues
+                else:
+                    futures.append(asyncio.run_coroutine_threadsafe(sending, shard.loop))
+            for future in futures:
+                future.result(timeout)
+
+        return {'event_id': event_id, 'vens': vens, 'unknown_vens': unknown_vens}
+
+    def _rebalance(self, ring: HashRing, shards: Dict[str, VTNShard]) -> Dict[str, Tuple[str, str]]:
+        """
+        Moves the VENs whose owner changed on `ring` to their new shard, then switches to the
+        new topology. VEN clients that were connected are reconnected to their new shard.
+
+        Returns:
+            The moved VENs, as {ven_id: (previous shard id, new shard id)}
+        """
+        previous_shards = self.shards
+        moves: Dict[str, Tuple[str, str]] = {}
+        for shard_id, shard in previous_shards.items():
+            for ven_id in shard.ven_list.get_ids():
+                owner = ring.node_for(ven_id)
+                if owner != shard_id:
+                    moves[ven_id] = (shard_id, owner)
+
+        sources: Dict[str, set] = {}  # Shard id -> shards it takes VENs from
+        for source, target in moves.values():
+            sources.setdefault(target, set()).add(source)
+        losing = {source for source, _ in moves.values()}
+        reconnect = [ven_id for ven_id, (source, _) in moves.items()
+                     if previous_shards[source].ven_list.is_connected(ven_id)]
+
+        # Only the partitions gaining or losing VENs are rebuilt
+        ven_lists: Dict[str, VenList] = {}
+        for shard_id, shard in shards.items():
+            if shard_id in sources or shard_id in losing:
+                own = shard.ven_list
+                ven_lists[shard_id] = VenList.gather(
+                    [own] + [previous_shards[source].ven_list for source in sources.get(shard_id, ())],
+                    lambda ven_id, shard_id=shard_id, own=own: (
+                        moves[ven_id][1] == shard_id if ven_id in moves else own.has_ven_with_id(ven_id)),
+                    debug=self.debug,
+                )
+        for shard_id, ven_list in ven_lists.items():
+            shards[shard_id].ven_list = ven_list
+        self._topology = (ring, shards)
+
+        for ven_id in reconnect:
+            target = shards[moves[ven_id][1]]
+            ven = target.ven_list.find_by_id(ven_id)
+            ven.stop()
+            ven.run(target.url)
+
+        if self.debug:
+            print(f'Rebalanced the VTN shards, {len(moves)} VENs moved')
+        return moves
+
+    def add_shard(self, shard: dict) -> Dict[str, Tuple[str, str]]:
+        """
+        Adds a shard (see Settings.vtn_shard) and moves over the VENs it now owns.
+
+        Returns:
+            The moved VENs, as {ven_id: (previous shard id, new shard id)}
+        """
+        with self._rebalance_lock:
+            ring, shards = self._topology
+            if shard['id'] in shards:
+                raise ValueError(f"VTN shard {shard['id']} already exists")
+            new_shard = VTNShard(shard, self, self.debug)
+            if self._is_running:
+                new_shard.run()  # Listening before its VENs are moved over
+            ring = ring.copy()
+            ring.add(new_shard.id)
+            return self._rebalance(ring, {**shards, new_shard.id: new_shard})
+
+    def remove_shard(self, shard_id: str) -> Dict[str, Tuple[str, str]]:
+        """
+        Hands the VENs of a shard over to the remaining ones, then stops it.
+
+        Returns:
+            The moved VENs, as {ven_id: (previous shard id, new shard id)}
+        """
+        with self._rebalance_lock:
+            ring, shards = self._topology
+            if shard_id not in shards:
+                raise KeyError(f'VTN shard {shard_id} does not exist')
+            if len(shards) == 1:
+                raise ValueError('The last VTN shard cannot be removed')
+            removed = shards[shard_id]
+            ring = ring.copy()
+            ring.remove(shard_id)
+            moves = self._rebalance(ring, {key: shard for key, shard in shards.items() if key != shard_id})
+            if removed.is_running:
+                removed.stop()
+            return moves
+
     def run(self):
         if self._is_running:
             print(f'VTN server is already running at {settings.vtn_url}...')
@@ -167,18 +629,15 @@ class VTNService(metaclass=SingletonMeta):
         if self.debug:
             print(f'Loading Allowed VENs from DB...')
         results = db.find('ven_props')
-        self.ven_list = VenList([Ven(ven_prop) for ven_prop in results])
-
-        if self.debug:
-            print(f'Starting VTN server with VENs ({self.ven_list.__len__()}) at {settings.vtn_url}...')
+        ring, shards = self._topology
+        partitions = {shard_id: [] for shard_id in shards}
+        for ven_props in results:
+            partitions[ring.node_for(ven_props['id'])].append(ven_props)
 
         try:
-            self._server_thread = threading.Thread(
-                target=self._run_server,
-                args=(),
-                daemon=True
-            )
-            self._server_thread.start()
+            for shard_id, shard in shards.items():
+                shard.ven_list = VenList.from_props(partitions[shard_id], debug=self.debug)
+                shard.run()
             self._is_running = True
         except Exception as e:
             self._is_running = False